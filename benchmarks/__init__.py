@@ -0,0 +1 @@
+"""Benchmarks for the SubfolderSize engine; run them with python -m benchmarks."""
@@ -0,0 +1,349 @@
+"""
+Benchmark harness for the SubfolderSize engine.
+
+    python -m benchmarks [--shapes deep,wide] [--ops scan,delete] [--repeat 3]
+                         [--scale 1.0] [--output results.json] [--compare baseline.json]
+
+Every measurement runs in a fresh child process against a freshly generated
+tree (see treegen), so peak RSS and CPU time belong to that one operation.
+Destructive operations get a new tree for every run. Trees are generated
+right before they are measured, so the numbers are warm-cache numbers.
+
+Each case records wall time, throughput, peak RSS, CPU time and the kernel's
+read/write syscall counters from /proc/self/io where available. One extra
+run per case counts the file system calls made through the os module (with
+DirEntry.stat counted the first time it hits the disk), as those map one to
+one to syscalls. Results are written as JSON together with the commit they
+were measured at; --compare prints the change against an earlier file.
+"""
+
+import argparse
+import builtins
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from subfoldersize import DeleteEngine, MoveEngine, ScanEngine, render_ascii_tree
+
+from .treegen import SHAPES, generate
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Operation -> whether it consumes the tree it runs on
+OPERATIONS = {
+    "scan": False,
+    "tree-export": False,
+    "move": True,
+    "move-copy": True,
+    "delete": True,
+}
+
+# os functions whose calls are counted in the counting run
+COUNTED_CALLS = (
+    "scandir", "listdir", "stat", "lstat", "open", "unlink", "remove", "rmdir", "rename",
+    "replace", "mkdir", "symlink", "readlink", "utime", "chmod", "copy_file_range", "sendfile",
+)
+
+class _CallCounter:
+    """Counts calls by name from any thread."""
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def wrap(self, name, func):
+        def counted(*args, **kwargs):
+            self.add(name)
+            return func(*args, **kwargs)
+        return counted
+
+class _CountingEntry:
+    """DirEntry stand-in that counts the stat calls which reach the disk."""
+    __slots__ = ("_entry", "_counter", "_statted", "name", "path")
+
+    def __init__(self, entry, counter):
+        self._entry = entry
+        self._counter = counter
+        self._statted = set()
+        self.name = entry.name
+        self.path = entry.path
+
+    def stat(self, *, follow_symlinks=True):
+        # DirEntry caches its stat result, so only the first call costs a syscall.
+        if follow_symlinks not in self._statted:
+            self._statted.add(follow_symlinks)
+            self._counter.add("stat")
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+    def is_dir(self, *, follow_symlinks=True):
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, *, follow_symlinks=True):
+        return self._entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self):
+        return self._entry.is_symlink()
+
+    def inode(self):
+        return self._entry.inode()
+
+    def __fspath__(self):
+        return self.path
+
+class _CountingScandir:
+    def __init__(self, iterator, counter):
+        self._iterator = iterator
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        for entry in self._iterator:
+            yield _CountingEntry(entry, self._counter)
+
+    def close(self):
+        self._iterator.close()
+
+def _install_counters(counter):
+    for name in COUNTED_CALLS:
+        func = getattr(os, name, None)
+        if func is not None:
+            setattr(os, name, counter.wrap(name, func))
+    counted_scandir = os.scandir
+    os.scandir = lambda *args, **kwargs: _CountingScandir(counted_scandir(*args, **kwargs), counter)
+    builtins.open = counter.wrap("open", builtins.open)
+
+def _proc_io():
+    """Returns the kernel's I/O counters of this process, or {} where there are none."""
+    try:
+        with open("/proc/self/io") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def _run_operation(operation, src, dest):
+    """Runs one operation on the tree at src and returns the number of errors it reported."""
+    parent, name = os.path.split(src)
+    if operation == "scan":
+        engine = ScanEngine()
+        engine.scan(src)
+        return len(engine.errors)
+    if operation == "tree-export":
+        with open(os.devnull, "w", encoding="utf-8") as out:
+            for line in render_ascii_tree(parent, [name]):
+                out.write(line)
+                out.write("\n")
+        return 0
+    if operation == "move":
+        MoveEngine().move([name], parent, dest)
+        return 0
+    if operation == "move-copy":
+        # The copy path cross-device moves take, forced on a single device.
+        MoveEngine().move_by_copy([name], parent, dest)
+        return 0
+    if operation == "delete":
+        engine = DeleteEngine()
+        engine.delete([src])
+        return len(engine.errors)
+    raise ValueError(f"unknown operation {operation}")
+
+def run_child(operation, src, dest, count_calls):
+    """Measures one operation in this process and returns the measurements."""
+    counter = None
+    if count_calls:
+        counter = _CallCounter()
+        _install_counters(counter)
+    baseline_rss = _peak_rss_kb()
+    io_before = _proc_io()
+    cpu_before = os.times()
+    if counter is not None:
+        counter.counts.clear()
+    started = time.perf_counter()
+    errors = _run_operation(operation, src, dest)
+    wall = time.perf_counter() - started
+    fs_calls = dict(sorted(counter.counts.items())) if counter is not None else None
+    cpu_after = os.times()
+    io_after = _proc_io()
+    return {
+        "wall_s": wall,
+        "cpu_user_s": cpu_after.user - cpu_before.user,
+        "cpu_sys_s": cpu_after.system - cpu_before.system,
+        "peak_rss_kb": _peak_rss_kb(),
+        "baseline_rss_kb": baseline_rss,
+        "io": {key: io_after[key] - io_before.get(key, 0) for key in io_after},
+        "fs_calls": fs_calls,
+        "errors": errors,
+    }
+
+def _spawn(operation, src, dest, count_calls=False):
+    command = [sys.executable, "-m", "benchmarks.run", "--child", operation, src, dest]
+    if count_calls:
+        command.append("--count-calls")
+    proc = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{operation} on {src} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout)
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _fresh_tree(shape, workdir, scale, seed):
+    src = os.path.join(workdir, shape)
+    dest = os.path.join(workdir, "dest")
+    for path in (src, dest):
+        if os.path.lexists(path):
+            shutil.rmtree(path)
+    os.mkdir(dest)
+    return src, dest, generate(shape, src, scale, seed)
+
+def run_case(shape, operation, workdir, repeat, scale, seed, count_calls):
+    """Runs one shape/operation pair repeat times and summarises the runs."""
+    consumes_tree = OPERATIONS[operation]
+    src, dest, stats = _fresh_tree(shape, workdir, scale, seed)
+    runs = []
+    for attempt in range(repeat):
+        if attempt and consumes_tree:
+            src, dest, stats = _fresh_tree(shape, workdir, scale, seed)
+        runs.append(_spawn(operation, src, dest))
+    fs_calls = None
+    if count_calls:
+        if consumes_tree:
+            src, dest, stats = _fresh_tree(shape, workdir, scale, seed)
+        fs_calls = _spawn(operation, src, dest, count_calls=True)["fs_calls"]
+
+    walls = [run["wall_s"] for run in runs]
+    median = statistics.median(walls)
+    typical = min(runs, key=lambda run: abs(run["wall_s"] - median))
+    entries = stats.dirs + stats.files
+    return {
+        "shape": shape,
+        "operation": operation,
+        "tree": stats.as_dict(),
+        "wall_s": walls,
+        "wall_s_min": min(walls),
+        "wall_s_median": median,
+        "entries_per_s": entries / median if median else None,
+        "bytes_per_s": stats.bytes / median if median else None,
+        "peak_rss_kb": max((run["peak_rss_kb"] or 0) for run in runs) or None,
+        "baseline_rss_kb": typical["baseline_rss_kb"],
+        "cpu_user_s": typical["cpu_user_s"],
+        "cpu_sys_s": typical["cpu_sys_s"],
+        "io": typical["io"],
+        "fs_calls": fs_calls,
+        "errors": max(run["errors"] for run in runs),
+    }
+
+def compare(results, baseline):
+    """Returns lines comparing the median wall times with those of a baseline result file."""
+    old = {(case["shape"], case["operation"]): case for case in baseline["results"]}
+    commit = (baseline["meta"].get("commit") or "baseline")[:10]
+    lines = [f"{'shape':<16} {'operation':<12} {commit:>12} {'now':>12} {'change':>8}"]
+    for case in results:
+        before = old.get((case["shape"], case["operation"]))
+        if before is None:
+            continue
+        change = case["wall_s_median"] / before["wall_s_median"] - 1 if before["wall_s_median"] else 0.0
+        lines.append(f"{case['shape']:<16} {case['operation']:<12} {before['wall_s_median']:>11.4f}s "
+                     f"{case['wall_s_median']:>11.4f}s {change:>+8.1%}")
+    return lines
+
+def _names(value, known):
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown: {', '.join(unknown)} (choose from {', '.join(known)})")
+    return names
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the SubfolderSize engine.")
+    parser.add_argument("--shapes", type=lambda v: _names(v, SHAPES), default=list(SHAPES),
+                        help=f"comma separated tree shapes (default: {','.join(SHAPES)})")
+    parser.add_argument("--ops", type=lambda v: _names(v, OPERATIONS), default=list(OPERATIONS),
+                        help=f"comma separated operations (default: {','.join(OPERATIONS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (default: 3)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the size of every tree (default: 1.0)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the tree generator (default: 0)")
+    parser.add_argument("--tmpdir", help="where to generate the trees (default: the system temp folder)")
+    parser.add_argument("--no-call-counts", action="store_true", help="skip the run that counts file system calls")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="print the change against an earlier results file")
+    parser.add_argument("--child", nargs=3, metavar=("OPERATION", "SRC", "DEST"), help=argparse.SUPPRESS)
+    parser.add_argument("--count-calls", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.child:
+        print(json.dumps(run_child(*args.child, args.count_calls)))
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="subfoldersize-bench-", dir=args.tmpdir)
+    results = []
+    try:
+        for shape in args.shapes:
+            for operation in args.ops:
+                case = run_case(shape, operation, workdir, args.repeat, args.scale, args.seed,
+                                not args.no_call_counts)
+                results.append(case)
+                print(f"{shape:<16} {operation:<12} {case['wall_s_median']:.4f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "scale": args.scale,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            for line in compare(results, json.load(f)):
+                print(line, file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
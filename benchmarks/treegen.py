@@ -0,0 +1,91 @@
+"""
+Reproducible synthetic directory trees for the benchmarks.
+
+Every shape is generated from a seeded random.Random, so the same shape,
+scale and seed always produce the same names and file sizes.
+"""
+
+import os
+import random
+
+# Name -> one-line description, in the order they are benchmarked by default
+SHAPES = {
+    "deep": "one long chain of nested folders with a few small files per level",
+    "wide": "thousands of sibling folders directly inside the root",
+    "many-tiny": "tens of thousands of files of a few KB spread over a few hundred folders",
+    "few-huge-sparse": "a handful of very large sparse files",
+}
+
+class TreeStats:
+    """What a generated tree holds, used to turn timings into throughput."""
+    __slots__ = ("dirs", "files", "bytes")
+
+    def __init__(self):
+        self.dirs = 0
+        self.files = 0
+        self.bytes = 0
+
+    def as_dict(self):
+        return {"dirs": self.dirs, "files": self.files, "bytes": self.bytes}
+
+def _write_file(path, size, stats, sparse=False):
+    with open(path, "wb") as f:
+        if sparse:
+            f.truncate(size)
+        elif size:
+            f.write(bytes(size))
+    stats.files += 1
+    stats.bytes += size
+
+def _mkdir(path, stats):
+    os.mkdir(path)
+    stats.dirs += 1
+
+def _scaled(count, scale):
+    return max(1, int(count * scale))
+
+def _deep(root, rng, scale, stats):
+    # Two-character names keep a 500 level chain well clear of PATH_MAX.
+    path = root
+    for _ in range(_scaled(500, scale)):
+        path = os.path.join(path, "d")
+        _mkdir(path, stats)
+        for i in range(3):
+            _write_file(os.path.join(path, f"f{i}"), rng.randrange(4096), stats)
+
+def _wide(root, rng, scale, stats):
+    for i in range(_scaled(2000, scale)):
+        folder = os.path.join(root, f"dir{i:05d}")
+        _mkdir(folder, stats)
+        for j in range(5):
+            _write_file(os.path.join(folder, f"file{j}.dat"), rng.randrange(2048), stats)
+
+def _many_tiny(root, rng, scale, stats):
+    for i in range(_scaled(200, scale)):
+        folder = os.path.join(root, f"group{i:04d}")
+        _mkdir(folder, stats)
+        for j in range(250):
+            _write_file(os.path.join(folder, f"t{j:04d}.txt"), rng.randrange(4096), stats)
+
+def _few_huge_sparse(root, rng, scale, stats):
+    for i in range(4):
+        size = _scaled(256 * 1024 * 1024, scale) + rng.randrange(4096)
+        _write_file(os.path.join(root, f"huge{i}.bin"), size, stats, sparse=True)
+
+_GENERATORS = {
+    "deep": _deep,
+    "wide": _wide,
+    "many-tiny": _many_tiny,
+    "few-huge-sparse": _few_huge_sparse,
+}
+
+def generate(shape, root, scale=1.0, seed=0):
+    """
+    Creates the tree of the given shape at root, which must not exist yet.
+    scale multiplies the number of folders and files (and the size of the
+    sparse files). Returns the TreeStats of the tree, root included.
+    """
+    stats = TreeStats()
+    _mkdir(root, stats)
+    _GENERATORS[shape](root, random.Random(f"{shape}:{seed}"), scale, stats)
+    return stats
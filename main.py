@@ -1,6 +1,15 @@
 #!/usr/bin/env python3
+import time
+
+# Start of the app, from which the time to the first painted listing is measured
+STARTED = time.perf_counter()
+
+import heapq
+import json
+import operator
 import os
 import sys
+import threading
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -9,17 +18,45 @@ from PyQt6.QtWidgets import (
     QVBoxLayout,
     QPushButton,
     QLineEdit,
-    QTreeWidget,
-    QTreeWidgetItem,
+    QTreeView,
     QFileDialog,
     QMessageBox,
     QStyle,
     QAbstractItemView,
     QLabel,
     QHeaderView,
+    QProgressBar,
+    QSpinBox,
+    QCheckBox,
+    QSplitter,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QDialog,
+    QInputDialog,
 )
-from PyQt6.QtCore import Qt, QSize, QTimer, QThread, pyqtSignal
-from PyQt6.QtGui import QPalette, QColor, QPainter, QIcon
+from PyQt6.QtCore import Qt, QEvent, QSize, QTimer, QThread, pyqtSignal, QAbstractItemModel, QModelIndex
+from PyQt6.QtGui import QPalette, QColor, QPainter, QIcon, QFont
+
+from subfoldersize import (
+    DeleteEngine,
+    DuplicateFinder,
+    FolderWatcher,
+    MoveEngine,
+    NodeStore,
+    OperationCancelled,
+    ScanCancelled,
+    ScanEngine,
+    ScanReport,
+    ScanRules,
+    SessionStore,
+    SizeEstimator,
+    SizeIndex,
+    SizeTree,
+    TreeSync,
+    format_size,
+    render_ascii_tree,
+)
+from subfoldersize.util import entry_is_dir, entry_size, natural_keys
 
 def set_dark_theme(app: QApplication):
     """Sets a dark theme for the application by configuring the QPalette."""
@@ -91,7 +128,7 @@ QHeaderView::section {
     border: 1px solid #3d3d3d;
 }
 
-QTreeWidget {
+QTreeView {
     border: 1px solid #3d3d3d;
     background-color: #1e1e1e;
 }
@@ -204,97 +241,866 @@ class QProgressIndicator(QLabel):
         painter.drawText(-text_rect.center().x(), -text_rect.center().y(), text)
         painter.restore()
 
-class MyTreeWidgetItem(QTreeWidgetItem):
-    def __lt__(self, other):
-        # Get current sort column from the header
-        column = self.treeWidget().header().sortIndicatorSection()
-        if column == 1:  # "Size" column: compare numeric file sizes stored in UserRole
-            self_value = self.data(1, Qt.ItemDataRole.UserRole)
-            other_value = other.data(1, Qt.ItemDataRole.UserRole)
-            try:
-                return float(self_value) < float(other_value)
-            except (ValueError, TypeError):
-                pass
-        return super().__lt__(other)
+class _Branch:
+    """Rows of a folder expanded below the listed one, laid out like FolderListModel's."""
+    __slots__ = ("name", "parent", "names", "sizes", "is_dirs", "name_keys", "size_keys", "in_progress",
+                 "branches", "_rows")
+
+    def __init__(self, name, parent, rows):
+        self.name = name  # Name of the folder in its parent's rows
+        self.parent = parent  # The FolderListModel or _Branch holding that row
+        self.names = [row[0] for row in rows]
+        self.sizes = [row[1] for row in rows]
+        self.is_dirs = [row[2] for row in rows]
+        self.name_keys = natural_keys(self.names)
+        self.size_keys = list(zip(map(operator.neg, self.sizes), self.name_keys))
+        self.in_progress = set()
+        self.branches = {}  # name -> _Branch of the expanded subfolders
+        self._rows = None
+
+    def row_of(self, name):
+        if self._rows is None:
+            self._rows = {name: row for row, name in enumerate(self.names)}
+        return self._rows.get(name)
+
+    def sort(self, column, descending):
+        """Sorts the rows and returns the new order of the old rows, or None if it did not change."""
+        if column == 0:
+            keys = self.name_keys
+        elif descending:
+            keys, descending = self.size_keys, False
+        else:
+            keys = list(zip(self.sizes, self.name_keys))
+        order = sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+        if order == list(range(len(order))):
+            return None
+        take = operator.itemgetter(*order)
+        for column_name in ("names", "sizes", "is_dirs", "name_keys", "size_keys"):
+            setattr(self, column_name, list(take(getattr(self, column_name))))
+        self._rows = None
+        return order
+
+class FolderListModel(QAbstractItemModel):
+    """
+    Tree model listing the entries of one folder, kept as parallel columns and
+    re-sorted once per batch of update_rows(). Folders expand in place through
+    fetch_branch(index) and set_branch().
+    """
+    HEADERS = ("Name", "Size")
+
+    def __init__(self, folder_icon, parent=None):
+        super().__init__(parent)
+        self.folder_icon = folder_icon
+        self.names = []
+        self.sizes = []
+        self.is_dirs = []
+        self.name_keys = []  # natural_keys() of the names
+        self.size_keys = []  # (-size, name key)
+        self.in_progress = set()  # Names whose size is a running total
+        self.estimates = {}  # name -> relative standard error (None if unknown) of an estimated size
+        self._name_set = set()
+        self._rows = None  # name -> row, built on demand after the order changes
+        self._italic = QFont()
+        self._italic.setItalic(True)
+        self.sort_column = 0
+        self.sort_order = Qt.SortOrder.AscendingOrder
+        self.branches = {}  # name -> _Branch of the expanded folders
+        self.pending = set()  # Relative paths of the branches being fetched
+        self.fetch_branch = None  # Called with the index of a folder to expand
+
+    def _rows_of(self, index):
+        """Returns the rows holding index: the model itself or a _Branch."""
+        return index.internalPointer() or self
+
+    def _branch_at(self, index):
+        """Returns the _Branch of the folder at index, or None if it was not fetched."""
+        if not index.isValid():
+            return None
+        rows = self._rows_of(index)
+        return rows.branches.get(rows.names[index.row()])
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, None)
+        return self.createIndex(row, column, self._branch_at(parent))
+
+    def parent(self, index=None):
+        # Called without an index, parent() is QObject.parent().
+        if index is None:
+            return super().parent()
+        if not index.isValid():
+            return QModelIndex()
+        branch = index.internalPointer()
+        if branch is None:
+            return QModelIndex()
+        holder = branch.parent
+        return self.createIndex(holder.row_of(branch.name), 0, None if holder is self else holder)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return len(self.names)
+        branch = self._branch_at(parent)
+        return len(branch.names) if branch is not None else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def _expandable(self, index):
+        rows = self._rows_of(index)
+        row = index.row()
+        return rows.is_dirs[row] and rows.names[row] not in rows.in_progress
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return True
+        if parent.column() > 0 or not self._expandable(parent):
+            return False
+        branch = self._branch_at(parent)
+        return branch is None or bool(branch.names)
+
+    def canFetchMore(self, parent):
+        return (parent.isValid() and self.fetch_branch is not None and self._expandable(parent)
+                and self._branch_at(parent) is None and self.relative_path(parent) not in self.pending)
+
+    def fetchMore(self, parent):
+        self.pending.add(self.relative_path(parent))
+        self.fetch_branch(self.index(parent.row(), 0, parent.parent()))
+
+    def relative_path(self, index):
+        """Returns the path of the entry at index, relative to the listed folder."""
+        names = []
+        while index.isValid():
+            names.append(self._rows_of(index).names[index.row()])
+            index = index.parent()
+        return os.path.join(*reversed(names))
+
+    def index_of(self, relative):
+        """Returns the index of the entry at a path relative to the listed folder, or an invalid one."""
+        rows, index = self, QModelIndex()
+        for name in relative.split(os.sep):
+            row = rows.row_of(name) if rows is not None else None
+            if row is None:
+                return QModelIndex()
+            index = self.createIndex(row, 0, None if rows is self else rows)
+            rows = rows.branches.get(name)
+        return index
+
+    def set_branch(self, index, rows):
+        """
+        Fills the expanded folder at index with (name, size, is_dir) rows,
+        sorted like the rest of the listing.
+        """
+        self.pending.discard(self.relative_path(index))
+        holder = self._rows_of(index)
+        name = holder.names[index.row()]
+        self.drop_branch(index)
+        branch = _Branch(name, holder, rows)
+        branch.sort(self.sort_column, self.sort_order == Qt.SortOrder.DescendingOrder)
+        if branch.names:
+            self.beginInsertRows(index, 0, len(branch.names) - 1)
+            holder.branches[name] = branch
+            self.endInsertRows()
+        else:
+            holder.branches[name] = branch
+            # The expansion indicator goes away.
+            self.dataChanged.emit(index, index)
+
+    def drop_branch(self, index):
+        """Forgets the rows fetched for the folder at index, so they are fetched again when needed."""
+        holder = self._rows_of(index)
+        name = holder.names[index.row()]
+        branch = holder.branches.get(name)
+        if branch is None:
+            return
+        if branch.names:
+            self.beginRemoveRows(index, 0, len(branch.names) - 1)
+            del holder.branches[name]
+            self.endRemoveRows()
+        else:
+            del holder.branches[name]
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        rows = self._rows_of(index)
+        row, column = index.row(), index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return rows.names[row]
+            text = format_size(float(rows.sizes[row]))
+            if rows is self and self.names[row] in self.estimates:
+                error = self.estimates[self.names[row]]
+                if error == 0:
+                    # Exact already, e.g. a folder without subfolders
+                    return text
+                return f"≈ {text} ±" + ("?" if error is None else f"{error:.0%}")
+            return text + " …" if rows.names[row] in rows.in_progress else text
+        if role == Qt.ItemDataRole.FontRole and rows.names[row] in rows.in_progress:
+            return self._italic
+        if role == Qt.ItemDataRole.DecorationRole and column == 0 and rows.is_dirs[row]:
+            return self.folder_icon
+        if role == Qt.ItemDataRole.UserRole and column == 1:
+            return rows.sizes[row]
+        return None
+
+    def clear(self):
+        self.beginResetModel()
+        self.names, self.sizes, self.is_dirs = [], [], []
+        self.name_keys, self.size_keys = [], []
+        self.in_progress = set()
+        self.estimates = {}
+        self._name_set = set()
+        self._rows = None
+        self.branches = {}
+        self.pending = set()
+        self.endResetModel()
+
+    def name_at(self, row):
+        return self.names[row]
+
+    def is_dir_at(self, row):
+        return self.is_dirs[row]
+
+    def row_of(self, name):
+        """Returns the row showing name, or None."""
+        if self._rows is None:
+            self._rows = {name: row for row, name in enumerate(self.names)}
+        return self._rows.get(name)
+
+    def update_rows(self, rows):
+        """
+        Applies a batch of (name, size, is_dir, in_progress) rows. Known names are
+        updated in place, new ones appended, and the store is sorted once.
+        """
+        if not rows:
+            return
+        # The last row for a name wins, e.g. a final total after a running one.
+        latest = dict(zip(map(operator.itemgetter(0), rows), rows))
+        for name in latest.keys() & self.estimates.keys():
+            del self.estimates[name]
+        self.in_progress.difference_update(latest)
+        self.in_progress.update(name for name, row in latest.items() if row[3])
+        known = self._name_set
+        new_rows = [row for name, row in latest.items() if name not in known]
+        if len(new_rows) < len(latest):
+            for name, size, is_dir, _ in latest.values():
+                row = self.row_of(name)
+                if (row is not None and name in self.branches and size != self.sizes[row]
+                        and name not in self.in_progress):
+                    # The folder changed below, so its expanded rows are stale.
+                    index = self.index(row, 0)
+                    self.drop_branch(index)
+                    if self.fetch_branch is not None:
+                        self.fetchMore(index)
+                if row is not None:
+                    self.sizes[row] = size
+                    self.is_dirs[row] = is_dir
+                    self.size_keys[row] = (-size, self.name_keys[row])
+        if new_rows:
+            first = len(self.names)
+            names, sizes, is_dirs, _ = zip(*new_rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+            self.names.extend(names)
+            self.sizes.extend(sizes)
+            self.is_dirs.extend(is_dirs)
+            keys = natural_keys(names)
+            self.name_keys.extend(keys)
+            self.size_keys.extend(zip(map(operator.neg, sizes), keys))
+            self._name_set.update(names)
+            self._rows = None
+            self.endInsertRows()
+        if len(new_rows) < len(latest):
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.names) - 1, 1))
+        self._resort()
+
+    def update_estimates(self, rows):
+        """
+        Shows (name, size, error) estimates of folder sizes, except for names
+        that already have their exact size.
+        """
+        rows = [row for row in rows if row[0] not in self._name_set or row[0] in self.estimates]
+        if not rows:
+            return
+        self.update_rows([(name, size, True, True) for name, size, _ in rows])
+        self.estimates.update((name, error) for name, _, error in rows)
+        self.dataChanged.emit(self.index(0, 1), self.index(len(self.names) - 1, 1))
+
+    def remove_names(self, names):
+        """Removes the rows with the given names."""
+        rows = sorted((row for row in map(self.row_of, names) if row is not None), reverse=True)
+        for row in rows:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.in_progress.discard(self.names[row])
+            self.estimates.pop(self.names[row], None)
+            self._name_set.discard(self.names[row])
+            self.branches.pop(self.names[row], None)
+            del self.names[row], self.sizes[row], self.is_dirs[row], self.name_keys[row], self.size_keys[row]
+            self.endRemoveRows()
+        if rows:
+            self._rows = None
+
+    def apply_changes(self, changed):
+        """Applies {name: (size, is_dir) or None if removed} patches from a folder watcher."""
+        self.remove_names([name for name, value in changed.items() if value is None])
+        self.update_rows([(name, value[0], value[1], False) for name, value in changed.items() if value is not None])
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        if self.branches:
+            self._resort_branches()
+        self._resort()
+
+    def _resort_branches(self):
+        """Reorders the rows of every expanded folder by the current sort key."""
+        descending = self.sort_order == Qt.SortOrder.DescendingOrder
+        new_rows = {}  # id of a _Branch -> new row of every old row
+        pending = list(self.branches.values())
+        self.layoutAboutToBeChanged.emit()
+        while pending:
+            branch = pending.pop()
+            pending.extend(branch.branches.values())
+            order = branch.sort(self.sort_column, descending)
+            if order is not None:
+                rows = new_rows[id(branch)] = [0] * len(order)
+                for new_row, old_row in enumerate(order):
+                    rows[old_row] = new_row
+        old_indexes = [i for i in self.persistentIndexList() if id(i.internalPointer()) in new_rows]
+        if old_indexes:
+            self.changePersistentIndexList(old_indexes, [
+                self.createIndex(new_rows[id(i.internalPointer())][i.row()], i.column(), i.internalPointer())
+                for i in old_indexes
+            ])
+        self.layoutChanged.emit()
+
+    def _resort(self):
+        """Reorders every column by the current sort key, keeping selections intact."""
+        if len(self.names) < 2:
+            return
+        descending = self.sort_order == Qt.SortOrder.DescendingOrder
+        if self.sort_column == 0:
+            keys = self.name_keys
+        elif descending:
+            keys = self.size_keys
+            descending = False
+        else:
+            # Smallest first is rare enough to build its keys on demand.
+            keys = list(zip(self.sizes, self.name_keys))
+        order = sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+        if order == list(range(len(order))):
+            # Already in order, as after most batches; nothing to move.
+            return
+        self.layoutAboutToBeChanged.emit()
+        # itemgetter gathers a whole column in one C-level call.
+        take = operator.itemgetter(*order)
+        self.names = list(take(self.names))
+        self.sizes = list(take(self.sizes))
+        self.is_dirs = list(take(self.is_dirs))
+        self.name_keys = list(take(self.name_keys))
+        self.size_keys = list(take(self.size_keys))
+        self._rows = None
+        old_indexes = self.persistentIndexList()
+        if old_indexes:
+            new_rows = [0] * len(order)
+            for new_row, old_row in enumerate(order):
+                new_rows[old_row] = new_row
+            # Rows of expanded folders keep their places within their folder.
+            old_indexes = [i for i in old_indexes if i.internalPointer() is None]
+            self.changePersistentIndexList(
+                old_indexes, [self.index(new_rows[i.row()], i.column()) for i in old_indexes])
+        self.layoutChanged.emit()
 
 class DirectoryScanner(QThread):
-    """Worker thread for scanning directory contents"""
+    """
+    Worker thread for scanning directory contents. Results are buffered and
+    collected with take_results(); with estimate set, SizeEstimator estimates
+    are collected with take_estimates().
+    """
     finished = pyqtSignal()  # Signal when scanning is complete
-    item_found = pyqtSignal(str, str, bool)  # Signal for each found item (name, size, isDir)
     error = pyqtSignal(str)  # Signal for errors
+    # Seconds after which a file system that stopped answering, such as a
+    # dropped network mount, is given up instead of stalling the scan
+    MOUNT_TIMEOUT = 30
+    ESTIMATE_BUDGET = 2.0
 
-    def __init__(self, folder_path):
+    def __init__(self, folder_path, refresh=False, size_tree=None, allocated=False, rules=None,
+                 estimate=False, trust_index=False):
         super().__init__()
         self.folder_path = folder_path
-
-    def calculate_size(self, path):
-        """Recursive size calculation"""
-        total_size = 0
-        if os.path.isfile(path):
-            try:
-                total_size += os.path.getsize(path)
-            except Exception:
-                pass
-        elif os.path.isdir(path):
-            try:
-                for entry in os.scandir(path):
-                    total_size += self.calculate_size(entry.path)
-            except Exception:
-                pass
-        return total_size
+        self.engine = ScanEngine(index=SizeIndex.open_default(), refresh=refresh, tree=size_tree,
+                                 report_top=ScanReport.TOP, mount_timeout=self.MOUNT_TIMEOUT,
+                                 allocated=allocated, rules=rules, count_excluded=True,
+                                 trust_index=trust_index)
+        self.estimator = SizeEstimator(self.ESTIMATE_BUDGET, rules=rules) if estimate else None
+        self.estimated = {}  # name -> estimated size, once the estimate is done
+        self._estimates_taken = False
+        self.completed = False
+        self._results = []
+        self._results_lock = threading.Lock()
+
+    def _on_entry(self, name, size, is_dir):
+        with self._results_lock:
+            self._results.append((name, size, is_dir, False))
+
+    def take_results(self):
+        """Returns the (name, size, is_dir, in_progress) rows produced since the last call."""
+        # A running total only replaces an estimate once it is the larger.
+        estimated = self.estimated
+        if self.estimator is not None and not estimated:
+            estimated = {name: size for name, size, _, _ in self.estimator.estimates() if size is not None}
+        partial = [(name, size, True, True) for name, size in self.engine.progress()
+                   if size >= estimated.get(name, 0)]
+        with self._results_lock:
+            results, self._results = self._results, []
+        return partial + results
+
+    def take_estimates(self):
+        """
+        Returns (name, size, error) estimates of the subfolders reached so far,
+        until the estimate is done.
+        """
+        if self.estimator is None or self._estimates_taken:
+            return []
+        # Read before the rows, so the last ones are only taken once they are final.
+        self._estimates_taken = bool(self.estimated)
+        return [(name, size, error) for name, size, _, error in self.estimator.estimates() if size is not None]
+
+    def cancel(self):
+        """Stops the scan; finished is still emitted once the workers have wound down."""
+        if self.estimator is not None:
+            self.estimator.cancel()
+        self.engine.cancel()
+
+    def _estimate(self):
+        try:
+            rows = self.estimator.estimate(self.folder_path)
+        except OSError:
+            # The scan reports a folder that cannot be listed.
+            rows = self.estimator.estimates()
+        self.estimated = {name: size for name, size, is_dir, _ in rows if is_dir and size is not None}
 
     def run(self):
+        estimating = None
+        if self.estimator is not None:
+            estimating = threading.Thread(target=self._estimate, daemon=True)
+            estimating.start()
         try:
-            entries = os.listdir(self.folder_path)
-            for entry in entries:
-                full_path = os.path.join(self.folder_path, entry)
-                size = self.calculate_size(full_path)
-                is_dir = os.path.isdir(full_path)
-                self.item_found.emit(entry, str(size), is_dir)
+            self.engine.scan(self.folder_path, on_entry=self._on_entry)
+            self.completed = True
+        except ScanCancelled:
+            pass
         except Exception as e:
             self.error.emit(str(e))
         finally:
+            if estimating is not None:
+                # Exact sizes make whatever is left of the budget pointless.
+                self.estimator.cancel()
+                estimating.join()
             self.finished.emit()
 
 class MoveWorker(QThread):
-    """Worker thread for performing safe move (copy then delete) operations."""
+    """Worker thread for moving items between panes with a MoveEngine."""
     finished = pyqtSignal()
     error = pyqtSignal(str)
+    progress = pyqtSignal("qint64", "qint64")  # Bytes copied, bytes to copy
 
     def __init__(self, items, src_folder, dest_folder, parent=None):
         super().__init__(parent)
         self.items = items
         self.src_folder = src_folder
         self.dest_folder = dest_folder
+        self.engine = MoveEngine()
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def run(self):
+        try:
+            self.engine.move(self.items, self.src_folder, self.dest_folder, self.progress.emit)
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            self.finished.emit()
+
+class DeleteWorker(QThread):
+    """Worker thread for deleting items with a DeleteEngine."""
+    finished = pyqtSignal()
+    error = pyqtSignal(str)
+    progress = pyqtSignal("qint64", "qint64")  # Bytes freed, bytes expected
+
+    def __init__(self, paths, expected_bytes, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.expected_bytes = expected_bytes
+        self.engine = DeleteEngine()
+        self.results = {}  # path -> (bytes freed, removed)
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def run(self):
+        try:
+            self.results = self.engine.delete(self.paths, self.progress.emit, self.expected_bytes)
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            self.finished.emit()
+
+class TreeExportWorker(QThread):
+    """Worker thread that streams an ASCII tree to a file, or collects it for the clipboard."""
+    finished = pyqtSignal()
+    error = pyqtSignal(str)
+    progress = pyqtSignal(int)  # Lines written so far
+
+    def __init__(self, folder, names, destination=None, max_depth=None, max_entries=None,
+                 size_of=None, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+        self.names = names
+        self.destination = destination
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.size_of = size_of
+        self.text = None  # The tree when no destination file is given
+        self.completed = False
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        lines = render_ascii_tree(self.folder, self.names, self.max_depth, self.max_entries,
+                                  self.size_of, self._cancelled)
+        try:
+            if self.destination is None:
+                collected = []
+                for count, line in enumerate(lines, 1):
+                    collected.append(line)
+                    if count % 1000 == 0:
+                        self.progress.emit(count)
+                self.text = "\n".join(collected)
+            else:
+                with open(self.destination, "w", encoding="utf-8") as f:
+                    for count, line in enumerate(lines, 1):
+                        f.write(line)
+                        f.write("\n")
+                        if count % 1000 == 0:
+                            self.progress.emit(count)
+            self.completed = True
+        except OperationCancelled:
+            pass
+        except OSError as e:
+            self.error.emit(str(e))
+        finally:
+            self.finished.emit()
+
+class DuplicateWorker(QThread):
+    """Worker thread that looks for duplicate files with a DuplicateFinder."""
+    finished = pyqtSignal()
+    error = pyqtSignal(str)
+    progress = pyqtSignal(str, "qint64", "qint64")  # Stage, done, total
+
+    def __init__(self, roots, parent=None):
+        super().__init__(parent)
+        self.roots = roots
+        self.engine = DuplicateFinder()
+        self.groups = None  # (size, paths) once the search has completed
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def run(self):
+        try:
+            self.groups = self.engine.find(self.roots, self.progress.emit)
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            self.finished.emit()
+
+class CompareWorker(QThread):
+    """Worker thread that compares the folders of the two panes with a TreeSync."""
+    finished = pyqtSignal()
+    error = pyqtSignal(str)
+    progress = pyqtSignal("qint64", "qint64")  # Folders compared, bytes hashed
+
+    def __init__(self, left, right, contents=False, rules=None, parent=None):
+        super().__init__(parent)
+        self.left = left
+        self.right = right
+        self.engine = TreeSync(contents=contents, rules=rules)
+        self.differences = None  # (path, state, is_dir, left size, right size) once completed
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def run(self):
+        try:
+            self.differences = self.engine.compare(self.left, self.right, self.progress.emit)
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            self.finished.emit()
+
+class SyncWorker(QThread):
+    """Worker thread that copies the differences found by a TreeSync in one direction."""
+    finished = pyqtSignal()
+    error = pyqtSignal(str)
+    progress = pyqtSignal("qint64", "qint64")  # Bytes copied, bytes to copy
+
+    def __init__(self, engine, differences, to, mirror, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.differences = differences
+        self.to = to
+        self.mirror = mirror
+
+    def cancel(self):
+        self.engine.cancel()
 
     def run(self):
-        import shutil
         try:
-            for item in self.items:
-                src = os.path.join(self.src_folder, item)
-                dest = os.path.join(self.dest_folder, item)
-                if os.path.isfile(src):
-                    shutil.copy2(src, dest)
-                    os.remove(src)
-                elif os.path.isdir(src):
-                    shutil.copytree(src, dest, dirs_exist_ok=True)
-                    shutil.rmtree(src)
+            self.engine.sync(self.differences, self.to, self.mirror, self.progress.emit)
+        except OperationCancelled:
+            pass
         except Exception as e:
             self.error.emit(str(e))
         finally:
             self.finished.emit()
 
+class DuplicatesDialog(QDialog):
+    """
+    Lists groups of identical files, those wasting the most space first.
+    Double-clicking a file opens its folder in the pane.
+    """
+    def __init__(self, pane, groups, finder):
+        super().__init__(pane)
+        self.pane = pane
+        self.setWindowTitle("Duplicate Files")
+        self.resize(700, 450)
+        layout = QVBoxLayout(self)
+        reclaimable = sum(size * (len(paths) - 1) for size, paths in groups)
+        summary = QLabel(
+            f"{len(groups):,} groups of identical files, {format_size(float(reclaimable))} reclaimable. "
+            f"{finder.files:,} files compared by reading {format_size(float(finder.bytes_read))}"
+            + (f", {finder.hardlinks:,} hardlinks skipped" if finder.hardlinks else "") + "."
+        )
+        summary.setWordWrap(True)
+        layout.addWidget(summary)
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(["File", "Size"])
+        self.tree.header().setStretchLastSection(False)
+        self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for size, paths in groups:
+            group = QTreeWidgetItem(self.tree, [
+                f"{len(paths)} copies, {format_size(float(size * (len(paths) - 1)))} reclaimable",
+                format_size(float(size)),
+            ])
+            for path in paths:
+                item = QTreeWidgetItem(group, [path])
+                item.setData(0, Qt.ItemDataRole.UserRole, path)
+            group.setExpanded(True)
+        self.tree.itemDoubleClicked.connect(self.open_folder_of)
+        layout.addWidget(self.tree)
+
+    def open_folder_of(self, item, column):
+        path = item.data(0, Qt.ItemDataRole.UserRole)
+        if not path:
+            return
+        folder = os.path.dirname(path)
+        if os.path.isdir(folder):
+            self.pane.close_node_store()
+            self.pane.folderLineEdit.setText(folder)
+            self.pane.load_directory(folder)
+
+class DiffDialog(QDialog):
+    """Lists the folders that grew or shrank the most between a snapshot and the current scan."""
+    TOP = 500
+
+    def __init__(self, pane, older, newer, folder):
+        super().__init__(pane)
+        self.pane = pane
+        self.setWindowTitle("Changes Since Snapshot")
+        self.resize(750, 450)
+        layout = QVBoxLayout(self)
+        changed = [(path, old_size, size) for path, old_size, size, _, _ in newer.diff(older, folder)
+                   if size != old_size]
+        rows = heapq.nlargest(self.TOP, changed, key=lambda row: (row[2] - row[1], row[0]))
+        summary = QLabel(f"{len(changed):,} folders changed below {folder} since the snapshot of "
+                         f"{older.root}" + (f"; the {self.TOP:,} that grew the most are listed."
+                                            if len(changed) > self.TOP else "."))
+        summary.setWordWrap(True)
+        layout.addWidget(summary)
+        self.tree = QTreeWidget()
+        self.tree.setRootIsDecorated(False)
+        self.tree.setHeaderLabels(["Folder", "Change", "Before", "After"])
+        self.tree.header().setStretchLastSection(False)
+        self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for path, old_size, size in rows:
+            change = size - old_size
+            item = QTreeWidgetItem(self.tree, [
+                path,
+                ("+" if change >= 0 else "-") + format_size(float(abs(change))),
+                format_size(float(old_size)),
+                format_size(float(size)),
+            ])
+            for column in (1, 2, 3):
+                item.setTextAlignment(column, Qt.AlignmentFlag.AlignRight)
+            item.setData(0, Qt.ItemDataRole.UserRole, path)
+        self.tree.itemDoubleClicked.connect(self.open_folder)
+        layout.addWidget(self.tree)
+
+    def open_folder(self, item, column):
+        path = item.data(0, Qt.ItemDataRole.UserRole)
+        if path and (os.path.isdir(path) or self.pane.in_store(path)):
+            if not self.pane.in_store(path):
+                self.pane.close_node_store()
+            self.pane.folderLineEdit.setText(path)
+            self.pane.load_directory(path)
+
+class CompareDialog(QDialog):
+    """Lists what differs between the folders of the two panes and copies it over to either side."""
+    TOP = 10_000
+
+    def __init__(self, pane, engine, differences):
+        super().__init__(pane)
+        self.pane = pane
+        self.engine = engine
+        self.differences = differences
+        self.setWindowTitle("Compare Folders")
+        self.resize(800, 500)
+        layout = QVBoxLayout(self)
+        hashed = f", reading {format_size(float(engine.bytes_hashed))} to compare contents" if engine.contents else ""
+        summary = QLabel(
+            f"{len(differences):,} differences between {engine.left} and {engine.right}"
+            + (f", the first {self.TOP:,} listed" if len(differences) > self.TOP else "")
+            + f". {engine.identical_files:,} identical files ({format_size(float(engine.identical_bytes))}) "
+            f"in {engine.dirs_compared:,} folders{hashed}"
+            + (f"; {len(engine.errors):,} could not be read." if engine.errors else ".")
+        )
+        summary.setWordWrap(True)
+        if engine.errors:
+            summary.setToolTip("\n".join(f"{path}: {message}" for path, message in engine.errors[:50]))
+        layout.addWidget(summary)
+        self.tree = QTreeWidget()
+        self.tree.setRootIsDecorated(False)
+        self.tree.setHeaderLabels(["Path", "Difference", "Left", "Right"])
+        self.tree.header().setStretchLastSection(False)
+        self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for path, state, is_dir, left_size, right_size in differences[:self.TOP]:
+            item = QTreeWidgetItem(self.tree, [
+                path + (os.sep if is_dir else ""),
+                state,
+                "" if left_size is None else format_size(float(left_size)),
+                "" if right_size is None else format_size(float(right_size)),
+            ])
+            for column in (2, 3):
+                item.setTextAlignment(column, Qt.AlignmentFlag.AlignRight)
+            item.setData(0, Qt.ItemDataRole.UserRole, path)
+        self.tree.itemDoubleClicked.connect(self.open_folder)
+        layout.addWidget(self.tree)
+
+        buttons = QHBoxLayout()
+        self.mirrorCheck = QCheckBox("Mirror")
+        self.mirrorCheck.setToolTip("Make the other side an exact copy: also overwrite newer files there "
+                                    "and delete what only it has")
+        self.toLeftButton = QPushButton("< Copy to left")
+        self.toLeftButton.clicked.connect(lambda: self.sync("left"))
+        self.toRightButton = QPushButton("Copy to right >")
+        self.toRightButton.clicked.connect(lambda: self.sync("right"))
+        for button in (self.toLeftButton, self.toRightButton):
+            button.setEnabled(bool(differences))
+        buttons.addWidget(self.toLeftButton)
+        buttons.addStretch()
+        buttons.addWidget(self.mirrorCheck)
+        buttons.addStretch()
+        buttons.addWidget(self.toRightButton)
+        layout.addLayout(buttons)
+
+    def sync(self, to):
+        """Asks for confirmation of what copying to one side involves, then has the pane do it."""
+        mirror = self.mirrorCheck.isChecked()
+        copies, deletions = self.engine.plan(self.differences, to, mirror)
+        if not copies and not deletions:
+            QMessageBox.information(self, "Compare Folders", f"The {to} side has nothing older or missing.")
+            return
+        # Sizes of the side that is copied from
+        column = 3 if to == "right" else 4
+        sizes = {row[0]: row[column] or 0 for row in self.differences}
+        copied = sum(sizes[path] for path in copies)
+        target = self.engine.right if to == "right" else self.engine.left
+        reply = QMessageBox.question(
+            self,
+            "Confirm Copy",
+            f"Copy {len(copies):,} entries ({format_size(float(copied))}) into {target}"
+            + (f" and delete {len(deletions):,} entries there" if deletions else "") + "?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        self.accept()
+        self.pane.sync_panes(self.engine, self.differences, to, mirror)
+
+    def open_folder(self, item, column):
+        path = item.data(0, Qt.ItemDataRole.UserRole)
+        if not path:
+            return
+        root = self.engine.left if self.pane.side == "left" else self.engine.right
+        folder = os.path.dirname(os.path.join(root, path))
+        if os.path.isdir(folder):
+            self.pane.close_node_store()
+            self.pane.folderLineEdit.setText(folder)
+            self.pane.load_directory(folder)
+
 class PaneWidget(QWidget):
     """
     A widget representing one pane (either left or right) containing:
      - Top Row: folder selection, current folder path, reload & delete buttons.
-     - Middle Row: a tree view showing the folder's contents.
+     - Middle Row: a tree view showing the folder's contents, with folders expandable in place.
      - Bottom Row: move button to transfer selected items between panes.
     """
-    def __init__(self, side: str, parent=None):
+    # Emitted from the FolderWatcher thread with {name: (size, is_dir) or None}
+    sizes_changed = pyqtSignal(object)
+    # Lines copied to the clipboard at most; saving to a file is not limited.
+    CLIPBOARD_TREE_ENTRIES = 100_000
+
+    def __init__(self, side: str, parent=None, size_tree=None):
         super().__init__(parent)
         self.side = side  # "left" or "right"
+        # Totals of every folder scanned so far, shared with the other pane
+        self.size_tree = size_tree if size_tree is not None else SizeTree()
+        self.watcher = None
+        self.scanner = None
+        self.move_worker = None
+        self.delete_worker = None
+        self.tree_worker = None
+        self.duplicate_worker = None
+        self.sync_worker = None  # CompareWorker or SyncWorker
+        self.scan_stats = None  # ScanStats of the current or last scan
+        self.scan_report = None  # ScanReport of the last completed scan
+        self.node_store = None  # Snapshot being browsed instead of the disk, if any
+        self.scanned = None  # (folder, SizeTree) of the last completed scan
+        self.listing_tree = None  # SizeTree the current listing is scanned into
+        self.branch_scanners = {}  # relative path -> DirectoryScanner of a folder being expanded
+        self.scan_rules = None  # ScanRules of the files and folders the pane leaves out, if any
+        # Cancelled scanners are kept alive until their threads have finished.
+        self._retired_scanners = set()
         self.init_ui()
+        self.sizes_changed.connect(self.apply_size_changes)
         # Reparent the spinner to the pane (self) so it is not obscured by the tree widget's viewport
         self.loading_indicator = QProgressIndicator(self)
         # Set the fixed size for the spinner; it will be repositioned in resizeEvent
@@ -309,6 +1115,7 @@ class PaneWidget(QWidget):
         self.folderButton = QPushButton()
         folder_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon)
         self.folderButton.setIcon(folder_icon)
+        self.folderButton.setToolTip("Select a folder (Shift+click to browse a saved size snapshot)")
         self.folderButton.clicked.connect(self.select_folder)
         self.topRow.addWidget(self.folderButton)
 
@@ -327,6 +1134,8 @@ class PaneWidget(QWidget):
         self.reloadButton = QPushButton()
         reload_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_BrowserReload)
         self.reloadButton.setIcon(reload_icon)
+        self.reloadButton.setToolTip("Reload (Shift+click to rescan every folder from disk, Ctrl+click to "
+                                     "take unchanged folders from the size index)")
         self.reloadButton.clicked.connect(self.reload_folder)
         self.topRow.addWidget(self.reloadButton)
 
@@ -339,13 +1148,22 @@ class PaneWidget(QWidget):
 
         self.layout.addLayout(self.topRow)
 
-        # --- Middle Row: Tree View ---
-        self.treeWidget = QTreeWidget()
-        self.treeWidget.setColumnCount(2)
-        self.treeWidget.setHeaderLabels(["Name", "Size"])
-        self.treeWidget.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
-        self.treeWidget.setSortingEnabled(True)  # Enable sorting
-        header = self.treeWidget.header()
+        # --- Middle Row: Folder View ---
+        self.view = QTreeView()
+        self.model = FolderListModel(self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon), self)
+        self.model.fetch_branch = self.load_branch
+        self.view.setModel(self.model)
+        self.view.setWordWrap(False)
+        # Uniform row heights let the view skip measuring every row of a huge folder.
+        self.view.setUniformRowHeights(True)
+        # Double-clicking a folder opens it; the arrow expands it in place.
+        self.view.setExpandsOnDoubleClick(False)
+        self.view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        header = self.view.header()
+        # Sorting is driven by handle_header_clicked so each click sorts exactly once.
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(True)
         # Don't automatically stretch the last column.
         header.setStretchLastSection(False)
         # Set the "Name" column (index 0) to Stretch mode so it always fills the remaining space.
@@ -357,9 +1175,67 @@ class PaneWidget(QWidget):
         header.setSortIndicator(0, Qt.SortOrder.AscendingOrder)
         # Connect header clicks to our sorting handler
         header.sectionClicked.connect(self.handle_header_clicked)
-        # Enable double-click navigation in the tree view
-        self.treeWidget.itemDoubleClicked.connect(self.on_item_double_clicked)
-        self.layout.addWidget(self.treeWidget)
+        # Enable double-click navigation in the folder view
+        self.view.doubleClicked.connect(self.on_item_double_clicked)
+
+        # Report of the last scan below the listing, shown on demand
+        self.reportTree = QTreeWidget()
+        self.reportTree.setHeaderLabels(["Report", "Size"])
+        self.reportTree.header().setStretchLastSection(False)
+        self.reportTree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.reportTree.itemDoubleClicked.connect(self.on_report_item_double_clicked)
+        self.reportTree.hide()
+        self.splitter = QSplitter(Qt.Orientation.Vertical)
+        self.splitter.addWidget(self.view)
+        self.splitter.addWidget(self.reportTree)
+        self.layout.addWidget(self.splitter)
+
+        # --- Status Row: throughput of the current or last scan ---
+        self.statusRow = QHBoxLayout()
+        self.statusLabel = QLabel()
+        self.statusLabel.setStyleSheet("color: #a0a0a0;")
+        self.profileButton = QPushButton()
+        self.profileButton.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogInfoView))
+        self.profileButton.setToolTip("Save the profile report of the last scan")
+        self.profileButton.setEnabled(False)
+        self.profileButton.clicked.connect(self.save_scan_profile)
+        self.reportButton = QPushButton()
+        self.reportButton.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogContentsView))
+        self.reportButton.setToolTip("Show the largest files and folders and the bytes per extension and age")
+        self.reportButton.setCheckable(True)
+        self.reportButton.toggled.connect(self.toggle_report)
+        self.snapshotButton = QPushButton()
+        self.snapshotButton.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_DialogSaveButton))
+        self.snapshotButton.setToolTip("Save a size snapshot of this folder (Shift+click to compare it "
+                                       "with an earlier snapshot)")
+        self.snapshotButton.setEnabled(False)
+        self.snapshotButton.clicked.connect(self.save_or_compare_snapshot)
+        self.diskUsageCheck = QCheckBox("Disk usage")
+        self.diskUsageCheck.setToolTip("Count the space allocated on disk and every hardlinked file once, "
+                                       "like du. Every folder is read again and the listing is not kept "
+                                       "current; reload to update it.")
+        self.diskUsageCheck.toggled.connect(self.toggle_disk_usage)
+        self.estimateCheck = QCheckBox("Estimate")
+        self.estimateCheck.setToolTip("Show estimated folder sizes within a few seconds, each with its "
+                                      "relative standard error, and replace them with exact sizes as "
+                                      "the scan finishes each folder")
+        self.rulesButton = QPushButton("Exclude")
+        self.rulesButton.setToolTip("Leave files and folders such as node_modules/ out of the scan")
+        self.rulesButton.clicked.connect(self.edit_scan_rules)
+        self.statusRow.addWidget(self.statusLabel, 1)
+        self.statusRow.addWidget(self.estimateCheck)
+        self.statusRow.addWidget(self.rulesButton)
+        self.statusRow.addWidget(self.diskUsageCheck)
+        self.statusRow.addWidget(self.reportButton)
+        self.statusRow.addWidget(self.snapshotButton)
+        self.statusRow.addWidget(self.profileButton)
+        self.layout.addLayout(self.statusRow)
+
+        # Scan results and running totals are moved into the model in batches
+        # on this timer.
+        self.batchTimer = QTimer(self)
+        self.batchTimer.setInterval(100)
+        self.batchTimer.timeout.connect(self.flush_scan_results)
 
         # --- Bottom Row: Move and Tree Buttons ---
         self.bottomRow = QHBoxLayout()
@@ -369,80 +1245,523 @@ class PaneWidget(QWidget):
         # Use a standard icon for a detailed view as a substitute for a tree icon.
         tree_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogDetailedView)
         self.treeButton.setIcon(tree_icon)
+        self.treeButton.setToolTip("Copy the tree of the selected items (Shift+click to save it to a file)")
         self.treeButton.clicked.connect(self.copy_folder_tree)
+        self.treeDepthSpin = QSpinBox()
+        self.treeDepthSpin.setRange(0, 99)
+        self.treeDepthSpin.setSpecialValueText("All levels")
+        self.treeDepthSpin.setPrefix("Depth ")
+        self.treeDepthSpin.setToolTip("How many levels below the selected items the tree shows")
+        self.treeSizesCheck = QCheckBox("Sizes")
+        self.treeSizesCheck.setToolTip("Show the scanned size next to each item of the tree")
+        self.duplicatesButton = QPushButton()
+        self.duplicatesButton.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogListView))
+        self.duplicatesButton.setToolTip("Find duplicate files in this folder (Shift+click to search both panes)")
+        self.duplicatesButton.clicked.connect(self.find_duplicates)
+        self.compareButton = QPushButton("Compare")
+        self.compareButton.setToolTip("Compare the folders of both panes and copy only what differs "
+                                      "(Shift+click to compare file contents too)")
+        self.compareButton.clicked.connect(self.compare_panes)
+        # Progress of a running file operation, with a button to cancel it
+        self.progressBar = QProgressBar()
+        self.progressBar.setRange(0, 1000)
+        self.progressBar.hide()
+        self.cancelButton = QPushButton("Cancel")
+        self.cancelButton.clicked.connect(self.cancel_operation)
+        self.cancelButton.hide()
         self.bottomRow.addStretch()
         self.bottomRow.addWidget(self.moveButton)
         self.bottomRow.addWidget(self.treeButton)
+        self.bottomRow.addWidget(self.treeDepthSpin)
+        self.bottomRow.addWidget(self.treeSizesCheck)
+        self.bottomRow.addWidget(self.duplicatesButton)
+        self.bottomRow.addWidget(self.compareButton)
+        self.bottomRow.addWidget(self.progressBar)
+        self.bottomRow.addWidget(self.cancelButton)
         self.bottomRow.addStretch()
         self.layout.addLayout(self.bottomRow)
 
+    def session_state(self):
+        """
+        Returns what the pane shows as a JSON-ready dict for SessionStore, or
+        None while it browses a snapshot.
+        """
+        folder = self.folderLineEdit.text().strip()
+        if self.node_store is not None or not folder:
+            return None
+        model = self.model
+        return {
+            "folder": folder,
+            "sort_column": model.sort_column,
+            "sort_descending": model.sort_order == Qt.SortOrder.DescendingOrder,
+            "disk_usage": self.diskUsageCheck.isChecked(),
+            "estimate": self.estimateCheck.isChecked(),
+            "rules": self.scan_rules.patterns if self.scan_rules else [],
+            # Running totals and estimates are not worth keeping.
+            "rows": [[name, size, is_dir] for name, size, is_dir in zip(model.names, model.sizes, model.is_dirs)
+                     if name not in model.in_progress],
+        }
+
+    def restore_session(self, state):
+        """
+        Shows what the pane showed in the last session at once, from a dict
+        of session_state(), and checks it against the disk in the background.
+        """
+        folder = state.get("folder")
+        if not isinstance(folder, str) or not os.path.isdir(folder):
+            return
+        # Setting the options first keeps their handlers from loading the folder.
+        self.folderLineEdit.setText(folder)
+        for check, key in ((self.diskUsageCheck, "disk_usage"), (self.estimateCheck, "estimate")):
+            check.blockSignals(True)
+            check.setChecked(bool(state.get(key)))
+            check.blockSignals(False)
+        try:
+            rules = ScanRules(state.get("rules") or [])
+        except ValueError:
+            rules = ScanRules()
+        self.scan_rules = rules or None
+        self.rulesButton.setText(f"Exclude ({len(rules.patterns)})" if rules else "Exclude")
+        order = Qt.SortOrder.DescendingOrder if state.get("sort_descending") else Qt.SortOrder.AscendingOrder
+        self.view.sortByColumn(1 if state.get("sort_column") == 1 else 0, order)
+        try:
+            rows = [(str(name), int(size), bool(is_dir)) for name, size, is_dir in state.get("rows") or []]
+        except (TypeError, ValueError):
+            rows = []
+        self.load_directory(folder, cached_rows=rows)
+
     def select_folder(self):
-        """Opens a folder selection dialog and loads the selected folder."""
+        """
+        Opens a folder selection dialog and loads the selected folder.
+        Holding Shift opens a size snapshot instead.
+        """
+        if QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier:
+            self.open_node_store()
+            return
         folder = QFileDialog.getExistingDirectory(self, "Select Folder", os.path.expanduser("~"))
         if folder:
+            self.close_node_store()
             self.folderLineEdit.setText(folder)
             self.load_directory(folder)
 
-    def load_directory(self, folder):
+    def open_node_store(self):
         """
-        Loads the contents of the given folder into the tree view.
-        Uses a separate thread for directory scanning.
+        Browses a snapshot written with "subfoldersize --save-store" instead of
+        the disk, until the pane leaves the snapshot's folder or is reloaded.
+        """
+        path, _ = QFileDialog.getOpenFileName(self, "Open Size Snapshot", os.path.expanduser("~"),
+                                              f"Size snapshots (*{NodeStore.SUFFIX});;All files (*)")
+        if not path:
+            return
+        try:
+            store = NodeStore.open(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Could not open the snapshot: {e}")
+            return
+        self.close_node_store()
+        self.node_store = store
+        self.deleteButton.setEnabled(False)
+        self.moveButton.setEnabled(False)
+        self.folderLineEdit.setText(store.root)
+        self.load_directory(store.root)
+
+    def close_node_store(self):
+        """Goes back to browsing the disk."""
+        if self.node_store is not None:
+            self.node_store.close()
+            self.node_store = None
+            self.deleteButton.setEnabled(True)
+            self.moveButton.setEnabled(True)
+
+    def in_store(self, folder):
+        """Tells whether folder can be shown from the snapshot being browsed."""
+        return self.node_store is not None and self.node_store.find(folder) is not None
+
+    def show_store_listing(self, node):
+        """Lists the subfolders of a snapshot node; the files in it are only summed up."""
+        store = self.node_store
+        self.model.update_rows([(name, size, True, False) for name, size, _, _ in store.listing(node)])
+        size, count = store.own_files(node)
+        self.statusLabel.setText(f"Snapshot of {store.root} · {count:,} files directly in this "
+                                 f"folder ({format_size(size)}) are not listed")
+        self.statusLabel.setToolTip(f"{store.file_counts[node]:,} files in {format_size(store.sizes[node])} "
+                                    "below this folder")
+
+    def load_directory(self, folder, refresh=False, cached_rows=None, trust_index=False):
         """
-        self.treeWidget.clear()
+        Loads the contents of the given folder into the folder view. Uses a
+        separate thread for directory scanning. cached_rows from an earlier
+        session are shown until the scan corrects them.
+        """
+        self.stop_watching()
+        self.cancel_scan()
+        self.model.clear()
+        if cached_rows:
+            self.model.update_rows([(name, size, is_dir, False) for name, size, is_dir in cached_rows])
+        if self.node_store is not None:
+            node = self.node_store.find(folder)
+            if node is not None:
+                self.show_scan_report(None)
+                self.show_store_listing(node)
+                self.scanned = None
+                self.snapshotButton.setEnabled(True)
+                return
+            self.close_node_store()
+        self.scanned = None
+        self.listing_tree = None
+        self.snapshotButton.setEnabled(False)
         if not os.path.isdir(folder):
             return
 
         self.loading_indicator.start()
-        self.treeWidget.setEnabled(False)
 
         # Create and configure the scanner thread
-        self.scanner = DirectoryScanner(folder)
-        
-        def on_item_found(name, size, is_dir):
-            numeric_size = float(size)
-            item = MyTreeWidgetItem([name, self.calculate_size(numeric_size)])
-            # Store the raw size as numeric value in UserRole for sorting
-            item.setData(1, Qt.ItemDataRole.UserRole, numeric_size)
-            if is_dir:
-                folder_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon)
-                item.setIcon(0, folder_icon)
-                item.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.DontShowIndicator)
-            self.treeWidget.addTopLevelItem(item)
+        # Disk usage totals depend on which hardlink was met first, and totals
+        # leaving entries out on the pane's rules, so they get a tree of their
+        # own instead of mixing into the shared one.
+        allocated = self.diskUsageCheck.isChecked()
+        rules = self.scan_rules
+        tree = self.listing_tree = SizeTree() if allocated or rules else self.size_tree
+        # Only worth it for folders that were not scanned before.
+        estimate = (self.estimateCheck.isChecked() and not cached_rows
+                    and (refresh or tree.get(os.path.normpath(folder)) is None))
+        scanner = self.scanner = DirectoryScanner(folder, refresh, tree, allocated, rules, estimate,
+                                                  trust_index)
 
         def on_error(error_msg):
-            QMessageBox.critical(self, "Error", f"Could not list directory: {error_msg}")
+            if scanner is self.scanner:
+                QMessageBox.critical(self, "Error", f"Could not list directory: {error_msg}")
 
         def on_finished():
+            scanner.wait()
+            if scanner is not self.scanner:
+                # A cancelled scan winding down after the pane moved on.
+                self._retired_scanners.discard(scanner)
+                return
+            self.batchTimer.stop()
+            self.flush_scan_results()
             self.loading_indicator.stop()
-            self.treeWidget.setEnabled(True)
+            self.show_scan_stats(scanner.engine.stats)
+            if scanner.completed:
+                if cached_rows:
+                    self.model.remove_names(set(self.model.names) - scanner.engine.entries.keys())
+                self.show_scan_report(scanner.engine.report)
+                self.show_excluded(scanner.engine)
+                self.scanned = (folder, tree)
+                self.snapshotButton.setEnabled(True)
+            if scanner.completed and not allocated:
+                # Keep the listing current from now on without rescanning.
+                self.watcher = FolderWatcher(scanner.engine, self.sizes_changed.emit)
+                self.watcher.start()
             self.scanner = None
 
-        self.scanner.item_found.connect(on_item_found)
-        self.scanner.error.connect(on_error)
-        self.scanner.finished.connect(on_finished)
-        QTimer.singleShot(0, self.scanner.start)
+        scanner.error.connect(on_error)
+        scanner.finished.connect(on_finished)
+        self.batchTimer.start()
+        QTimer.singleShot(0, scanner.start)
+
+    def cancel_scan(self):
+        """Cancels the scan in progress, if any, and those of expanded folders."""
+        if self.scanner is not None:
+            self.scanner.cancel()
+            self._retired_scanners.add(self.scanner)
+            self.scanner = None
+            self.batchTimer.stop()
+            self.loading_indicator.stop()
+        for scanner in self.branch_scanners.values():
+            scanner.cancel()
+            self._retired_scanners.add(scanner)
+        self.branch_scanners = {}
+
+    def shutdown(self):
+        """Stops all background work of the pane before the window closes."""
+        self.stop_watching()
+        self.cancel_scan()
+        self.close_node_store()
+        for scanner in list(self._retired_scanners):
+            scanner.wait()
+        for worker in (self.move_worker, self.delete_worker, self.tree_worker, self.duplicate_worker,
+                       self.sync_worker):
+            if worker is not None:
+                worker.cancel()
+                worker.wait()
+
+    def load_branch(self, index):
+        """
+        Fills a folder expanded in the view with its subfolders and a row for
+        its files, scanning it first if needed.
+        """
+        relative = self.model.relative_path(index)
+        path = os.path.join(self.folderLineEdit.text().strip(), relative)
+        rows = self.branch_rows(path)
+        if rows is not None:
+            self.model.set_branch(index, rows)
+            return
+        if self.listing_tree is None or not os.path.isdir(path):
+            self.model.set_branch(index, [])
+            return
+        rules = self.scan_rules.within(relative) if self.scan_rules else None
+        scanner = self.branch_scanners[relative] = DirectoryScanner(
+            path, False, self.listing_tree, self.diskUsageCheck.isChecked(), rules)
+
+        def on_finished():
+            scanner.wait()
+            if self.branch_scanners.get(relative) is not scanner:
+                self._retired_scanners.discard(scanner)
+                return
+            del self.branch_scanners[relative]
+            index = self.model.index_of(relative)
+            if index.isValid():
+                self.model.set_branch(index, self.branch_rows(path) or [])
+
+        scanner.finished.connect(on_finished)
+        scanner.start()
+
+    def branch_rows(self, path):
+        """
+        Returns the (name, size, is_dir) rows of an expanded folder from the
+        snapshot or the size tree, or None if neither knows it.
+        """
+        if self.in_store(path):
+            node = self.node_store.find(path)
+            rows = [(name, size, True) for name, size, _, _ in self.node_store.listing(node)]
+            size, count = self.node_store.own_files(node)
+        else:
+            tree = self.listing_tree
+            record = tree.get(path) if tree is not None else None
+            if record is None:
+                return None
+            rows = []
+            for name in record.subdirs:
+                subdir = tree.get(os.path.join(path, name))
+                rows.append((name, subdir.total_size if subdir is not None else 0, True))
+            size, count = record.own_size, record.file_count
+        if count:
+            rows.append((f"({count:,} file{'s' if count > 1 else ''})", size, False))
+        return rows
+
+    def flush_scan_results(self):
+        """Moves the results and estimates the scanner has buffered so far into the model."""
+        if self.scanner is not None:
+            self.model.update_estimates(self.scanner.take_estimates())
+            self.model.update_rows(self.scanner.take_results())
+            self.show_scan_stats(self.scanner.engine.stats)
+
+    def show_scan_stats(self, stats):
+        """Shows the throughput of a scan in the status row, with its slowest subtrees as tooltip."""
+        if stats is None:
+            return
+        self.scan_stats = stats
+        self.profileButton.setEnabled(True)
+        self.statusLabel.setText(stats.summary())
+        slowest = sorted(stats.subtrees.values(), key=lambda subtree: subtree[4], reverse=True)[:5]
+        self.statusLabel.setToolTip("\n".join(
+            f"{name}: {busy:.2f} s busy, {dirs:,} dirs, {files:,} files"
+            for name, dirs, files, _size, busy, _wall in slowest
+        ))
+
+    def show_scan_report(self, report):
+        """Keeps the report of the last scan and shows it if the report panel is open."""
+        self.scan_report = report
+        if self.reportTree.isVisible():
+            self.fill_report_tree()
+
+    def toggle_report(self, shown):
+        self.reportTree.setVisible(shown)
+        if shown:
+            self.fill_report_tree()
+
+    def fill_report_tree(self):
+        """
+        Lists the largest files and folders and the histograms of the last scan.
+        Files and folders carry their path, so double-clicking them opens them.
+        """
+        self.reportTree.clear()
+        report = self.scan_report
+        if report is None:
+            QTreeWidgetItem(self.reportTree, ["No report for this folder"])
+            return
+        folder = self.folderLineEdit.text().strip()
+
+        def shown_path(path):
+            relative = os.path.relpath(path, folder) if folder else path
+            return path if relative.startswith(os.pardir) else relative
+
+        if report.coverage() < 1.0:
+            note = QTreeWidgetItem(self.reportTree, [
+                f"Covers {report.coverage():.0%} of the folder; Shift+reload lists every folder"])
+            note.setToolTip(0, "Folders reused from the size index or an earlier scan were not listed.")
+        sections = (
+            ("Largest files", [(shown_path(path), size, path) for size, path in report.largest_files()]),
+            ("Largest folders", [(shown_path(path) + os.sep, size, path) for size, path in report.largest_dirs()]),
+            ("By extension", [(f"{extension} ({count:,} files)", size, None)
+                              for extension, size, count in report.extensions()]),
+            ("By age", [(f"{label} ({count:,} files)", size, None) for label, size, count in report.ages()]),
+        )
+        for title, rows in sections:
+            section = QTreeWidgetItem(self.reportTree, [title])
+            for text, size, path in rows:
+                item = QTreeWidgetItem(section, [text, format_size(size)])
+                item.setTextAlignment(1, Qt.AlignmentFlag.AlignRight)
+                if path is not None:
+                    item.setData(0, Qt.ItemDataRole.UserRole, path)
+                    item.setToolTip(0, path)
+            section.setExpanded(True)
+
+    def on_report_item_double_clicked(self, item, column):
+        """Opens a folder of the report, or the folder holding a file of it."""
+        path = item.data(0, Qt.ItemDataRole.UserRole)
+        if not path:
+            return
+        folder = path if os.path.isdir(path) else os.path.dirname(path)
+        if os.path.isdir(folder):
+            self.close_node_store()
+            self.folderLineEdit.setText(folder)
+            self.load_directory(folder)
+
+    def save_scan_profile(self):
+        """Writes the profile report of the current or last scan to a JSON file."""
+        if self.scan_stats is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save Scan Profile", "scan-profile.json",
+                                              "JSON files (*.json);;All files (*)")
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.scan_stats.as_dict(), f, indent=2)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Could not save the profile: {e}")
+
+    def save_or_compare_snapshot(self):
+        """Saves a snapshot of the shown folder; Shift+click compares it with an earlier one."""
+        if QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier:
+            self.compare_with_snapshot()
+            return
+        if self.scanned is None:
+            return
+        folder, tree = self.scanned
+        name = (os.path.basename(folder) or "snapshot") + NodeStore.SUFFIX
+        path, _ = QFileDialog.getSaveFileName(self, "Save Size Snapshot",
+                                              os.path.join(os.path.expanduser("~"), name),
+                                              f"Size snapshots (*{NodeStore.SUFFIX});;All files (*)")
+        if not path:
+            return
+        try:
+            NodeStore.from_tree(tree, folder).save(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Could not save the snapshot: {e}")
+
+    def compare_with_snapshot(self):
+        """Shows how the folders below the shown one changed since an earlier snapshot."""
+        folder = self.folderLineEdit.text().strip()
+        if self.scanned is not None:
+            folder, tree = self.scanned
+            newer = NodeStore.from_tree(tree, folder)
+        elif self.in_store(folder):
+            newer = self.node_store
+        else:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Compare With Snapshot", os.path.expanduser("~"),
+                                              f"Size snapshots (*{NodeStore.SUFFIX});;All files (*)")
+        if not path:
+            return
+        try:
+            with NodeStore.open(path) as older:
+                dialog = DiffDialog(self, older, newer, os.path.normpath(folder))
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Could not open the snapshot: {e}")
+            return
+        except KeyError:
+            QMessageBox.information(self, "Compare With Snapshot", f"{folder} is not in the snapshot.")
+            return
+        dialog.show()
+
+    def selected_names(self):
+        """Returns the names of the selected rows of the listed folder; rows of expanded folders are left out."""
+        return [self.model.name_at(index.row()) for index in self.view.selectionModel().selectedRows()
+                if not index.parent().isValid()]
+
+    def apply_size_changes(self, changed):
+        """
+        Patches the listing with the size changes reported by the folder watcher.
+        None means the watcher lost events, in which case the folder is rescanned.
+        """
+        if changed is None:
+            self.reload_folder()
+            return
+        self.model.apply_changes(changed)
+
+    def stop_watching(self):
+        """Stops watching the current folder for changes."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
 
     def calculate_size(self, size, decimal_places=2):
         """Formats the size in bytes into a human-readable string."""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if size < 1024.0:
-                return f"{size:.{decimal_places}f} {unit}"
-            size /= 1024.0
-        return f"{size:.{decimal_places}f} PB"
+        return format_size(size, decimal_places)
 
-    def reload_folder(self):
-        """Reloads the current folder indicated in the text field."""
-        folder = self.folderLineEdit.text()
+    def toggle_disk_usage(self):
+        """Lists the current folder again in the other accounting mode."""
+        folder = self.folderLineEdit.text().strip()
         if folder:
+            self.close_node_store()
             self.load_directory(folder)
 
-    def delete_selected(self):
+    def edit_scan_rules(self):
+        """Edits the .gitignore-style rules of what the pane leaves out, and lists the folder again."""
+        text, ok = QInputDialog.getMultiLineText(
+            self, "Exclude",
+            "One pattern per line, as in .gitignore: node_modules/ skips every folder of that name,\n"
+            "/build only the one in the listed folder, *.iso files, and !pattern includes again.",
+            "\n".join(self.scan_rules.patterns) if self.scan_rules else "")
+        if not ok:
+            return
+        try:
+            rules = ScanRules(text.splitlines())
+        except ValueError as e:
+            QMessageBox.warning(self, "Exclude", f"The rules were not changed: {e}")
+            return
+        self.scan_rules = rules or None
+        count = len(self.scan_rules.patterns) if self.scan_rules else 0
+        self.rulesButton.setText(f"Exclude ({count})" if count else "Exclude")
+        folder = self.folderLineEdit.text().strip()
+        if folder and not self.in_store(folder):
+            self.load_directory(folder)
+
+    def show_excluded(self, engine):
+        """Sums up what the rules left out of the last scan in the tooltip of the rules button."""
+        if engine.rules is None:
+            self.rulesButton.setToolTip("Leave files and folders such as node_modules/ out of the scan")
+            return
+        unsized = (f"; {engine.excluded_unsized:,} of the folders were never scanned, so their sizes "
+                   "are not known" if engine.excluded_unsized else "")
+        self.rulesButton.setToolTip(
+            f"The rules left out {engine.excluded_dirs:,} folders and {engine.excluded_files:,} files, "
+            f"{format_size(float(engine.excluded_bytes))} in all{unsized}:\n"
+            + "\n".join(engine.rules.patterns))
+
+    def reload_folder(self):
         """
-        Asks for confirmation before deleting selected items from
-        both the file system and the view.
+        Reloads the current folder indicated in the text field. Shift+click
+        rescans every folder from disk; Ctrl+click takes unchanged folders from
+        the size index.
         """
-        items = self.treeWidget.selectedItems()
-        if not items:
+        folder = self.folderLineEdit.text()
+        if folder:
+            self.close_node_store()
+            modifiers = QApplication.keyboardModifiers()
+            refresh = bool(modifiers & Qt.KeyboardModifier.ShiftModifier)
+            trust_index = bool(modifiers & Qt.KeyboardModifier.ControlModifier)
+            # Drop what is remembered about the folder so it is read again.
+            self.size_tree.forget(os.path.normpath(folder))
+            self.load_directory(folder, refresh, trust_index=trust_index)
+
+    def delete_selected(self):
+        """Asks for confirmation before deleting selected items from both the file system and the view."""
+        names = self.selected_names()
+        if not names or self.delete_worker is not None:
             return
 
         reply = QMessageBox.question(
@@ -451,38 +1770,88 @@ class PaneWidget(QWidget):
             "Are you sure you want to delete the selected items? This action cannot be undone.",
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         )
-        if reply == QMessageBox.StandardButton.Yes:
-            folder = self.folderLineEdit.text().strip()
-            for item in items:
-                full_path = os.path.join(folder, item.text(0))
-                try:
-                    if os.path.isfile(full_path):
-                        os.remove(full_path)
-                    elif os.path.isdir(full_path):
-                        import shutil
-                        shutil.rmtree(full_path)
-                except Exception as e:
-                    QMessageBox.warning(self, "Delete Error", f"Error deleting '{full_path}':\n{e}")
-
-                # Remove item from view
-                index = self.treeWidget.indexOfTopLevelItem(item)
-                if index != -1:
-                    self.treeWidget.takeTopLevelItem(index)
-                else:
-                    parent = item.parent()
-                    if parent:
-                        parent.removeChild(item)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+
+        folder = self.folderLineEdit.text().strip()
+        paths = [os.path.join(folder, name) for name in names]
+        expected = sum(self.model.sizes[self.model.row_of(name)] for name in names)
+        self.delete_worker = DeleteWorker(paths, expected)
+        self.delete_worker.error.connect(lambda err: QMessageBox.critical(self, "Delete Error", err))
+        self.delete_worker.progress.connect(self.show_progress)
+        self.show_progress(0, expected)
+
+        def on_finished():
+            worker = self.delete_worker
+            worker.wait()
+            self.delete_worker = None
+            self.hide_progress()
+            self.apply_deletions(worker.results)
+            if worker.engine.errors:
+                details = "\n".join(f"{path}: {message}" for path, message in worker.engine.errors[:20])
+                if len(worker.engine.errors) > 20:
+                    details += f"\n... and {len(worker.engine.errors) - 20} more"
+                QMessageBox.warning(self, "Delete Error", f"Some items could not be deleted:\n{details}")
+
+        self.delete_worker.finished.connect(on_finished)
+        self.delete_worker.start()
+
+    def apply_deletions(self, results):
+        """
+        Takes the bytes freed by a delete off the listing and, unless a watcher
+        does so, off the tree it was scanned into and the shared size tree.
+        """
+        trees = [self.size_tree]
+        if self.listing_tree is not None and self.listing_tree is not self.size_tree:
+            trees.append(self.listing_tree)
+        removed, shrunk = [], []
+        for path, (freed, gone) in results.items():
+            name = os.path.basename(path)
+            row = self.model.row_of(name)
+            if gone:
+                removed.append(name)
+            elif freed and row is not None:
+                shrunk.append((name, self.model.sizes[row] - freed, self.model.is_dirs[row], False))
+            if self.watcher is None:
+                for tree in trees:
+                    tree.discount(os.path.normpath(path), freed, gone)
+        self.model.remove_names(removed)
+        self.model.update_rows(shrunk)
+
+    def show_progress(self, done, total):
+        """Shows the byte progress of a running file operation."""
+        self.progressBar.setValue(done * 1000 // total if total else 0)
+        self.progressBar.setFormat(f"{format_size(float(done))} / {format_size(float(total))}")
+        self.progressBar.show()
+        self.cancelButton.show()
+
+    def show_line_progress(self, lines):
+        """Shows a busy progress bar with the number of lines written so far."""
+        self.progressBar.setRange(0, 0)
+        self.progressBar.setFormat(f"{lines:,} lines")
+        self.progressBar.show()
+        self.cancelButton.show()
+
+    def hide_progress(self):
+        self.progressBar.setRange(0, 1000)
+        self.progressBar.hide()
+        self.cancelButton.hide()
+
+    def cancel_operation(self):
+        """Cancels the running file operation."""
+        for worker in (self.move_worker, self.delete_worker, self.tree_worker, self.duplicate_worker,
+                       self.sync_worker):
+            if worker is not None:
+                worker.cancel()
 
     def move_items(self):
         """
-        Moves the selected items from this pane to the other pane
-        using a safe move (copy then delete) operation in the file system.
-        After the move, both panes are refreshed.
+        Moves the selected items from this pane to the other pane in the
+        background. Panes without a folder watcher are refreshed afterwards.
         """
-        items = self.treeWidget.selectedItems()
-        if not items:
+        moved_items = self.selected_names()
+        if not moved_items:
             return
-        moved_items = [item.text(0) for item in items]
         direction = "to right" if self.side == "left" else "to left"
         reply = QMessageBox.question(
             self,
@@ -502,22 +1871,28 @@ class PaneWidget(QWidget):
 
         # Start the move operation in a background thread.
         self.loading_indicator.start()
-        self.treeWidget.setEnabled(False)
-        if hasattr(self.otherPane, "treeWidget"):
-            self.otherPane.treeWidget.setEnabled(False)
+        self.view.setEnabled(False)
+        if hasattr(self.otherPane, "view"):
+            self.otherPane.view.setEnabled(False)
 
         self.move_worker = MoveWorker(moved_items, src_folder, dest_folder)
         self.move_worker.error.connect(lambda err: QMessageBox.critical(self, "Move Error", err))
+        self.move_worker.progress.connect(self.show_progress)
+        self.cancelButton.show()
 
         def on_finished():
+            self.move_worker.wait()
+            self.hide_progress()
             self.loading_indicator.stop()
-            self.treeWidget.setEnabled(True)
-            if hasattr(self.otherPane, "treeWidget"):
-                self.otherPane.treeWidget.setEnabled(True)
+            self.view.setEnabled(True)
+            if hasattr(self.otherPane, "view"):
+                self.otherPane.view.setEnabled(True)
             self.move_worker = None
-            # Refresh both panes to display updated folder contents.
-            self.reload_folder()
-            if hasattr(self, "otherPane"):
+            # Refresh both panes to display updated folder contents. Panes with
+            # a folder watcher pick up the change on their own.
+            if self.watcher is None:
+                self.reload_folder()
+            if hasattr(self, "otherPane") and self.otherPane.watcher is None:
                 self.otherPane.reload_folder()
 
         self.move_worker.finished.connect(on_finished)
@@ -530,69 +1905,189 @@ class PaneWidget(QWidget):
         When index 1 ("Size") is clicked, sort descending by filesize.
         """
         if index == 0:
-            self.treeWidget.sortItems(0, Qt.SortOrder.AscendingOrder)
+            self.view.sortByColumn(0, Qt.SortOrder.AscendingOrder)
         elif index == 1:
-            self.treeWidget.sortItems(1, Qt.SortOrder.DescendingOrder)
+            self.view.sortByColumn(1, Qt.SortOrder.DescendingOrder)
 
     def copy_folder_tree(self):
-        """
-        Generates an ASCII tree only for the selected items in the view.
-        For a selected folder, recursively traverses its subfolders/files.
-        Copies the resulting tree to the system clipboard and displays a success message.
-        """
+        """Copies an ASCII tree of the selected items to the clipboard; Shift+click writes it to a file."""
         folder = self.folderLineEdit.text().strip()
         if not folder or not os.path.isdir(folder):
             QMessageBox.warning(self, "Error", "Please select a valid folder first.")
             return
 
-        selected_items = self.treeWidget.selectedItems()
-        if not selected_items:
+        selected_names = self.selected_names()
+        if not selected_names:
             QMessageBox.warning(self, "Error", "No items selected.")
             return
+        if self.tree_worker is not None:
+            return
 
-        tree_lines = []
-        for idx, item in enumerate(selected_items):
-            name = item.text(0)
-            full_path = os.path.join(folder, name)
-            # Use a connector for the top-level selected item
-            connector = "└─ " if idx == len(selected_items) - 1 else "├─ "
-            tree_lines.append(connector + name)
-            if os.path.isdir(full_path):
-                # Determine extra prefix based on connector for the top-level item.
-                # Use 3 characters: "   " for last items and "│  " for non-last.
-                extra_prefix = "   " if connector.startswith("└") else "│  "
-                # Pass the extra prefix into build_ascii_tree so that the branches appear properly.
-                sub_lines = self.build_ascii_tree(full_path, prefix=extra_prefix)
-                tree_lines.extend(sub_lines)
+        destination = None
+        max_entries = self.CLIPBOARD_TREE_ENTRIES
+        if QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier:
+            destination, _ = QFileDialog.getSaveFileName(self, "Save Folder Tree", os.path.join(folder, "tree.txt"),
+                                                         "Text files (*.txt);;All files (*)")
+            if not destination:
+                return
+            max_entries = None
+
+        max_depth = self.treeDepthSpin.value() or None
+        size_of = self.tree_size_lookup() if self.treeSizesCheck.isChecked() else None
+        self.tree_worker = TreeExportWorker(folder, selected_names, destination, max_depth, max_entries, size_of)
+        self.tree_worker.progress.connect(self.show_line_progress)
+        self.tree_worker.error.connect(lambda msg: QMessageBox.warning(self, "Error", f"Could not write the tree: {msg}"))
+        self.show_line_progress(0)
 
-        tree_str = "\n".join(tree_lines)
-        clipboard = QApplication.clipboard()
-        clipboard.setText(tree_str)
-        QMessageBox.information(self, "Copied", "Folder tree copied to clipboard!")
+        def on_finished():
+            worker = self.tree_worker
+            worker.wait()
+            self.tree_worker = None
+            self.hide_progress()
+            if not worker.completed:
+                return
+            if destination is None:
+                QApplication.clipboard().setText(worker.text)
+                QMessageBox.information(self, "Copied", "Folder tree copied to clipboard!")
+            else:
+                QMessageBox.information(self, "Saved", f"Folder tree saved to {destination}")
+
+        self.tree_worker.finished.connect(on_finished)
+        self.tree_worker.start()
+
+    def find_duplicates(self):
+        """
+        Lists the identical files below the current folder; Shift+click includes
+        the other pane's folder.
+        """
+        folder = self.folderLineEdit.text().strip()
+        if not folder or not os.path.isdir(folder):
+            QMessageBox.warning(self, "Error", "Please select a valid folder first.")
+            return
+        if self.duplicate_worker is not None:
+            return
+        roots = [folder]
+        if QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier:
+            other = self.otherPane.folderLineEdit.text().strip()
+            if other and os.path.isdir(other):
+                roots.append(other)
+
+        worker = self.duplicate_worker = DuplicateWorker(roots)
+        worker.progress.connect(self.show_duplicate_progress)
+        worker.error.connect(lambda msg: QMessageBox.warning(self, "Error", f"Could not look for duplicates: {msg}"))
+        self.show_progress(0, 0)
+
+        def on_finished():
+            worker.wait()
+            self.duplicate_worker = None
+            self.hide_progress()
+            if worker.groups is None:
+                return
+            if not worker.groups:
+                QMessageBox.information(self, "Duplicate Files", "No duplicate files found.")
+                return
+            DuplicatesDialog(self, worker.groups, worker.engine).show()
+
+        worker.finished.connect(on_finished)
+        worker.start()
+
+    def show_duplicate_progress(self, stage, done, total):
+        """Shows the progress of a duplicate search: folders while listing, bytes while hashing."""
+        if stage == DuplicateFinder.STAGES[0]:
+            self.progressBar.setRange(0, 0)
+            self.progressBar.setFormat(f"Listing: {done:,} folders")
+            self.progressBar.show()
+            self.cancelButton.show()
+            return
+        self.progressBar.setRange(0, 1000)
+        self.show_progress(done, total)
+        self.progressBar.setFormat(f"Hashing {stage}: {self.progressBar.format()}")
 
-    def build_ascii_tree(self, path, prefix=""):
+    def compare_panes(self):
         """
-        Recursively builds an ASCII representation of the folder tree.
+        Compares the folders of both panes and lists the differences;
+        Shift+click compares file contents.
         """
-        lines = []
-        try:
-            entries = sorted(os.listdir(path))
-        except Exception as e:
-            lines.append(prefix + f"Error accessing {path}: {e}")
-            return lines
-
-        for idx, entry in enumerate(entries):
-            full_path = os.path.join(path, entry)
-            connector = "└─ " if idx == len(entries) - 1 else "├─ "
-            lines.append(prefix + connector + entry)
-            if os.path.isdir(full_path):
-                # Determine extra prefix based on connector for the top-level item.
-                # Use 3 characters: "   " for last items and "│  " for non-last.
-                extra_prefix = "   " if connector.startswith("└") else "│  "
-                # Pass the extra prefix into build_ascii_tree so that the branches appear properly.
-                sub_lines = self.build_ascii_tree(full_path, prefix + extra_prefix)
-                lines.extend(sub_lines)
-        return lines
+        left_pane, right_pane = (self, self.otherPane) if self.side == "left" else (self.otherPane, self)
+        left = left_pane.folderLineEdit.text().strip()
+        right = right_pane.folderLineEdit.text().strip()
+        if not (left and right and os.path.isdir(left) and os.path.isdir(right)):
+            QMessageBox.warning(self, "Error", "Both panes must show a folder on disk.")
+            return
+        if os.path.normpath(left) == os.path.normpath(right):
+            QMessageBox.warning(self, "Error", "Both panes show the same folder.")
+            return
+        if self.sync_worker is not None:
+            return
+        contents = bool(QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier)
+        worker = self.sync_worker = CompareWorker(left, right, contents, self.scan_rules)
+        worker.progress.connect(self.show_compare_progress)
+        worker.error.connect(lambda msg: QMessageBox.warning(self, "Error", f"Could not compare the folders: {msg}"))
+        self.show_compare_progress(0, 0)
+
+        def on_finished():
+            worker.wait()
+            self.sync_worker = None
+            self.hide_progress()
+            if worker.differences is not None:
+                CompareDialog(self, worker.engine, worker.differences).show()
+
+        worker.finished.connect(on_finished)
+        worker.start()
+
+    def show_compare_progress(self, folders, hashed):
+        """Shows a busy progress bar with the folders compared and bytes hashed so far."""
+        self.progressBar.setRange(0, 0)
+        self.progressBar.setFormat(f"Comparing: {folders:,} folders"
+                                   + (f", {format_size(float(hashed))} hashed" if hashed else ""))
+        self.progressBar.show()
+        self.cancelButton.show()
+
+    def sync_panes(self, engine, differences, to, mirror):
+        """Copies the differences found by compare_panes() to one side in the background."""
+        if self.sync_worker is not None:
+            return
+        self.loading_indicator.start()
+        for pane in (self, self.otherPane):
+            pane.view.setEnabled(False)
+        worker = self.sync_worker = SyncWorker(engine, differences, to, mirror)
+        # Read errors of the comparison were listed in the dialog already.
+        known_errors = len(engine.errors)
+        worker.error.connect(lambda err: QMessageBox.critical(self, "Copy Error", err))
+        worker.progress.connect(self.show_progress)
+        self.cancelButton.show()
+
+        def on_finished():
+            worker.wait()
+            self.sync_worker = None
+            self.hide_progress()
+            self.loading_indicator.stop()
+            for pane in (self, self.otherPane):
+                pane.view.setEnabled(True)
+                if pane.watcher is None:
+                    pane.reload_folder()
+            errors = engine.errors[known_errors:]
+            if errors:
+                QMessageBox.warning(self, "Copy Error",
+                                    "\n".join(f"{path}: {message}" for path, message in errors[:20]))
+
+        worker.finished.connect(on_finished)
+        worker.start()
+
+    def tree_size_lookup(self):
+        """Returns a size_of callable for render_ascii_tree that answers from the scan results."""
+        folder = self.folderLineEdit.text().strip()
+        listed = {os.path.join(folder, name): size for name, size in zip(self.model.names, self.model.sizes)}
+
+        def size_of(path, entry):
+            if entry is None:
+                return listed.get(path)
+            if not entry_is_dir(entry):
+                return entry_size(entry)
+            node = self.size_tree.get(os.path.normpath(path))
+            return node.total_size if node is not None else None
+
+        return size_of
 
     def go_to_parent_folder(self):
         """
@@ -602,30 +2097,29 @@ class PaneWidget(QWidget):
         if not current:
             return
         parent_folder = os.path.dirname(current)
-        if parent_folder and os.path.isdir(parent_folder):
+        if parent_folder and (self.in_store(parent_folder) or os.path.isdir(parent_folder)):
             self.folderLineEdit.setText(parent_folder)
             self.load_directory(parent_folder)
         else:
             QMessageBox.information(self, "Info", "No parent folder available.")
 
-    def on_item_double_clicked(self, item, column):
+    def on_item_double_clicked(self, index):
         """
         When an item is double-clicked, if it represents a folder,
         navigate into that folder.
         """
         folder = self.folderLineEdit.text().strip()
-        if not folder or not os.path.isdir(folder):
+        if not folder:
             return
-        subfolder = os.path.join(folder, item.text(0))
-        if os.path.isdir(subfolder):
+        subfolder = os.path.join(folder, self.model.relative_path(index))
+        if self.in_store(subfolder) or os.path.isdir(subfolder):
             self.folderLineEdit.setText(subfolder)
             self.load_directory(subfolder)
 
 class MainWindow(QMainWindow):
-    """
-    The main application window containing two resizable panes
-    (left and right) side by side.
-    """
+    """The main application window containing two resizable panes (left and right) side by side."""
+    STARTUP_BUDGET = 0.5
+
     def __init__(self):
         super().__init__()
         import sys, os
@@ -642,15 +2136,19 @@ class MainWindow(QMainWindow):
         self.setStyleSheet(STYLE_SHEET)
         self.setWindowTitle("SubfolderSize GUI")
         self.resize(800, 600)
+        self.startup_time = None  # Seconds from STARTED to the first painted listing
+        self.session = SessionStore(SessionStore.default_path())
         self.init_ui()
+        self.restore_session()
 
     def init_ui(self):
         central_widget = QWidget()
         main_layout = QHBoxLayout(central_widget)
 
-        # Create left and right panes.
-        self.leftPane = PaneWidget("left")
-        self.rightPane = PaneWidget("right")
+        # Create left and right panes sharing one tree of scanned folder sizes.
+        self.size_tree = SizeTree()
+        self.leftPane = PaneWidget("left", size_tree=self.size_tree)
+        self.rightPane = PaneWidget("right", size_tree=self.size_tree)
 
         # Link the panes so each knows its counterpart.
         self.leftPane.otherPane = self.rightPane
@@ -664,7 +2162,52 @@ class MainWindow(QMainWindow):
 
         self.setCentralWidget(central_widget)
 
+    def restore_session(self):
+        """
+        Shows the panes as they were when the app was last closed, and starts
+        measuring the time until a listing is painted.
+        """
+        panes = self.session.load()
+        for side, pane in (("left", self.leftPane), ("right", self.rightPane)):
+            state = panes.get(side)
+            if isinstance(state, dict):
+                pane.restore_session(state)
+        # Without a listing to restore, the empty panes are the first paint.
+        self.restored_rows = bool(self.leftPane.model.rowCount() or self.rightPane.model.rowCount())
+        for pane in (self.leftPane, self.rightPane):
+            pane.view.viewport().installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if (self.startup_time is None and event.type() == QEvent.Type.Paint
+                and (not self.restored_rows or self.leftPane.model.rowCount() or self.rightPane.model.rowCount())):
+            # The listing is drawn once this paint event has been handled.
+            QTimer.singleShot(0, self.record_startup_time)
+            for pane in (self.leftPane, self.rightPane):
+                pane.view.viewport().removeEventFilter(self)
+        return super().eventFilter(watched, event)
+
+    def record_startup_time(self):
+        self.startup_time = time.perf_counter() - STARTED
+        if self.startup_time > self.STARTUP_BUDGET:
+            print(f"SubfolderSize: the first listing took {self.startup_time:.2f} s to appear, "
+                  f"over the startup budget of {self.STARTUP_BUDGET:g} s", file=sys.stderr)
+
+    def closeEvent(self, event):
+        """Stops the scans and folder watchers and saves the session before the window closes."""
+        self.leftPane.shutdown()
+        self.rightPane.shutdown()
+        states = {side: pane.session_state() for side, pane in (("left", self.leftPane), ("right", self.rightPane))}
+        try:
+            self.session.save({side: state for side, state in states.items() if state is not None})
+        except OSError:
+            pass
+        super().closeEvent(event)
+
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False):
+        # Lets a frozen build start the worker processes of the duplicate finder.
+        import multiprocessing
+        multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     set_dark_theme(app)
     window = MainWindow()
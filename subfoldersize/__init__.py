@@ -0,0 +1,41 @@
+"""SubfolderSize engine: scanning, indexing, watching and file operations without PyQt."""
+
+from .dupes import DuplicateFinder
+from .estimate import SizeEstimator
+from .fileops import DeleteEngine, MoveEngine, OperationCancelled, ProgressCounter
+from .index import SizeIndex, user_cache_dir
+from .inodes import InodeSet
+from .nodestore import NodeStore
+from .report import ScanReport
+from .rules import ScanRules
+from .scan import DirRecord, ScanCancelled, ScanEngine, ScanStats, SizeTree
+from .session import SessionStore
+from .sync import TreeSync
+from .treeexport import render_ascii_tree
+from .util import format_size
+from .watch import FolderWatcher
+
+__all__ = [
+    "DeleteEngine",
+    "DirRecord",
+    "DuplicateFinder",
+    "FolderWatcher",
+    "InodeSet",
+    "MoveEngine",
+    "NodeStore",
+    "OperationCancelled",
+    "ProgressCounter",
+    "ScanCancelled",
+    "ScanEngine",
+    "ScanReport",
+    "ScanRules",
+    "ScanStats",
+    "SessionStore",
+    "SizeEstimator",
+    "SizeIndex",
+    "SizeTree",
+    "TreeSync",
+    "format_size",
+    "render_ascii_tree",
+    "user_cache_dir",
+]
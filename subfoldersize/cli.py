@@ -0,0 +1,519 @@
+"""
+Command line interface: prints the size of every entry of a folder.
+
+Exit codes are meant for cron jobs and scripts:
+  0  every folder was read
+  1  the scan completed, but some folders could not be read and are undercounted
+  2  bad arguments, or the folder itself could not be read
+  130  interrupted
+  141  the output was closed before everything was written, e.g. by head
+"""
+
+import argparse
+import csv
+import errno
+import heapq
+import json
+import math
+import os
+import sys
+import threading
+
+from .dupes import DuplicateFinder
+from .estimate import SizeEstimator
+from .fileops import OperationCancelled
+from .index import SizeIndex
+from .nodestore import NodeStore
+from .report import ScanReport
+from .rules import ScanRules
+from .scan import ScanCancelled, ScanEngine
+from .sync import TreeSync
+from .util import format_size, natural_key
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+EXIT_BROKEN_PIPE = 141  # 128 + SIGPIPE, as shells report a filter killed by it
+
+DIFF_TOP = 20
+
+class _Writer:
+    """Writes result rows in one of the output formats; safe to call from scan workers."""
+    def __init__(self, fmt, folder, stream):
+        self.fmt = fmt
+        self.folder = folder
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._csv = csv.writer(stream) if fmt == "csv" else None
+
+    def header(self):
+        if self._csv is not None:
+            self._csv.writerow(["name", "path", "size", "is_dir"])
+
+    def row(self, name, size, is_dir):
+        with self._lock:
+            if self.fmt == "ndjson":
+                self.stream.write(json.dumps({
+                    "name": name,
+                    "path": os.path.join(self.folder, name),
+                    "size": size,
+                    "is_dir": is_dir,
+                }) + "\n")
+            elif self._csv is not None:
+                self._csv.writerow([name, os.path.join(self.folder, name), size, int(is_dir)])
+            else:
+                self.stream.write(f"{format_size(size):>12}  {name}{os.sep if is_dir else ''}\n")
+
+    def estimate_row(self, name, size, is_dir, error):
+        if self.fmt == "ndjson":
+            self.stream.write(json.dumps({
+                "name": name,
+                "path": os.path.join(self.folder, name),
+                "size": size,
+                "is_dir": is_dir,
+                "error": error,
+            }) + "\n")
+            return
+        if size is None:
+            shown, margin = "?", ""
+        else:
+            shown = format_size(size)
+            margin = "" if error == 0 else "±   ?" if error is None else f"±{error:4.0%}"
+        self.stream.write(f"{shown:>12} {margin:5}  {name}{os.sep if is_dir else ''}\n")
+
+    def total(self, size):
+        if self.fmt == "text":
+            self.stream.write(f"{format_size(size):>12}  total\n")
+
+    def excluded(self, engine):
+        if self.fmt == "ndjson":
+            self.stream.write(json.dumps({"excluded": {
+                "dirs": engine.excluded_dirs,
+                "files": engine.excluded_files,
+                "bytes": engine.excluded_bytes,
+                "unsized_dirs": engine.excluded_unsized,
+            }}) + "\n")
+        elif self.fmt == "text":
+            unsized = f", {engine.excluded_unsized:,} not in the index" if engine.excluded_unsized else ""
+            self.stream.write(f"{format_size(engine.excluded_bytes):>12}  excluded ({engine.excluded_dirs:,} "
+                              f"folders{unsized}, {engine.excluded_files:,} files)\n")
+
+    def duplicates(self, groups):
+        if self._csv is not None:
+            self._csv.writerow(["group", "size", "path"])
+        for number, (size, paths) in enumerate(groups, 1):
+            if self.fmt == "ndjson":
+                self.stream.write(json.dumps({"size": size, "paths": paths}) + "\n")
+            elif self._csv is not None:
+                self._csv.writerows([number, size, path] for path in paths)
+            else:
+                self.stream.write(f"{format_size(size)} x {len(paths)}, "
+                                  f"{format_size(size * (len(paths) - 1))} reclaimable\n")
+                self.stream.writelines(f"  {path}\n" for path in paths)
+
+    def changes(self, rows):
+        if self._csv is not None:
+            self._csv.writerow(["path", "old_size", "size", "change"])
+        for path, old_size, size in rows:
+            if self.fmt == "ndjson":
+                self.stream.write(json.dumps({
+                    "path": path,
+                    "old_size": old_size,
+                    "size": size,
+                    "change": size - old_size,
+                }) + "\n")
+            elif self._csv is not None:
+                self._csv.writerow([path, old_size, size, size - old_size])
+            else:
+                change = size - old_size
+                sign = "+" if change >= 0 else "-"
+                self.stream.write(f"{sign + format_size(abs(change)):>13}  "
+                                  f"({format_size(old_size)} -> {format_size(size)})  {path}\n")
+
+    def differences(self, rows, engine):
+        if self._csv is not None:
+            self._csv.writerow(["path", "difference", "is_dir", "size", "other_size"])
+        for path, state, is_dir, size, other_size in rows:
+            if self.fmt == "ndjson":
+                self.stream.write(json.dumps({
+                    "path": path,
+                    "difference": state,
+                    "is_dir": is_dir,
+                    "size": size,
+                    "other_size": other_size,
+                }) + "\n")
+            elif self._csv is not None:
+                self._csv.writerow([path, state, int(is_dir), "" if size is None else size,
+                                    "" if other_size is None else other_size])
+            else:
+                sizes = " -> ".join(format_size(s) for s in (size, other_size) if s is not None)
+                self.stream.write(f"{state:>12}  {path}{os.sep if is_dir else ''}  ({sizes})\n")
+        if self.fmt == "ndjson":
+            self.stream.write(json.dumps({"identical": {
+                "files": engine.identical_files,
+                "bytes": engine.identical_bytes,
+                "dirs_compared": engine.dirs_compared,
+            }}) + "\n")
+        elif self.fmt == "text":
+            self.stream.write(f"{format_size(engine.identical_bytes):>12}  identical ({engine.identical_files:,} "
+                              f"files in {engine.dirs_compared:,} folders)\n")
+
+    def report(self, report):
+        if self.fmt == "ndjson":
+            self.stream.write(json.dumps({"report": report.as_dict()}) + "\n")
+        else:
+            for line in report.lines(extensions=report.top):
+                self.stream.write(line + "\n")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="subfoldersize",
+        description="Print the total size of every file and folder directly inside FOLDER.",
+        epilog="Exit status: 0 on success, 1 if some folders could not be read, "
+               "2 on bad arguments or an unreadable FOLDER, 130 if interrupted.",
+    )
+    parser.add_argument("folder", help="folder to scan")
+    parser.add_argument("-f", "--format", choices=("text", "ndjson", "csv"), default="text",
+                        help="output format (default: text)")
+    parser.add_argument("-s", "--sort", choices=("size", "name", "none"), default="size",
+                        help="order of the output; 'none' streams entries as soon as they are "
+                             "sized (default: size, largest first)")
+    parser.add_argument("-n", "--top", type=int, metavar="N",
+                        help="only print the N largest entries")
+    parser.add_argument("-u", "--disk-usage", action="store_true",
+                        help="count the blocks allocated on disk instead of apparent sizes, and every "
+                             "hardlinked file only once, like du; reads every folder")
+    parser.add_argument("--exclude", dest="rules", action="append", default=[], metavar="PATTERN",
+                        help="skip the files and folders matching PATTERN, written like a line of "
+                             ".gitignore (e.g. node_modules/, /build, *.iso); may be repeated")
+    parser.add_argument("--include", dest="rules", action="append", type=lambda pattern: "!" + pattern,
+                        metavar="PATTERN",
+                        help="scan what PATTERN matches even if an earlier --exclude skipped it; "
+                             "the last matching pattern wins")
+    parser.add_argument("--exclude-from", action="append", default=[], metavar="FILE",
+                        help="read patterns from a .gitignore-style FILE, before those of "
+                             "--exclude and --include; may be repeated")
+    parser.add_argument("--count-excluded", action="store_true",
+                        help="after the listing, print the bytes skipped by the patterns, taking the "
+                             "excluded folders' totals from the size index instead of reading them")
+    parser.add_argument("--estimate", type=float, nargs="?", const=2.0, metavar="SECONDS",
+                        help="instead of scanning everything, estimate the size of every folder from "
+                             "random walks through its tree for about SECONDS (default: 2), printing the "
+                             "relative standard error of each estimate; not available with --format csv")
+    parser.add_argument("--trust-index", action="store_true",
+                        help="take folders whose modification time is unchanged from the size index "
+                             "instead of reading them; much faster on large trees, but misses files "
+                             "that grew or shrank in place")
+    parser.add_argument("--refresh", action="store_true",
+                        help="read every folder from disk, even with --trust-index")
+    parser.add_argument("--no-index", action="store_true",
+                        help="neither read nor update the persistent size index")
+    parser.add_argument("-j", "--workers", type=int, metavar="N",
+                        help="number of scan threads")
+    parser.add_argument("-x", "--one-file-system", action="store_true",
+                        help="do not enter folders on other file systems than FOLDER")
+    parser.add_argument("--device-workers", type=int, metavar="N",
+                        help="list at most N folders at once on any one device")
+    parser.add_argument("--device-limit", action="append", default=[], metavar="PATH=N",
+                        help="list at most N folders at once on the device holding PATH, "
+                             "e.g. 1 for a spinning disk; may be repeated")
+    parser.add_argument("--skip-mount", action="append", default=[], metavar="PATH",
+                        help="do not enter the file system mounted at PATH; may be repeated")
+    parser.add_argument("--mount-timeout", type=float, metavar="SECONDS",
+                        help="give up on a file system on which one folder takes longer than "
+                             "SECONDS to read, counting the rest of it as unreadable")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="write the scan's throughput, timings and slowest subtrees to FILE as JSON")
+    parser.add_argument("--report", type=int, nargs="?", const=ScanReport.TOP, metavar="N",
+                        help="after the listing, report the N largest files and folders and the bytes "
+                             f"per extension and per age, gathered in the same scan (default N: {ScanReport.TOP}); "
+                             "implies --refresh and is not available with --format csv")
+    parser.add_argument("--duplicates", action="store_true",
+                        help="instead of sizes, list the groups of identical files below FOLDER, "
+                             "those wasting the most space first")
+    parser.add_argument("--save-store", metavar="FILE",
+                        help="write the folder totals of the whole scanned tree to FILE as a "
+                             "snapshot that the app and --from-store can browse without rescanning")
+    parser.add_argument("--from-store", metavar="FILE",
+                        help="list the subfolders of FOLDER from a snapshot written by --save-store "
+                             "instead of scanning the disk")
+    parser.add_argument("--diff", metavar="OLD",
+                        help="instead of sizes, list the folders below FOLDER that grew the most since "
+                             "the snapshot OLD, comparing with a fresh scan or with --from-store "
+                             f"(default N for --top: {DIFF_TOP})")
+    parser.add_argument("--compare", metavar="OTHER",
+                        help="instead of sizes, list what differs between FOLDER (left) and the folder "
+                             "OTHER (right), comparing files by size and modification time")
+    parser.add_argument("--compare-contents", action="store_true",
+                        help="with --compare, compare files of the same size by hashing their contents")
+    return parser
+
+def _results_from_store(path, folder):
+    """Returns the subfolder rows and total of folder from a snapshot, or raises ValueError."""
+    with NodeStore.open(path) as store:
+        node = store.find(folder)
+        if node is None:
+            raise ValueError(f"{folder} is not in the snapshot of {store.root}")
+        results = [(name, size, True) for name, size, _, _ in store.listing(node)]
+        return results, store.sizes[node]
+
+def _changes(newer, older_path, folder, top):
+    """
+    Returns (path, older size, size) of the top folders below folder that grew
+    the most since the snapshot at older_path; raises OSError or ValueError.
+    """
+    with NodeStore.open(older_path) as older:
+        try:
+            changed = [(path, old_size, size) for path, old_size, size, _, _ in newer.diff(older, folder)
+                       if size != old_size]
+        except KeyError:
+            raise ValueError(f"{folder} is in neither snapshot") from None
+    return heapq.nlargest(top, changed, key=lambda r: (r[2] - r[1], r[0]))
+
+def _scan_rules(args):
+    """
+    Returns the ScanRules of the pattern options, or None; raises OSError for
+    an unreadable file, ValueError for an invalid pattern.
+    """
+    patterns = []
+    for path in args.exclude_from:
+        with open(path, encoding="utf-8") as f:
+            patterns.extend(f)
+    patterns.extend(args.rules)
+    return ScanRules(patterns) or None
+
+def _ordered(results, args):
+    if args.top is not None:
+        results = heapq.nlargest(args.top, results, key=lambda r: r[1])
+    if args.sort == "size":
+        results.sort(key=lambda r: (-r[1], natural_key(r[0])))
+    elif args.sort == "name":
+        results.sort(key=lambda r: natural_key(r[0]))
+    return results
+
+def _device_limits(specs):
+    """Parses PATH=N options into {path: N}; raises ValueError on a malformed one."""
+    limits = {}
+    for spec in specs:
+        path, sep, count = spec.rpartition("=")
+        if not sep or not path or not count.isdigit() or int(count) < 1:
+            raise ValueError(f"--device-limit expects PATH=N with N at least 1, not {spec!r}")
+        limits[path] = int(count)
+    return limits
+
+def _estimate(folder, args, rules, writer):
+    estimator = SizeEstimator(args.estimate, workers=args.workers, rules=rules)
+    try:
+        rows = estimator.estimate(folder)
+    except KeyboardInterrupt:
+        estimator.cancel()
+        return EXIT_INTERRUPTED
+    except OSError as e:
+        print(f"subfoldersize: cannot read {folder}: {e.strerror or e}", file=sys.stderr)
+        return EXIT_USAGE
+    # Folders the budget did not reach are ordered as empty.
+    unreached = {name for name, size, _, _ in rows if size is None}
+    ordered = _ordered([(name, size or 0, is_dir, error) for name, size, is_dir, error in rows], args)
+    for name, size, is_dir, error in ordered:
+        writer.estimate_row(name, None if name in unreached else size, is_dir, error)
+    if args.format == "text":
+        total = sum(size or 0 for _, size, _, _ in rows)
+        # The walks of different folders are independent, so their variances add up.
+        spread = math.sqrt(sum((size * error) ** 2 for _, size, _, error in rows if size and error))
+        known = not unreached and all(error is not None for _, _, _, error in rows)
+        writer.estimate_row("total", total, False, (spread / total if total else 0.0) if known else None)
+    return EXIT_OK
+
+def _find_duplicates(folder, writer):
+    if not os.path.isdir(folder):
+        print(f"subfoldersize: cannot read {folder}: not a folder", file=sys.stderr)
+        return EXIT_USAGE
+    finder = DuplicateFinder()
+    try:
+        groups = finder.find([folder])
+    except (KeyboardInterrupt, OperationCancelled):
+        finder.cancel()
+        return EXIT_INTERRUPTED
+    writer.duplicates(groups)
+    for path, message in finder.errors:
+        print(f"subfoldersize: cannot read {path}: {message}", file=sys.stderr)
+    return EXIT_PARTIAL if finder.errors else EXIT_OK
+
+def _compare(folder, other, args, rules, writer):
+    engine = TreeSync(workers=args.workers, contents=args.compare_contents, rules=rules)
+    try:
+        rows = engine.compare(folder, other)
+    except (KeyboardInterrupt, OperationCancelled):
+        engine.cancel()
+        return EXIT_INTERRUPTED
+    except OSError as e:
+        print(f"subfoldersize: cannot read {e.filename}: {e.strerror or e}", file=sys.stderr)
+        return EXIT_USAGE
+    writer.differences(rows, engine)
+    for path, message in engine.errors:
+        print(f"subfoldersize: cannot read {path}: {message}", file=sys.stderr)
+    return EXIT_PARTIAL if engine.errors else EXIT_OK
+
+def main(argv=None):
+    try:
+        status = _run(argv)
+        # Flushed here, so a reader that went away is noticed while it can be handled.
+        sys.stdout.flush()
+        return status
+    except BrokenPipeError:
+        # Python would complain again when it flushes stdout at exit.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return EXIT_BROKEN_PIPE
+
+def _run(argv):
+    args = build_parser().parse_args(argv)
+    if args.top is not None and args.top < 1:
+        print("subfoldersize: --top must be at least 1", file=sys.stderr)
+        return EXIT_USAGE
+    if args.report is not None and (args.report < 1 or args.format == "csv" or args.from_store
+                                    or args.diff):
+        print("subfoldersize: --report needs N of at least 1, a text or ndjson format and a scan",
+              file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.workers is not None and args.workers < 1:
+        print("subfoldersize: --workers must be at least 1", file=sys.stderr)
+        return EXIT_USAGE
+    if args.device_workers is not None and args.device_workers < 1:
+        print("subfoldersize: --device-workers must be at least 1", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        device_limits = _device_limits(args.device_limit)
+    except ValueError as e:
+        print(f"subfoldersize: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        rules = _scan_rules(args)
+    except OSError as e:
+        print(f"subfoldersize: cannot read {e.filename}: {e.strerror or e}", file=sys.stderr)
+        return EXIT_USAGE
+    except ValueError as e:
+        print(f"subfoldersize: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if (rules or args.count_excluded) and (args.from_store or args.duplicates):
+        print("subfoldersize: --exclude, --include, --exclude-from and --count-excluded apply to scans only",
+              file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.estimate is not None and (args.estimate <= 0 or args.format == "csv" or args.from_store
+                                      or args.duplicates or args.diff or args.report is not None
+                                      or args.save_store or args.disk_usage):
+        print("subfoldersize: --estimate needs a positive time, a text or ndjson format and no other mode",
+              file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.compare_contents and not args.compare:
+        print("subfoldersize: --compare-contents needs --compare", file=sys.stderr)
+        return EXIT_USAGE
+    if args.compare and (args.from_store or args.duplicates or args.diff or args.estimate is not None
+                         or args.report is not None or args.save_store or args.disk_usage):
+        print("subfoldersize: --compare cannot be combined with another mode", file=sys.stderr)
+        return EXIT_USAGE
+
+    folder = os.path.normpath(args.folder)
+    writer = _Writer(args.format, folder, sys.stdout)
+    if args.compare:
+        return _compare(folder, os.path.normpath(args.compare), args, rules, writer)
+    if args.estimate is not None:
+        return _estimate(folder, args, rules, writer)
+    if args.diff and args.from_store:
+        try:
+            with NodeStore.open(args.from_store) as newer:
+                rows = _changes(newer, args.diff, folder, args.top or DIFF_TOP)
+        except (OSError, ValueError) as e:
+            print(f"subfoldersize: cannot compare snapshots: {getattr(e, 'strerror', None) or e}",
+                  file=sys.stderr)
+            return EXIT_USAGE
+        writer.changes(rows)
+        return EXIT_OK
+    if args.from_store:
+        try:
+            results, total = _results_from_store(args.from_store, folder)
+        except (OSError, ValueError) as e:
+            print(f"subfoldersize: cannot read {args.from_store}: {getattr(e, 'strerror', None) or e}",
+                  file=sys.stderr)
+            return EXIT_USAGE
+        writer.header()
+        for row in _ordered(results, args):
+            writer.row(*row)
+        writer.total(total)
+        return EXIT_OK
+
+    if args.duplicates:
+        return _find_duplicates(folder, writer)
+
+    index = None if args.no_index else SizeIndex.open_default()
+    # The report needs the files of every folder, so none is served from the index.
+    refresh = args.refresh or args.report is not None
+    engine = ScanEngine(workers=args.workers, index=index, refresh=refresh, report_top=args.report,
+                        one_filesystem=args.one_file_system, device_workers=args.device_workers,
+                        device_limits=device_limits, skip_mounts=args.skip_mount,
+                        mount_timeout=args.mount_timeout, allocated=args.disk_usage, rules=rules,
+                        count_excluded=args.count_excluded, trust_index=args.trust_index)
+    # Entries can only be streamed when they need no ordering or selection.
+    streaming = args.sort == "none" and args.top is None and not args.diff
+
+    def on_entry(name, size, is_dir):
+        # Called on the scan workers, which a closed pipe must not end one by one.
+        try:
+            writer.row(name, size, is_dir)
+        except BrokenPipeError:
+            engine.cancel()
+
+    if not args.diff:
+        writer.header()
+    try:
+        results = engine.scan(folder, on_entry if streaming else None)
+    except KeyboardInterrupt:
+        engine.cancel()
+        return EXIT_INTERRUPTED
+    except ScanCancelled:
+        # Only on_entry cancels the scan.
+        raise BrokenPipeError(errno.EPIPE, os.strerror(errno.EPIPE)) from None
+    except OSError as e:
+        print(f"subfoldersize: cannot read {folder}: {e.strerror or e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.diff:
+        try:
+            rows = _changes(NodeStore.from_tree(engine.tree, folder), args.diff, folder,
+                            args.top or DIFF_TOP)
+        except (OSError, ValueError) as e:
+            print(f"subfoldersize: cannot compare with {args.diff}: {getattr(e, 'strerror', None) or e}",
+                  file=sys.stderr)
+            return EXIT_USAGE
+        writer.changes(rows)
+    elif not streaming:
+        for row in _ordered(results, args):
+            writer.row(*row)
+    if not args.diff:
+        writer.total(engine.tree.get(folder).total_size)
+    if args.count_excluded and rules is not None:
+        writer.excluded(engine)
+    if engine.report is not None:
+        writer.report(engine.report)
+
+    for path, message in engine.errors:
+        print(f"subfoldersize: cannot read {path}: {message}", file=sys.stderr)
+    if args.save_store:
+        try:
+            NodeStore.from_tree(engine.tree, folder).save(args.save_store)
+        except OSError as e:
+            print(f"subfoldersize: cannot write {args.save_store}: {e.strerror or e}", file=sys.stderr)
+            return EXIT_USAGE
+    if args.profile:
+        try:
+            with open(args.profile, "w", encoding="utf-8") as f:
+                json.dump(engine.stats.as_dict(), f, indent=2)
+        except OSError as e:
+            print(f"subfoldersize: cannot write {args.profile}: {e.strerror or e}", file=sys.stderr)
+            return EXIT_USAGE
+    return EXIT_PARTIAL if engine.errors else EXIT_OK
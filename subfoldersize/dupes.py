@@ -0,0 +1,221 @@
+"""Finding duplicate files with as little reading as possible."""
+
+import hashlib
+import mmap
+import os
+import threading
+
+from .fileops import OperationCancelled, ProgressCounter
+from .util import entry_is_dir, worker_count
+
+HASH_CHUNK = 8 * 1024 * 1024
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=32)
+
+def hash_file(path, chunk_size=HASH_CHUNK):
+    """Returns (path, digest of the whole file), or (path, None) if it cannot be read."""
+    digest = _new_hash()
+    try:
+        with open(path, "rb") as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                mapped = None
+            if mapped is None:
+                while chunk := f.read(chunk_size):
+                    digest.update(chunk)
+            else:
+                with mapped:
+                    if hasattr(mapped, "madvise"):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    with memoryview(mapped) as view:
+                        for offset in range(0, len(view), chunk_size):
+                            digest.update(view[offset:offset + chunk_size])
+    except OSError:
+        return path, None
+    return path, digest.digest()
+
+class DuplicateFinder:
+    """
+    Finds files with identical contents below one or more folders, by size, then
+    by a hash of their head and tail, then by a full hash.
+    """
+    HEAD_TAIL = 4096
+    STAGES = ("listing", "head and tail", "contents")
+
+    def __init__(self, workers=None, processes=None, min_size=1):
+        self.workers = worker_count(workers, min(16, (os.cpu_count() or 1) * 2))
+        self.processes = worker_count(processes, min(8, os.cpu_count() or 1))
+        self.min_size = max(1, min_size)
+        self.files = 0  # Regular files of at least min_size seen while listing
+        self.hardlinks = 0  # Of which were further links to an inode already seen
+        self.bytes_read = 0
+        self.errors = []  # (path, message) for folders and files that could not be read
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Asks a running search to stop as soon as possible."""
+        self._cancelled.set()
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise OperationCancelled()
+
+    def find(self, roots, on_progress=None):
+        """
+        Returns the groups of identical files below roots as (size, paths)
+        tuples, most wasted bytes first. on_progress(stage, done, total) reports
+        the stages. Raises OperationCancelled if cancel() was called.
+        """
+        def progress(stage, total):
+            if on_progress is None:
+                return ProgressCounter(total)
+            return ProgressCounter(total, lambda done, total: on_progress(stage, done, total))
+
+        by_size = self._list(roots, progress)
+        candidates = [(size, paths) for size, paths in by_size.items() if len(paths) > 1]
+        del by_size
+        groups, settled = self._hash_heads_and_tails(candidates, progress)
+        settled.extend(self._hash_contents(groups, progress))
+        duplicates = [(size, sorted(paths)) for size, paths in settled if len(paths) > 1]
+        duplicates.sort(key=lambda group: (-group[0] * (len(group[1]) - 1), group[1]))
+        return duplicates
+
+    def _list(self, roots, progress):
+        """Walks roots and returns {size: [paths]} of the files that are not hardlinks seen before."""
+        roots = sorted({os.path.normpath(root) for root in roots})
+        # A root inside another root would only be walked twice.
+        roots = [root for root in roots
+                 if not any(root.startswith(os.path.join(other, "")) for other in roots if other != root)]
+        counter = progress(self.STAGES[0], 0)
+        by_size = {}
+        inodes = set()
+        pending = list(roots)
+        while pending:
+            self._check_cancelled()
+            folder = pending.pop()
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if entry_is_dir(entry):
+                            pending.append(entry.path)
+                            continue
+                        try:
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if st.st_size < self.min_size:
+                            continue
+                        self.files += 1
+                        if st.st_nlink > 1:
+                            inode = (st.st_dev, st.st_ino)
+                            if inode in inodes:
+                                self.hardlinks += 1
+                                continue
+                            inodes.add(inode)
+                        by_size.setdefault(st.st_size, []).append(entry.path)
+            except OSError as e:
+                self.errors.append((folder, e.strerror or str(e)))
+            # Folders found so far, as the total is only known at the end
+            counter.total = counter.done + 1 + len(pending)
+            counter.add(1)
+        counter.finish()
+        return by_size
+
+    def _head_and_tail(self, path, size):
+        """Returns the hash of the start and end of a file (of all of it if it is short), or None."""
+        digest = _new_hash()
+        try:
+            with open(path, "rb") as f:
+                if size <= 2 * self.HEAD_TAIL:
+                    digest.update(f.read())
+                else:
+                    digest.update(f.read(self.HEAD_TAIL))
+                    f.seek(-self.HEAD_TAIL, os.SEEK_END)
+                    digest.update(f.read(self.HEAD_TAIL))
+        except OSError as e:
+            self.errors.append((path, e.strerror or str(e)))
+            return None
+        return digest.digest()
+
+    def _hash_heads_and_tails(self, candidates, progress):
+        """
+        Splits every same-size group by head-and-tail hash. Returns the groups
+        that still need a full hash as (size, paths) and those already settled.
+        """
+        sizes = {path: size for size, paths in candidates for path in paths}
+        read = {path: min(size, 2 * self.HEAD_TAIL) for path, size in sizes.items()}
+        # Imported here rather than up front, as it takes longer than the rest of
+        # the package and only searches for duplicates need it.
+        import concurrent.futures
+
+        counter = progress(self.STAGES[1], sum(read.values()))
+        groups = {}
+
+        def task(path):
+            if self._cancelled.is_set():
+                return path, None
+            return path, self._head_and_tail(path, sizes[path])
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            for path, digest in executor.map(task, sizes):
+                counter.add(read[path])
+                if digest is not None:
+                    groups.setdefault((sizes[path], digest), []).append(path)
+        self._check_cancelled()
+        counter.finish()
+        self.bytes_read += counter.done
+        pending, settled = [], []
+        for (size, _), paths in groups.items():
+            if len(paths) > 1:
+                (settled if size <= 2 * self.HEAD_TAIL else pending).append((size, paths))
+        return pending, settled
+
+    def _hash_contents(self, groups, progress):
+        """Splits the remaining groups by full hash and returns them as (size, paths)."""
+        if not groups:
+            return []
+        import concurrent.futures
+        import multiprocessing
+
+        sizes = {path: size for size, paths in groups for path in paths}
+        counter = progress(self.STAGES[2], sum(sizes.values()))
+        by_digest = {}
+        remaining = dict(sizes)
+        # Worker processes are started fresh rather than forked from a process
+        # that may be running other threads.
+        context = multiprocessing.get_context("spawn")
+        try:
+            with concurrent.futures.ProcessPoolExecutor(min(self.processes, len(remaining)),
+                                                        mp_context=context) as executor:
+                self._collect_hashes(executor, remaining, counter, by_digest)
+        except concurrent.futures.BrokenExecutor:
+            # The worker processes could not be started, as in some frozen or
+            # sandboxed apps. hashlib releases the GIL, so threads do nearly as well.
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+                self._collect_hashes(executor, remaining, counter, by_digest)
+        counter.finish()
+        self.bytes_read += counter.done
+        return [(size, paths) for (size, _), paths in by_digest.items()]
+
+    def _collect_hashes(self, executor, remaining, counter, by_digest):
+        """Hashes the files of remaining {path: size} with executor, removing each one once done."""
+        import concurrent.futures
+
+        futures = [executor.submit(hash_file, path) for path in remaining]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                self._check_cancelled()
+                path, digest = future.result()
+                size = remaining.pop(path)
+                counter.add(size)
+                if digest is None:
+                    self.errors.append((path, "could not be read"))
+                else:
+                    by_digest.setdefault((size, digest), []).append(path)
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
@@ -0,0 +1,184 @@
+"""Quick size estimates of large folders within a time budget."""
+
+import math
+import os
+import random
+import threading
+import time
+
+from .util import entry_is_dir, entry_size, worker_count
+
+class SizeEstimator:
+    """
+    Estimates the total size of every entry directly inside a folder from random
+    walks through its tree, in about `budget` seconds.
+    """
+    SAMPLE_FILES = 16
+
+    def __init__(self, budget=2.0, workers=None, sample_files=SAMPLE_FILES, rules=None, seed=None):
+        self.budget = budget
+        self.workers = worker_count(workers, min(16, (os.cpu_count() or 1) * 2))
+        self.sample_files = sample_files
+        self.rules = rules or None
+        self.walks = 0
+        self.dirs_listed = 0
+        self._random = random.Random(seed)
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._root = None
+        self._listings = {}
+        self._sizes = {}  # path -> size of the files sampled so far
+        self._names = []
+        self._samples = []  # For each subfolder, [(estimate, exact)]
+
+    def cancel(self):
+        """Asks a running estimate to stop as soon as possible."""
+        self._cancelled.set()
+
+    def _size(self, entry):
+        size = self._sizes.get(entry.path)
+        if size is None:
+            size = self._sizes[entry.path] = entry_size(entry)
+        return size
+
+    def _list(self, path):
+        """Returns (estimated bytes of the files, whether they were all sized, subfolder paths) of a folder."""
+        listing = self._listings.get(path)
+        if listing is None:
+            listing = self._listings[path] = self._read(path)
+        files, file_bytes, subdirs = listing
+        if file_bytes is not None:
+            return file_bytes, True, subdirs
+        sample = self._random.sample(files, self.sample_files)
+        return sum(map(self._size, sample)) * len(files) / len(sample), False, subdirs
+
+    def _read(self, path):
+        """
+        Lists a folder, returning (file entries, bytes of the files if there
+        are few enough to size them all or else None, subfolder paths).
+        """
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            entries = []
+        if self.rules is not None:
+            prefix = self.rules.prefix(self._root, path)
+            entries = [entry for entry in entries
+                       if not self.rules.excludes(prefix + entry.name, entry_is_dir(entry))]
+        for entry in entries:
+            (subdirs if entry_is_dir(entry) else files).append(entry)
+        file_bytes = sum(map(entry_size, files)) if len(files) <= self.sample_files else None
+        with self._lock:
+            self.dirs_listed += 1
+        return files, file_bytes, [entry.path for entry in subdirs]
+
+    def _walk(self, path, deadline):
+        """
+        Returns (estimated total of the folder at path, whether it is exact)
+        from one random walk, or None if it was cut short by cancel() or the
+        deadline.
+        """
+        total = 0.0
+        weight = 1
+        exact = True
+        while True:
+            if self._cancelled.is_set() or time.perf_counter() >= deadline:
+                return None
+            file_bytes, sized, subdirs = self._list(path)
+            total += weight * file_bytes
+            exact = exact and sized and len(subdirs) <= 1
+            if not subdirs:
+                break
+            weight *= len(subdirs)
+            path = self._random.choice(subdirs)
+        return total, exact
+
+    def estimate(self, folder):
+        """
+        Returns (name, size, is_dir, error) for every entry directly inside
+        folder, where error is the relative standard error of size. Raises
+        OSError if folder cannot be listed.
+        """
+        started = time.perf_counter()
+        folder = os.path.normpath(folder)
+        self._root = folder
+        self._listings = {}
+        self._sizes = {}
+        with os.scandir(folder) as it:
+            entries = list(it)
+        if self.rules is not None:
+            prefix = self.rules.prefix(folder, folder)
+            entries = [entry for entry in entries
+                       if not self.rules.excludes(prefix + entry.name, entry_is_dir(entry))]
+        dirs = [entry for entry in entries if entry_is_dir(entry)]
+        with self._lock:
+            self._names = [entry.name for entry in dirs]
+            self._samples = [[] for _ in dirs]
+        results = [(entry.name, entry_size(entry), False, 0.0) for entry in entries if not entry_is_dir(entry)]
+        deadline = started + self.budget
+        done = [False] * len(dirs)
+        turn = [0]
+
+        def next_dir():
+            """Returns the index of the next subfolder to walk, or None once all of them are exact."""
+            with self._lock:
+                for _ in range(len(dirs)):
+                    index = turn[0]
+                    turn[0] = (index + 1) % len(dirs)
+                    if not done[index]:
+                        return index
+            return None
+
+        def worker():
+            while not self._cancelled.is_set() and time.perf_counter() < deadline:
+                index = next_dir()
+                if index is None:
+                    return
+                sample = self._walk(dirs[index].path, deadline)
+                if sample is None:
+                    return
+                with self._lock:
+                    self._samples[index].append(sample)
+                    self.walks += 1
+                    if sample[1]:
+                        done[index] = True
+
+        if dirs:
+            threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.workers, len(dirs)))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self._listings = {}
+        self._sizes = {}
+        return results + self.estimates()
+
+    def estimates(self):
+        """
+        Returns (name, size, True, error) for every subfolder from the walks
+        so far, as estimate() does; may be called from another thread while
+        it runs.
+        """
+        with self._lock:
+            samples = [(name, list(walks)) for name, walks in zip(self._names, self._samples)]
+        rows = []
+        for name, walks in samples:
+            if not walks:
+                rows.append((name, None, True, None))
+                continue
+            if any(exact for _, exact in walks):
+                rows.append((name, round(walks[0][0]), True, 0.0))
+                continue
+            sizes = [size for size, _ in walks]
+            mean = sum(sizes) / len(sizes)
+            if len(sizes) < 2:
+                error = None
+            elif mean:
+                variance = sum((size - mean) ** 2 for size in sizes) / (len(sizes) - 1)
+                error = math.sqrt(variance / len(sizes)) / mean
+            else:
+                error = 0.0
+            rows.append((name, round(mean), True, error))
+        return rows
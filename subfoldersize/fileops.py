@@ -0,0 +1,409 @@
+"""Moving and deleting files and folders with progress and cancellation."""
+
+import errno
+import os
+import queue
+import stat
+import sys
+import threading
+import time
+
+from .util import entry_is_dir, entry_size, worker_count
+
+class OperationCancelled(Exception):
+    """Raised by file operations that were cancelled before they completed."""
+
+class ProgressCounter:
+    """
+    Thread-safe byte counter shared by the workers of one file operation.
+    on_progress(done, total) is called at most every `interval` seconds, plus
+    once more from finish().
+    """
+    def __init__(self, total, on_progress=None, interval=0.1):
+        self.total = total
+        self.done = 0
+        self.on_progress = on_progress
+        self.interval = interval
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, amount):
+        with self._lock:
+            self.done += amount
+            now = time.monotonic()
+            if self.on_progress is None or now - self._last_report < self.interval:
+                return
+            self._last_report = now
+            done = self.done
+        self.on_progress(done, self.total)
+
+    def finish(self):
+        if self.on_progress is not None:
+            self.on_progress(self.done, self.total)
+
+class MoveEngine:
+    """
+    Moves files and folders into another folder: by renaming on the same device,
+    else by copying in parallel and then deleting the sources.
+    """
+    CHUNK_SIZE = 64 * 1024 * 1024
+    # Seconds two modification times may differ by and still count as equal,
+    # which covers the two-second resolution of FAT file systems.
+    MTIME_WINDOW = 2.0
+    PARTIAL_SUFFIX = ".partial"
+    # errnos with which a kernel-side copy declines a pair of files
+    KERNEL_COPY_UNSUPPORTED = {
+        errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF,
+        errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTSOCK, errno.EPERM,
+    }
+
+    def __init__(self, workers=None):
+        self.workers = worker_count(workers, min(8, (os.cpu_count() or 1) * 2))
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Asks a running move to stop after the chunks currently being copied."""
+        self._cancelled.set()
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise OperationCancelled()
+
+    def move(self, items, src_folder, dest_folder, on_progress=None):
+        """
+        Moves the named items from src_folder into dest_folder.
+        on_progress(bytes_copied, bytes_total) reports the cross-device copies.
+        Raises OperationCancelled if cancel() was called.
+        """
+        same_device = self._device(src_folder) == self._device(dest_folder)
+        pending = []
+        for name in items:
+            self._check_cancelled()
+            src = os.path.join(src_folder, name)
+            dest = os.path.join(dest_folder, name)
+            if not (same_device and self._rename_into(src, dest)):
+                pending.append((src, dest))
+        if pending:
+            self._copy_then_delete(pending, on_progress, check_existing=True)
+
+    def move_by_copy(self, items, src_folder, dest_folder, on_progress=None):
+        """
+        Moves the named items by copying and then deleting them, as move()
+        does across devices, even when a rename would do.
+        """
+        pending = [(os.path.join(src_folder, name), os.path.join(dest_folder, name)) for name in items]
+        if pending:
+            self._copy_then_delete(pending, on_progress, check_existing=True)
+
+    def copy(self, items, src_folder, dest_folder, on_progress=None):
+        """
+        Copies the named items, which may be paths relative to src_folder, into
+        the same place below dest_folder. Raises OperationCancelled if cancel()
+        was called.
+        """
+        pending = [(os.path.join(src_folder, name), os.path.join(dest_folder, name)) for name in items]
+        if pending:
+            self._copy_then_delete(pending, on_progress, check_existing=False, delete=False)
+
+    @staticmethod
+    def _device(path):
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            return None
+
+    def _rename_into(self, src, dest):
+        """
+        Moves src to dest by renaming, merging into an existing folder.
+        Returns False if the rename crossed a mount point after all.
+        """
+        stack = [(src, dest)]
+        merged_dirs = []
+        try:
+            while stack:
+                src, dest = stack.pop()
+                self._check_cancelled()
+                if not os.path.lexists(dest):
+                    os.rename(src, dest)
+                elif (os.path.isdir(dest) and not os.path.islink(dest)
+                      and os.path.isdir(src) and not os.path.islink(src)):
+                    merged_dirs.append(src)
+                    with os.scandir(src) as it:
+                        stack.extend((entry.path, os.path.join(dest, entry.name)) for entry in it)
+                else:
+                    os.replace(src, dest)
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                return False
+            raise
+        # Merged folders are empty now; remove the deepest ones first.
+        for path in reversed(merged_dirs):
+            os.rmdir(path)
+        return True
+
+    def _up_to_date(self, st, dest):
+        """Tells whether dest is a file of the size and modification time of stat result st."""
+        try:
+            dest_st = os.stat(dest, follow_symlinks=False)
+        except OSError:
+            return False
+        return (stat.S_ISREG(dest_st.st_mode) and dest_st.st_size == st.st_size
+                and abs(dest_st.st_mtime - st.st_mtime) <= self.MTIME_WINDOW)
+
+    def _plan(self, src, dest, dirs, files, links, check_existing):
+        """
+        Collects the folders, symlinks and (src, dest, size, compare) files that
+        copying src to dest involves.
+        """
+        if os.path.islink(src):
+            links.append((src, dest))
+            return
+        if not os.path.isdir(src):
+            st = os.stat(src)
+            files.append((src, dest, st.st_size, check_existing and self._up_to_date(st, dest)))
+            return
+        dirs.append((src, dest))
+        stack = [(src, dest, check_existing and os.path.isdir(dest))]
+        while stack:
+            src_dir, dest_dir, existed = stack.pop()
+            with os.scandir(src_dir) as it:
+                for entry in it:
+                    target = os.path.join(dest_dir, entry.name)
+                    if entry.is_symlink():
+                        links.append((entry.path, target))
+                    elif entry.is_dir(follow_symlinks=False):
+                        dirs.append((entry.path, target))
+                        stack.append((entry.path, target, existed and os.path.isdir(target)))
+                    else:
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, target, st.st_size, existed and self._up_to_date(st, target)))
+
+    def _copy_then_delete(self, items, on_progress, check_existing, delete=True):
+        # Imported here rather than up front, as together they take longer to
+        # import than the rest of the package and only copies need them.
+        import concurrent.futures
+        import shutil
+
+        dirs, files, links = [], [], []
+        for src, dest in items:
+            self._plan(src, dest, dirs, files, links, check_existing)
+        progress = ProgressCounter(sum(file[2] for file in files), on_progress)
+
+        for _, dest in dirs:
+            os.makedirs(dest, exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            futures = [pool.submit(self._copy_file, *file, progress) for file in files]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            except BaseException:
+                self._cancelled.set()
+                raise
+        for src, dest in links:
+            if os.path.lexists(dest):
+                os.remove(dest)
+            os.symlink(os.readlink(src), dest)
+        # Folder timestamps last, since filling a folder updates its mtime.
+        for src, dest in reversed(dirs):
+            shutil.copystat(src, dest)
+        progress.finish()
+
+        if not delete:
+            return
+        for src, _ in items:
+            if os.path.isdir(src) and not os.path.islink(src):
+                shutil.rmtree(src)
+            else:
+                os.remove(src)
+
+    def _copy_file(self, src, dest, size, compare, progress):
+        """
+        Copies one file of the planned size, unless compare is set and dest
+        already holds the same bytes. Raises OSError if a different number
+        of bytes was copied, so the source is never deleted after a short copy.
+        """
+        import shutil
+        import tempfile
+
+        self._check_cancelled()
+        if compare and self._same_contents(src, dest):
+            progress.add(size)
+            return
+        # A unique name, so copies of dest and of a sibling named like its
+        # temporary file cannot write to the same one.
+        fd, partial = tempfile.mkstemp(self.PARTIAL_SUFFIX, "." + os.path.basename(dest) + ".",
+                                       os.path.dirname(dest))
+        try:
+            # Unbuffered, so the kernel copies and the fallback loop share one
+            # file offset per descriptor. The temporary file first, so its
+            # descriptor is closed even if src cannot be opened.
+            with open(fd, "wb", buffering=0) as fdst, open(src, "rb", buffering=0) as fsrc:
+                copied = self._copy_data(fsrc, fdst, progress)
+            if copied != size:
+                raise OSError(errno.EIO, f"copied {copied:,} of {size:,} bytes", src)
+            shutil.copystat(src, partial)
+            os.replace(partial, dest)
+        except BaseException:
+            # Do not leave a truncated copy behind.
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            raise
+
+    def _same_contents(self, src, dest):
+        """Tells whether two files hold the same bytes, reading both until they differ."""
+        try:
+            with open(src, "rb") as fsrc, open(dest, "rb") as fdst:
+                while True:
+                    self._check_cancelled()
+                    chunk = fsrc.read(1024 * 1024)
+                    if chunk != fdst.read(1024 * 1024):
+                        return False
+                    if not chunk:
+                        return True
+        except OSError:
+            return False
+
+    def _copy_data(self, fsrc, fdst, progress):
+        """
+        Copies between two open files, preferring copies done inside the
+        kernel, and returns the number of bytes copied.
+        """
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        total = 0
+        kernel_copies = []
+        if hasattr(os, "copy_file_range"):
+            kernel_copies.append(lambda: os.copy_file_range(infd, outfd, self.CHUNK_SIZE))
+        if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+            kernel_copies.append(lambda: os.sendfile(outfd, infd, None, self.CHUNK_SIZE))
+        for kernel_copy in kernel_copies:
+            try:
+                # Both calls advance the file offsets, so a fallback picks up
+                # exactly where the previous method stopped.
+                while True:
+                    copied = kernel_copy()
+                    if not copied:
+                        break
+                    total += copied
+                    progress.add(copied)
+                    self._check_cancelled()
+                # Some file systems, such as FUSE and procfs, answer 0 to a
+                # call they do not support; only a later 0 is the end of the
+                # file.
+                if total:
+                    return total
+            except OSError as e:
+                if e.errno not in self.KERNEL_COPY_UNSUPPORTED:
+                    raise
+        buffer = bytearray(1024 * 1024)
+        view = memoryview(buffer)
+        while True:
+            read = fsrc.readinto(buffer)
+            if not read:
+                return total
+            written = 0
+            while written < read:
+                written += fdst.write(view[written:read])
+            total += read
+            progress.add(read)
+            self._check_cancelled()
+
+class DeleteEngine:
+    """Deletes files and folder trees with a pool of worker threads, collecting failures in self.errors."""
+    def __init__(self, workers=None):
+        self.workers = worker_count(workers, min(16, (os.cpu_count() or 1) * 4))
+        self._cancelled = threading.Event()
+        self.errors = []  # (path, message) for everything that could not be deleted
+
+    def cancel(self):
+        """Asks a running delete to stop; what has been deleted so far stays deleted."""
+        self._cancelled.set()
+
+    def delete(self, paths, on_progress=None, expected_bytes=0):
+        """
+        Deletes the given files and folders and returns {path: (bytes_freed,
+        removed)}. on_progress(bytes_freed, expected_bytes) is called from the
+        worker threads.
+        """
+        progress = ProgressCounter(expected_bytes, on_progress)
+        freed = [0] * len(paths)
+        removed = [False] * len(paths)
+        lock = threading.Lock()
+        work = queue.Queue()
+
+        def unlink(path, size, group):
+            try:
+                os.unlink(path)
+            except OSError as e:
+                self.errors.append((path, e.strerror or str(e)))
+                return False
+            with lock:
+                freed[group] += size
+            progress.add(size)
+            return True
+
+        def release(node):
+            # node is [outstanding tasks, path, parent node, group]. Once its own
+            # listing and every subfolder are done the folder itself goes.
+            while node is not None:
+                with lock:
+                    node[0] -= 1
+                    if node[0]:
+                        return
+                path, parent, group = node[1], node[2], node[3]
+                if not self._cancelled.is_set():
+                    try:
+                        os.rmdir(path)
+                        if parent is None:
+                            removed[group] = True
+                    except OSError as e:
+                        self.errors.append((path, e.strerror or str(e)))
+                node = parent
+
+        def worker():
+            while True:
+                node = work.get()
+                if node is None:
+                    return
+                if not self._cancelled.is_set():
+                    subdirs = []
+                    try:
+                        with os.scandir(node[1]) as it:
+                            for entry in it:
+                                if self._cancelled.is_set():
+                                    break
+                                if entry_is_dir(entry):
+                                    subdirs.append(entry.path)
+                                else:
+                                    unlink(entry.path, entry_size(entry), node[3])
+                    except OSError as e:
+                        self.errors.append((node[1], e.strerror or str(e)))
+                    with lock:
+                        node[0] += len(subdirs)
+                    for path in subdirs:
+                        work.put([1, path, node, node[3]])
+                release(node)
+                work.task_done()
+
+        for group, path in enumerate(paths):
+            if os.path.isdir(path) and not os.path.islink(path):
+                work.put([1, path, None, group])
+            else:
+                try:
+                    size = os.lstat(path).st_size
+                except OSError:
+                    size = 0
+                removed[group] = unlink(path, size, group)
+
+        if not work.empty():
+            threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+            for thread in threads:
+                thread.start()
+            work.join()
+            for _ in threads:
+                work.put(None)
+            for thread in threads:
+                thread.join()
+        progress.finish()
+        return {path: (freed[group], removed[group]) for group, path in enumerate(paths)}
@@ -0,0 +1,96 @@
+"""Persistent per-directory size index."""
+
+import os
+import sqlite3
+import sys
+import threading
+
+def user_cache_dir():
+    """Returns the per-user cache directory for SubfolderSize."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "SubfolderSize")
+
+class SizeIndex:
+    """
+    Persistent SQLite index of per-directory sizes, keyed by (st_dev, st_ino)
+    and stamped with the directory's st_mtime_ns.
+    """
+    SCHEMA_VERSION = 2
+    _default = None
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS dirs")
+                conn.execute(
+                    "CREATE TABLE dirs ("
+                    " dev INTEGER NOT NULL,"
+                    " ino INTEGER NOT NULL,"
+                    " mtime_ns INTEGER NOT NULL,"
+                    " own_size INTEGER NOT NULL,"
+                    " total_size INTEGER NOT NULL,"
+                    " subdirs TEXT NOT NULL,"
+                    " file_count INTEGER NOT NULL,"
+                    " PRIMARY KEY (dev, ino))"
+                )
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    @classmethod
+    def open_default(cls):
+        """
+        Returns the shared index in the user cache directory, opening it on first use.
+        Returns None if the cache directory cannot be used.
+        """
+        if cls._default is None:
+            try:
+                cache_dir = user_cache_dir()
+                os.makedirs(cache_dir, exist_ok=True)
+                cls._default = cls(os.path.join(cache_dir, "index.sqlite3"))
+            except (OSError, sqlite3.Error):
+                return None
+        return cls._default
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads, so every scan
+        # worker gets its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, dev, ino):
+        """Returns (mtime_ns, own_size, total_size, subdir_names, file_count) for a directory, or None."""
+        try:
+            row = self._connection().execute(
+                "SELECT mtime_ns, own_size, total_size, subdirs, file_count FROM dirs WHERE dev = ? AND ino = ?",
+                (dev, ino),
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        mtime_ns, own_size, total_size, subdirs, file_count = row
+        return mtime_ns, own_size, total_size, subdirs.split("\0") if subdirs else [], file_count
+
+    def store(self, rows):
+        """Writes (dev, ino, mtime_ns, own_size, total_size, subdir_names, file_count) rows in one transaction."""
+        try:
+            with self._connection() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((dev, ino, mtime_ns, own, total, "\0".join(subdirs), file_count)
+                     for dev, ino, mtime_ns, own, total, subdirs, file_count in rows),
+                )
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,93 @@
+"""Compact set of (device, inode) pairs for counting hardlinked files once."""
+
+import array
+import threading
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+class InodeSet:
+    """
+    Set of (st_dev, st_ino) pairs in flat integer hash tables, one per device;
+    safe to use from several threads.
+    """
+    INITIAL_BITS = 10
+    MAX_LOAD = 0.6
+
+    def __init__(self):
+        self._tables = {}  # dev -> [array of inode numbers, entries, bits]
+        self._zero = set()  # Devices on which inode 0 was added
+        self._lock = threading.Lock()
+
+    def add(self, dev, ino):
+        """Adds the pair and returns True, or returns False if it was already in the set."""
+        with self._lock:
+            if ino == 0:
+                if dev in self._zero:
+                    return False
+                self._zero.add(dev)
+                return True
+            table = self._tables.get(dev)
+            if table is None:
+                table = self._tables[dev] = [array.array("Q", bytes(8 << self.INITIAL_BITS)), 0,
+                                             self.INITIAL_BITS]
+            slots, entries, bits = table
+            mask = len(slots) - 1
+            slot = ((ino * _GOLDEN) & _MASK64) >> (64 - bits)
+            while True:
+                current = slots[slot]
+                if current == ino:
+                    return False
+                if current == 0:
+                    break
+                slot = (slot + 1) & mask
+            slots[slot] = ino
+            table[1] = entries + 1
+            if table[1] > self.MAX_LOAD * len(slots):
+                self._grow(table)
+            return True
+
+    def __contains__(self, pair):
+        dev, ino = pair
+        with self._lock:
+            if ino == 0:
+                return dev in self._zero
+            table = self._tables.get(dev)
+            if table is None:
+                return False
+            slots, _, bits = table
+            mask = len(slots) - 1
+            slot = ((ino * _GOLDEN) & _MASK64) >> (64 - bits)
+            while True:
+                current = slots[slot]
+                if current == ino:
+                    return True
+                if current == 0:
+                    return False
+                slot = (slot + 1) & mask
+
+    @staticmethod
+    def _grow(table):
+        old, entries, bits = table
+        bits += 1
+        slots = array.array("Q", bytes(8 << bits))
+        mask = len(slots) - 1
+        shift = 64 - bits
+        for ino in old:
+            if ino:
+                slot = ((ino * _GOLDEN) & _MASK64) >> shift
+                while slots[slot]:
+                    slot = (slot + 1) & mask
+                slots[slot] = ino
+        table[0] = slots
+        table[2] = bits
+
+    def __len__(self):
+        with self._lock:
+            return sum(table[1] for table in self._tables.values()) + len(self._zero)
+
+    @property
+    def nbytes(self):
+        """Bytes taken by the hash tables."""
+        with self._lock:
+            return sum(len(table[0]) * 8 for table in self._tables.values())
@@ -0,0 +1,235 @@
+"""Memory-mappable snapshots of scanned directory totals."""
+
+import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+class NodeStore:
+    """
+    Snapshot of the directory totals of a scanned tree in parallel typed arrays,
+    numbered breadth-first, that save() writes and open() maps back.
+    """
+    MAGIC = b"SFSNODES"
+    VERSION = 2
+    # magic, version, flags, root path length, node count, name blob size
+    HEADER = struct.Struct("<8sHHIQQ")
+    FLAG_LITTLE_ENDIAN = 1
+    SUFFIX = ".sfsnodes"
+
+    def __init__(self, root, parents, sizes, file_counts, name_offsets, names, names_base=0, mapping=None):
+        self.root = root
+        self.parents = parents  # Parent node of every node, -1 for the root
+        self.sizes = sizes  # Aggregate bytes
+        self.file_counts = file_counts  # Files in the whole subtree
+        self.name_offsets = name_offsets
+        self._names = names  # bytes, or the mapped file with the blob at names_base
+        self._names_base = names_base
+        self._mapping = mapping
+        self._views = []
+
+    @classmethod
+    def from_tree(cls, tree, root):
+        """
+        Builds a store from the directories of a SizeTree below root, which must
+        be in the tree. Raises KeyError otherwise.
+        """
+        root = os.path.normpath(root)
+        parents = array.array("i")
+        sizes = array.array("Q")
+        file_counts = array.array("I")
+        name_offsets = array.array("Q")
+        blob = bytearray()
+        interned = {}
+        with tree.lock:
+            if tree.get(root) is None:
+                raise KeyError(root)
+            # Breadth-first, so that every node's children end up next to each other.
+            pending = [(root, -1, "")]
+            index = 0
+            while index < len(pending):
+                path, parent, name = pending[index]
+                pending[index] = None
+                record = tree.get(path)
+                offset = interned.get(name)
+                if offset is None:
+                    offset = interned[name] = len(blob)
+                    blob += os.fsencode(name) + b"\0"
+                parents.append(parent)
+                sizes.append(max(record.total_size, 0))
+                file_counts.append(record.file_count)
+                name_offsets.append(offset)
+                for child in sorted(record.subdirs, key=os.fsencode):
+                    child_path = os.path.join(path, child)
+                    if tree.get(child_path) is not None:
+                        pending.append((child_path, index, child))
+                index += 1
+        # Roll the files of every directory up into its ancestors, children first.
+        for node in range(len(parents) - 1, 0, -1):
+            file_counts[parents[node]] += file_counts[node]
+        return cls(root, parents, sizes, file_counts, name_offsets, bytes(blob))
+
+    @classmethod
+    def open(cls, path):
+        """Maps a store written by save(). Raises ValueError if the file is not one."""
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, flags, root_length, count, blob_size = cls.HEADER.unpack_from(mapping, 0)
+        except struct.error:
+            mapping.close()
+            raise ValueError(f"{path} is not a size snapshot") from None
+        if magic != cls.MAGIC or version != cls.VERSION:
+            mapping.close()
+            raise ValueError(f"{path} is not a size snapshot of this version")
+        if bool(flags & cls.FLAG_LITTLE_ENDIAN) != (sys.byteorder == "little"):
+            mapping.close()
+            raise ValueError(f"{path} was written on a machine with a different byte order")
+        offset = cls.HEADER.size
+        root = os.fsdecode(mapping[offset:offset + root_length])
+        offset = cls._aligned(offset + root_length)
+        if offset + 24 * count + blob_size > len(mapping):
+            mapping.close()
+            raise ValueError(f"{path} is truncated")
+        view = memoryview(mapping)
+        columns = []
+        for typecode, width in (("Q", 8), ("Q", 8), ("i", 4), ("I", 4)):
+            columns.append(view[offset:offset + width * count].cast(typecode))
+            offset += width * count
+        sizes, name_offsets, parents, file_counts = columns
+        store = cls(root, parents, sizes, file_counts, name_offsets, mapping, offset, mapping)
+        store._views = [view] + columns
+        return store
+
+    @staticmethod
+    def _aligned(offset):
+        return (offset + 7) & ~7
+
+    def save(self, path):
+        """Writes the store to path, replacing it only once the new file is complete."""
+        root = os.fsencode(self.root)
+        names = self._names[self._names_base:] if self._names_base else self._names
+        flags = self.FLAG_LITTLE_ENDIAN if sys.byteorder == "little" else 0
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, flags, len(root), len(self), len(names))
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            f.write(root)
+            f.write(bytes(self._aligned(len(header) + len(root)) - len(header) - len(root)))
+            # The 8-byte columns go first so every column stays aligned.
+            for column in (self.sizes, self.name_offsets, self.parents, self.file_counts):
+                f.write(memoryview(column).cast("B"))
+            f.write(names)
+        os.replace(temp_path, path)
+
+    def close(self):
+        """Unmaps a store returned by open(); it cannot be used afterwards."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.parents)
+
+    @property
+    def nbytes(self):
+        """Bytes taken by the arrays and the name blob."""
+        return 24 * len(self) + len(self._names) - self._names_base
+
+    def _name_bytes(self, node):
+        start = self._names_base + self.name_offsets[node]
+        return self._names[start:self._names.find(b"\0", start)]
+
+    def name(self, node):
+        return os.fsdecode(self._name_bytes(node))
+
+    def children(self, node):
+        """Returns the range of node numbers of the subdirectories of node."""
+        first = bisect.bisect_left(self.parents, node, node + 1)
+        return range(first, bisect.bisect_right(self.parents, node, first))
+
+    def listing(self, node):
+        """Returns (name, aggregate size, file count, node) for every subdirectory of node."""
+        sizes, file_counts = self.sizes, self.file_counts
+        return [(self.name(child), sizes[child], file_counts[child], child) for child in self.children(node)]
+
+    def own_files(self, node):
+        """Returns (bytes, count) of the files directly inside node."""
+        children = self.children(node)
+        size = self.sizes[node] - sum(self.sizes[child] for child in children)
+        count = self.file_counts[node] - sum(self.file_counts[child] for child in children)
+        return size, count
+
+    def find(self, path):
+        """Returns the node of the directory at path, or None if it is not in the store."""
+        relative = os.path.relpath(os.path.normpath(path), self.root)
+        if relative == os.curdir:
+            return 0
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            return None
+        node = 0
+        for part in relative.split(os.sep):
+            wanted = os.fsencode(part)
+            for child in self.children(node):
+                if self._name_bytes(child) == wanted:
+                    node = child
+                    break
+            else:
+                return None
+        return node
+
+    def path(self, node):
+        """Returns the full path of node."""
+        parts = []
+        while node > 0:
+            parts.append(self.name(node))
+            node = self.parents[node]
+        return os.path.join(self.root, *reversed(parts))
+
+    def diff(self, older, path=None):
+        """
+        Yields (path, older size, size, older file count, file count) for the
+        directory at path and every directory below it in either store. Raises
+        KeyError if path is in neither store.
+        """
+        path = os.path.normpath(path or self.root)
+        stack = [(path, older.find(path), self.find(path))]
+        if stack[0][1] is None and stack[0][2] is None:
+            raise KeyError(path)
+        while stack:
+            path, old, new = stack.pop()
+            yield (
+                path,
+                older.sizes[old] if old is not None else 0,
+                self.sizes[new] if new is not None else 0,
+                older.file_counts[old] if old is not None else 0,
+                self.file_counts[new] if new is not None else 0,
+            )
+            if old is None or new is None:
+                continue
+            old_children, new_children = older.children(old), self.children(new)
+            old_names = [older._name_bytes(child) for child in old_children]
+            new_names = [self._name_bytes(child) for child in new_children]
+            i = j = 0
+            while i < len(old_names) or j < len(new_names):
+                if j == len(new_names) or (i < len(old_names) and old_names[i] < new_names[j]):
+                    stack.append((os.path.join(path, os.fsdecode(old_names[i])), old_children[i], None))
+                    i += 1
+                elif i == len(old_names) or new_names[j] < old_names[i]:
+                    stack.append((os.path.join(path, os.fsdecode(new_names[j])), None, new_children[j]))
+                    j += 1
+                else:
+                    stack.append((os.path.join(path, os.fsdecode(new_names[j])), old_children[i], new_children[j]))
+                    i += 1
+                    j += 1
@@ -0,0 +1,165 @@
+"""Largest files and folders and byte histograms gathered during a scan."""
+
+import bisect
+import heapq
+import operator
+import threading
+import time
+
+from .util import format_size
+
+_first = operator.itemgetter(0)
+
+class ScanReport:
+    """
+    Largest files and folders and byte histograms of a scanned folder, filled
+    from the scan's listings; safe to fill from several workers. coverage()
+    tells how much of the total was listed.
+    """
+    TOP = 10
+    # (label, upper age limit in seconds); files modified in the future count as new
+    AGE_BUCKETS = (
+        ("Last day", 86400),
+        ("Last week", 7 * 86400),
+        ("Last month", 30 * 86400),
+        ("Last year", 365 * 86400),
+        ("Older", float("inf")),
+    )
+    NO_EXTENSION = "(none)"
+
+    def __init__(self, top=TOP, now=None):
+        self.top = top
+        self.now = time.time() if now is None else now
+        self.total_bytes = None  # Set by finish()
+        self.covered_bytes = 0
+        self.covered_files = 0
+        self._files = []  # Min-heap of (size, path)
+        self._dirs = []  # (total size, path) of the largest folders, set by finish()
+        self._extensions = {}  # lowercase extension -> [bytes, files]
+        self._age_limits = [limit for _, limit in self.AGE_BUCKETS]
+        self._age_bytes = [0] * len(self.AGE_BUCKETS)
+        self._age_files = [0] * len(self.AGE_BUCKETS)
+        self._lock = threading.Lock()
+
+    def add_entries(self, folder, entries):
+        """Accounts for the file DirEntries listed directly inside folder."""
+        now = self.now
+        age_limits = self._age_limits
+        extensions = {}
+        age_bytes = [0] * len(age_limits)
+        age_files = [0] * len(age_limits)
+        sized = []
+        own = 0
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            size = st.st_size
+            own += size
+            sized.append((size, entry))
+            # Same as os.path.splitext: a leading dot starts a name, not an extension.
+            name = entry.name
+            dot = name.rfind(".")
+            extension = name[dot:].lower() if dot > 0 and dot < len(name) - 1 else self.NO_EXTENSION
+            counts = extensions.get(extension)
+            if counts is None:
+                extensions[extension] = [size, 1]
+            else:
+                counts[0] += size
+                counts[1] += 1
+            bucket = bisect.bisect_left(age_limits, now - st.st_mtime)
+            age_bytes[bucket] += size
+            age_files[bucket] += 1
+        largest = [(size, entry.path) for size, entry in heapq.nlargest(self.top, sized, key=_first)]
+        with self._lock:
+            self.covered_bytes += own
+            self.covered_files += len(sized)
+            for item in largest:
+                self._push(self._files, item)
+            for extension, (size, count) in extensions.items():
+                counts = self._extensions.get(extension)
+                if counts is None:
+                    self._extensions[extension] = [size, count]
+                else:
+                    counts[0] += size
+                    counts[1] += count
+            for bucket in range(len(age_limits)):
+                self._age_bytes[bucket] += age_bytes[bucket]
+                self._age_files[bucket] += age_files[bucket]
+
+    def _push(self, heap, item):
+        if len(heap) < self.top:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def finish(self, total_bytes, dirs=()):
+        """Records the scanned total and keeps the largest of the (total size, path) folders in dirs."""
+        largest = heapq.nlargest(self.top, dirs, key=_first)
+        with self._lock:
+            self.total_bytes = total_bytes
+            self._dirs = largest
+
+    def coverage(self):
+        """Returns the fraction of the scanned bytes whose files the report saw."""
+        if not self.total_bytes:
+            return 1.0
+        return min(1.0, self.covered_bytes / self.total_bytes)
+
+    def largest_files(self):
+        """Returns (size, path) of the largest files, largest first."""
+        with self._lock:
+            return sorted(self._files, reverse=True)
+
+    def largest_dirs(self):
+        """Returns (total size, path) of the largest folders, largest first."""
+        with self._lock:
+            return sorted(self._dirs, reverse=True)
+
+    def extensions(self):
+        """Returns (extension, bytes, files) for every extension seen, most bytes first."""
+        with self._lock:
+            rows = [(extension, size, count) for extension, (size, count) in self._extensions.items()]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows
+
+    def ages(self):
+        """Returns (label, bytes, files) for every age bucket, newest first."""
+        with self._lock:
+            return [(label, size, count) for (label, _), size, count
+                    in zip(self.AGE_BUCKETS, self._age_bytes, self._age_files)]
+
+    def as_dict(self):
+        """The report, ready to be written as JSON."""
+        return {
+            "covered_bytes": self.covered_bytes,
+            "covered_files": self.covered_files,
+            "total_bytes": self.total_bytes,
+            "largest_files": [{"path": path, "bytes": size} for size, path in self.largest_files()],
+            "largest_dirs": [{"path": path, "bytes": size} for size, path in self.largest_dirs()],
+            "extensions": [{"extension": extension, "bytes": size, "files": count}
+                           for extension, size, count in self.extensions()],
+            "ages": [{"age": label, "bytes": size, "files": count} for label, size, count in self.ages()],
+        }
+
+    def lines(self, extensions=None):
+        """
+        Yields the report as lines of text, showing at most `extensions`
+        extensions (all of them if None).
+        """
+        if self.coverage() < 1.0:
+            yield (f"Covers {self.coverage():.0%} of {format_size(self.total_bytes)}; folders reused "
+                   "from the size index or an earlier scan were not listed.")
+        sections = (
+            ("Largest files", [(size, path) for size, path in self.largest_files()]),
+            ("Largest folders", [(size, path) for size, path in self.largest_dirs()]),
+            ("By extension", [(size, f"{extension}  ({count:,} files)")
+                              for extension, size, count in self.extensions()[:extensions]]),
+            ("By age", [(size, f"{label}  ({count:,} files)") for label, size, count in self.ages()]),
+        )
+        for title, rows in sections:
+            yield ""
+            yield f"{title}:"
+            for size, text in rows:
+                yield f"{format_size(size):>12}  {text}"
@@ -0,0 +1,150 @@
+"""Include and exclude rules in the syntax of .gitignore files."""
+
+import copy
+import os
+import re
+
+def _translate(pattern):
+    """Returns a regular expression for a glob pattern in the syntax of .gitignore, without anchors."""
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+                if pattern.startswith("**/", i):
+                    # Zero or more whole folders
+                    parts.append("(?:.*/)?")
+                    i += 3
+                    continue
+                if i + 2 == n:
+                    parts.append(".*")
+                    i += 2
+                    continue
+            parts.append("[^/]*")
+            while i + 1 < n and pattern[i + 1] == "*":
+                i += 1
+        elif c == "?":
+            parts.append("[^/]")
+        elif c == "[":
+            first = i + 2 if pattern.startswith(("[!", "[^"), i) else i + 1
+            # A ] right after the opening bracket is a member of the class, so
+            # "[]" and "[!]" open a class that is never closed and are literal.
+            end = pattern.find("]", first + 1)
+            if end < 0:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body[0] in "!^":
+                    body = "^" + body[1:]
+                parts.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return "".join(parts)
+
+class ScanRules:
+    """
+    Include and exclude rules for scans, written like the lines of a .gitignore
+    file. Raises ValueError for a pattern that cannot be compiled.
+    """
+    def __init__(self, patterns=()):
+        self.patterns = []
+        self.base = ""  # Path of the scanned folder relative to the one the rules are for
+        dirs, files = [], []
+        dir_negated, file_negated = [], []
+        for line in patterns:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            # Trailing spaces are ignored unless escaped with a backslash.
+            stripped = line.rstrip(" ")
+            if stripped.endswith("\\") and len(stripped) < len(line):
+                stripped += " "
+            negated = stripped.startswith("!")
+            pattern = stripped[1:] if negated else stripped
+            if pattern.startswith(("\\!", "\\#")):
+                pattern = pattern[1:]
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if not pattern:
+                continue
+            # A slash anywhere but at the end anchors the pattern to the scanned folder.
+            anchored = "/" in pattern
+            regex = _translate(pattern.lstrip("/"))
+            try:
+                re.compile(regex)
+            except re.error as e:
+                raise ValueError(f"invalid pattern {stripped!r}: {e}") from None
+            self.patterns.append(stripped)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            dirs.append(regex)
+            dir_negated.append(negated)
+            if not dir_only:
+                files.append(regex)
+                file_negated.append(negated)
+        self._dirs = self._compile(dirs)
+        self._files = self._compile(files)
+        # By group number, whether the rule matched includes the entry again
+        self._dir_negated = [None] + dir_negated[::-1]
+        self._file_negated = [None] + file_negated[::-1]
+
+    @staticmethod
+    def _compile(regexes):
+        if not regexes:
+            return None
+        # Alternatives are tried in order, so the last rule goes first.
+        return re.compile("|".join(f"({regex})" for regex in reversed(regexes)), re.DOTALL).fullmatch
+
+    @classmethod
+    def from_file(cls, path):
+        """Reads the rules of a .gitignore-style file; raises OSError."""
+        with open(path, encoding="utf-8") as f:
+            return cls(f)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __repr__(self):
+        return f"ScanRules({self.patterns!r})"
+
+    def within(self, relative):
+        """
+        Returns the same rules for a scan of the folder at a path relative to
+        the one they were written for, such as a subfolder scanned on its own.
+        """
+        rules = copy.copy(self)
+        if relative not in ("", os.curdir):
+            rules.base = self.prefix("", relative)
+        return rules
+
+    def excludes(self, relative, is_dir):
+        """
+        Tells whether the entry at a path relative to the scanned folder, with
+        / as separator, is excluded.
+        """
+        if is_dir:
+            match, negated = self._dirs, self._dir_negated
+        else:
+            match, negated = self._files, self._file_negated
+        if match is None:
+            return False
+        m = match(relative)
+        return m is not None and not negated[m.lastindex]
+
+    def prefix(self, root, path):
+        """
+        Returns the path of folder path relative to the folder the rules are
+        for, when scanning root, ready to have an entry name appended.
+        """
+        if path == root:
+            return self.base
+        relative = path[len(root):].lstrip(os.sep)
+        if os.sep != "/":
+            relative = relative.replace(os.sep, "/")
+        return self.base + relative + "/"
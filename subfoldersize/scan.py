@@ -0,0 +1,1024 @@
+"""Directory size scanning and the in-memory size tree."""
+
+import collections
+import datetime
+import errno
+import itertools
+import heapq
+import os
+import queue
+import threading
+import time
+
+from .inodes import InodeSet
+from .report import ScanReport
+from .util import allocated_size, entry_is_dir, entry_size, format_size, worker_count
+
+class DirRecord:
+    """Per-directory result of a scan."""
+    __slots__ = ("path", "dev", "ino", "mtime_ns", "own_size", "total_size", "subdirs", "stored_total",
+                 "file_count")
+
+    def __init__(self, path, st, own_size, subdirs, stored_total=None, file_count=0):
+        self.path = path
+        self.dev = st.st_dev if st else 0
+        self.ino = st.st_ino if st else 0
+        self.mtime_ns = st.st_mtime_ns if st else 0
+        self.own_size = own_size
+        self.total_size = own_size
+        self.subdirs = subdirs
+        # Aggregate size read from the index when the listing was reused, None otherwise
+        self.stored_total = stored_total
+        self.file_count = file_count  # Files directly inside the directory
+
+class SizeTree:
+    """
+    In-memory tree of per-directory totals, shared by every pane. A directory is
+    only added once its whole subtree is accounted for; scans claim directories
+    in it before walking them.
+    """
+    def __init__(self):
+        self.nodes = {}  # path -> DirRecord
+        self.lock = threading.RLock()
+        # path -> callbacks waiting for the scan walking it. Separate from
+        # lock, which apply_changes() holds while its own workers run.
+        self._claims = {}
+        self._claims_lock = threading.Lock()
+
+    def get(self, path):
+        return self.nodes.get(path)
+
+    def merge(self, records):
+        """Adds the records of a completed walk, replacing older results for the same paths."""
+        with self.lock:
+            for record in records:
+                self.nodes[record.path] = record
+
+    def descendants(self, path):
+        """Yields the known directories below path, breadth-first."""
+        pending = queue.SimpleQueue()
+        pending.put(path)
+        while not pending.empty():
+            node = self.nodes.get(pending.get())
+            if node is None:
+                continue
+            for name in node.subdirs:
+                child = os.path.join(node.path, name)
+                if child in self.nodes:
+                    yield child
+                    pending.put(child)
+
+    def claim(self, path, on_released=None):
+        """
+        Claims the walk of the directory at path and returns True, or returns
+        False and calls on_released() once the scan holding it releases it.
+        """
+        with self._claims_lock:
+            waiting = self._claims.get(path)
+            if waiting is None:
+                self._claims[path] = []
+                return True
+            if on_released is not None:
+                waiting.append(on_released)
+            return False
+
+    def release(self, paths):
+        """Gives up the claims on paths and calls the scans waiting for them."""
+        waiting = []
+        with self._claims_lock:
+            for path in paths:
+                waiting.extend(self._claims.pop(path, ()))
+        for on_released in waiting:
+            on_released()
+
+    def forget(self, path):
+        """Drops a directory and everything below it."""
+        with self.lock:
+            stack = [path]
+            while stack:
+                node = self.nodes.pop(stack.pop(), None)
+                if node is not None:
+                    stack.extend(os.path.join(node.path, name) for name in node.subdirs)
+
+    def discount(self, path, freed, removed):
+        """
+        Accounts for `freed` bytes deleted at path. removed tells whether path
+        itself is gone; a folder that was only partly deleted is dropped from
+        the tree so it is walked again next time.
+        """
+        with self.lock:
+            parent_path, name = os.path.split(path)
+            parent = self.nodes.get(parent_path)
+            node = self.nodes.get(path)
+            if node is None:
+                if parent is not None and name not in parent.subdirs:
+                    # A file directly inside parent.
+                    parent.own_size -= freed
+                    parent.file_count -= removed
+                self.propagate(parent_path, -freed)
+                return
+            if removed:
+                self.propagate(parent_path, -node.total_size)
+                if parent is not None and name in parent.subdirs:
+                    parent.subdirs.remove(name)
+            else:
+                self.propagate(path, -freed)
+            self.forget(path)
+
+    def propagate(self, path, delta):
+        """Adds delta to the total of path and of every known ancestor."""
+        with self.lock:
+            while True:
+                node = self.nodes.get(path)
+                if node is None:
+                    return
+                node.total_size += delta
+                parent = os.path.dirname(path)
+                if parent == path:
+                    return
+                path = parent
+
+class DeviceQueue:
+    """Work queue that runs at most a given number of jobs per device (st_dev) at a time."""
+    def __init__(self, limit_for=None):
+        self._limit_for = limit_for  # dev -> maximum running jobs, or None for no limit
+        self._limits = {}
+        self._queues = {}  # dev -> deque of jobs, in round-robin order
+        self._running = collections.Counter()
+        self._started = {}  # token -> (dev, monotonic start, job)
+        self._abandoned = set()
+        self._closed = False
+        self._tokens = itertools.count()
+        self._cond = threading.Condition()
+
+    def _limit(self, dev):
+        if dev not in self._limits:
+            self._limits[dev] = self._limit_for(dev) if self._limit_for is not None else None
+        return self._limits[dev]
+
+    def put(self, job, dev=None):
+        """Queues job on dev; returns False if dev was abandoned."""
+        with self._cond:
+            if dev in self._abandoned:
+                return False
+            self._queues.setdefault(dev, collections.deque()).append(job)
+            self._cond.notify()
+            return True
+
+    def get(self):
+        """Blocks until a job may run and returns (token, job), or None once closed."""
+        with self._cond:
+            while not self._closed:
+                for dev, jobs in self._queues.items():
+                    limit = self._limit(dev)
+                    if limit is None or self._running[dev] < limit:
+                        job = jobs.popleft()
+                        # Send the device to the back so the others get their turn.
+                        del self._queues[dev]
+                        if jobs:
+                            self._queues[dev] = jobs
+                        self._running[dev] += 1
+                        token = next(self._tokens)
+                        self._started[token] = (dev, time.monotonic(), job)
+                        return token, job
+                self._cond.wait()
+            return None
+
+    def task_done(self, token):
+        """Frees the slot of a job; returns False if its device was abandoned while it ran."""
+        with self._cond:
+            dev, _, _ = self._started.pop(token)
+            self._running[dev] -= 1
+            if self._limit(dev) is not None:
+                self._cond.notify_all()
+            return dev not in self._abandoned
+
+    def overdue(self, timeout):
+        """Returns the devices with a job running for longer than timeout seconds."""
+        deadline = time.monotonic() - timeout
+        with self._cond:
+            return {dev for dev, started, _ in self._started.values()
+                    if started < deadline and dev not in self._abandoned}
+
+    def abandon(self, dev):
+        """Gives up on dev and returns its queued and running jobs, which will never complete."""
+        with self._cond:
+            self._abandoned.add(dev)
+            jobs = list(self._queues.pop(dev, ()))
+            jobs.extend(job for job_dev, _, job in self._started.values() if job_dev == dev)
+            return jobs
+
+    def close(self):
+        """Wakes every waiting get(), which then returns None."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+class ScanCancelled(Exception):
+    """Raised by ScanEngine.scan() when the scan was cancelled before it completed."""
+
+class ScanStats:
+    """Counters and timings of one ScanEngine.scan(); safe to read while it runs."""
+    OPERATIONS = ("list", "stat", "index lookup", "index store")
+    SLOWEST = 10
+    MAX_ERRORS = 100
+
+    def __init__(self, folder=None, workers=None):
+        self.folder = folder
+        self.workers = workers
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.wall = None  # Seconds, once the scan is over
+        self.dirs = 0  # Directories listed or read from the index
+        self.files = 0
+        self.bytes = 0
+        self.stat_calls = 0
+        self.index_hits = 0
+        self.known_dirs = 0  # Directories counted from the SizeTree without walking them
+        self.shared_dirs = 0  # Directories whose totals came from another scan walking them at the same time
+        self.permission_errors = 0
+        self.other_errors = 0
+        self.errors = []  # The first MAX_ERRORS (path, message) pairs
+        self.op_seconds = dict.fromkeys(self.OPERATIONS, 0.0)
+        self.subtrees = {}  # group -> [name, dirs, files, bytes, busy seconds, wall seconds or None]
+        self._slowest = []  # Min-heap of (seconds, path)
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return self.wall if self.wall is not None else time.perf_counter() - self._started
+
+    def add_time(self, operation, seconds):
+        with self._lock:
+            self.op_seconds[operation] += seconds
+
+    def add_stat(self, seconds):
+        """Accounts for one os.stat of a directory."""
+        with self._lock:
+            self.stat_calls += 1
+            self.op_seconds["stat"] += seconds
+
+    def add_error(self, path, error):
+        with self._lock:
+            if error.errno in (errno.EACCES, errno.EPERM):
+                self.permission_errors += 1
+            else:
+                self.other_errors += 1
+            if len(self.errors) < self.MAX_ERRORS:
+                self.errors.append((path, error.strerror or str(error)))
+
+    def begin_subtree(self, group, name):
+        self.subtrees[group] = [name, 0, 0, 0, 0.0, None]
+
+    def end_subtree(self, group):
+        subtree = self.subtrees.get(group)
+        if subtree is not None:
+            subtree[5] = self.elapsed()
+
+    def add_dir(self, group, path, files, size, busy, from_index=False, known_dirs=0):
+        """Accounts for one directory walked by a worker in busy seconds."""
+        with self._lock:
+            self.dirs += 1
+            self.files += files
+            self.bytes += size
+            self.stat_calls += files
+            self.index_hits += from_index
+            self.known_dirs += known_dirs
+            subtree = self.subtrees.get(group)
+            if subtree is not None:
+                subtree[1] += 1
+                subtree[2] += files
+                subtree[3] += size
+                subtree[4] += busy
+            if len(self._slowest) < self.SLOWEST:
+                heapq.heappush(self._slowest, (busy, path))
+            elif busy > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (busy, path))
+
+    def add_shared(self):
+        """Accounts for one directory taken over from another scan."""
+        with self._lock:
+            self.shared_dirs += 1
+
+    def finish(self, total_bytes=None):
+        if total_bytes is not None:
+            self.bytes = total_bytes
+        self.wall = self.elapsed()
+
+    def summary(self):
+        """One line for a status bar."""
+        elapsed = self.elapsed() or 1e-9
+        index_note = f", {self.index_hits:,} from index" if self.index_hits else ""
+        if self.shared_dirs:
+            index_note += f", {self.shared_dirs:,} shared"
+        parts = [
+            f"{self.dirs:,} dirs ({self.dirs / elapsed:,.0f}/s{index_note})",
+            f"{self.files:,} files ({self.files / elapsed:,.0f}/s)",
+            format_size(self.bytes),
+            f"{self.stat_calls:,} stat calls",
+        ]
+        if self.permission_errors:
+            parts.append(f"{self.permission_errors:,} permission errors")
+        if self.other_errors:
+            parts.append(f"{self.other_errors:,} other errors")
+        parts.append(f"{elapsed:.1f} s")
+        return " · ".join(parts)
+
+    def as_dict(self):
+        """The full profile report, ready to be written as JSON."""
+        elapsed = self.elapsed() or 1e-9
+        with self._lock:
+            subtrees = sorted(self.subtrees.values(), key=lambda s: s[4], reverse=True)
+            slowest = sorted(self._slowest, reverse=True)
+            return {
+                "folder": self.folder,
+                "started": datetime.datetime.fromtimestamp(self.started_at, datetime.timezone.utc)
+                           .isoformat(timespec="seconds"),
+                "finished": self.wall is not None,
+                "wall_s": elapsed,
+                "workers": self.workers,
+                "dirs": self.dirs,
+                "files": self.files,
+                "bytes": self.bytes,
+                "stat_calls": self.stat_calls,
+                "index_hits": self.index_hits,
+                "known_dirs": self.known_dirs,
+                "shared_dirs": self.shared_dirs,
+                "permission_errors": self.permission_errors,
+                "other_errors": self.other_errors,
+                "dirs_per_s": self.dirs / elapsed,
+                "files_per_s": self.files / elapsed,
+                "bytes_per_s": self.bytes / elapsed,
+                "operation_seconds": dict(self.op_seconds),
+                "subtrees": [
+                    {"name": name, "dirs": dirs, "files": files, "bytes": size, "busy_s": busy, "wall_s": wall}
+                    for name, dirs, files, size, busy, wall in subtrees
+                ],
+                "slowest_dirs": [{"path": path, "seconds": seconds} for seconds, path in slowest],
+                "errors": [{"path": path, "message": message} for path, message in self.errors],
+            }
+
+class ScanEngine:
+    """
+    Multi-threaded directory size engine. Worker threads list directories from a
+    work queue with os.scandir, and the results are merged into a SizeTree,
+    whose directories are not walked again.
+    """
+    def __init__(self, workers=None, index=None, refresh=False, tree=None, report_top=None,
+                 one_filesystem=False, device_workers=None, device_limits=None, skip_mounts=(),
+                 mount_timeout=None, allocated=False, rules=None, count_excluded=False,
+                 trust_index=False):
+        # os.scandir releases the GIL while waiting on the disk, so I/O-bound
+        # workers scale well past the number of cores.
+        self.workers = worker_count(workers, min(32, (os.cpu_count() or 1) * 4))
+        self.allocated = allocated
+        self.rules = rules or None
+        self.index = None if allocated or self.rules else index
+        # Only read, for the totals of excluded directories
+        self._excluded_index = index if self.rules and count_excluded else None
+        self.count_excluded = count_excluded
+        self.excluded_dirs = 0
+        self.excluded_files = 0
+        self.excluded_bytes = 0
+        self.excluded_unsized = 0
+        self._excluded_lock = threading.Lock()
+        # When set, every directory is listed again and the index is rewritten.
+        self.refresh = refresh or allocated
+        self.trust_index = trust_index
+        self.inodes = None  # InodeSet of the hardlinked files counted so far, in allocated mode
+        self._file_size = self._allocated_size if allocated else entry_size
+        self.tree = tree if tree is not None else SizeTree()
+        self.root = None
+        self.entries = {}
+        self.added_dirs = []
+        self._cancelled = threading.Event()
+        self._live = None
+        self.errors = []  # (path, message) for directories that could not be read
+        self.stats = None
+        self.report_top = report_top
+        self.report = None
+        self.one_filesystem = one_filesystem
+        self.device_workers = device_workers
+        self.device_limits = dict(device_limits or {})
+        self.skip_mounts = list(skip_mounts)
+        self.mount_timeout = mount_timeout
+        self._device_aware = bool(one_filesystem or device_workers or self.device_limits
+                                  or self.skip_mounts or mount_timeout)
+        self._root_dev = None
+        self._limits_by_dev = {}
+        self._skipped_devs = set()
+        self.skipped = []  # (path, reason) for directories that were deliberately not entered
+
+    def cancel(self):
+        """Asks a running scan to stop as soon as possible."""
+        self._cancelled.set()
+
+    def progress(self):
+        """
+        Returns (name, running size) for every top-level directory that is still
+        being walked and whose running size changed since the previous call.
+        """
+        live = self._live
+        if live is None:
+            return []
+        names, totals, done, last_reported, groups = live
+        updates = []
+        for group in groups:
+            total = totals[group]
+            if not done[group] and total != last_reported[group]:
+                last_reported[group] = total
+                updates.append((names[group], total))
+        return updates
+
+    def _record_error(self, path, error, stats):
+        self.errors.append((path, error.strerror or str(error)))
+        if stats is not None:
+            stats.add_error(path, error)
+
+    def _list_dir(self, path, stats=None):
+        """Lists one directory, returning (bytes of its files, subdirectory names, number of files)."""
+        size = 0
+        files = 0
+        subdirs = []
+        # File entries kept for the report; their stat data is already cached.
+        found = [] if self.report is not None else None
+        file_size = self._file_size
+        cancelled = self._cancelled.is_set
+        rules = self.rules
+        if rules is not None:
+            excludes = rules.excludes
+            prefix = rules.prefix(self.root, path)
+            excluded = []
+        started = time.perf_counter()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if cancelled():
+                        break
+                    is_dir = entry_is_dir(entry)
+                    if rules is not None and excludes(prefix + entry.name, is_dir):
+                        excluded.append(entry)
+                        continue
+                    if is_dir:
+                        subdirs.append(entry.name)
+                    else:
+                        files += 1
+                        size += file_size(entry)
+                        if found is not None:
+                            found.append(entry)
+        except OSError as e:
+            self._record_error(path, e, stats)
+        if stats is not None:
+            stats.add_time("list", time.perf_counter() - started)
+        if found:
+            self.report.add_entries(path, found)
+        if rules is not None and excluded:
+            self._count_excluded(excluded)
+        return size, subdirs, files
+
+    def _kept(self, path, entries):
+        """Returns the entries listed in directory path that the rules do not exclude."""
+        if self.rules is None:
+            return entries
+        excludes = self.rules.excludes
+        prefix = self.rules.prefix(self.root, path)
+        return [entry for entry in entries if not excludes(prefix + entry.name, entry_is_dir(entry))]
+
+    def _count_excluded(self, entries):
+        """Adds excluded entries to the excluded counts, and with count_excluded their sizes."""
+        dirs = files = size = unsized = 0
+        for entry in entries:
+            if entry_is_dir(entry):
+                dirs += 1
+                if self.count_excluded:
+                    total = self._indexed_total(entry)
+                    if total is None:
+                        unsized += 1
+                    else:
+                        size += total
+            else:
+                files += 1
+                if self.count_excluded:
+                    size += self._file_size(entry)
+        with self._excluded_lock:
+            self.excluded_dirs += dirs
+            self.excluded_files += files
+            self.excluded_bytes += size
+            self.excluded_unsized += unsized
+
+    def _indexed_total(self, entry):
+        """Returns the total the index holds for a directory from an earlier scan, or None."""
+        if self._excluded_index is None:
+            return None
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            return None
+        row = self._excluded_index.lookup(st.st_dev, st.st_ino)
+        return row[2] if row is not None else None
+
+    def _scan_dir(self, path, stats=None, st=None):
+        """
+        Returns (stat, own size, subdirectory names, stored total, number of files)
+        for one directory. st is its lstat result if the caller already has it.
+        """
+        if self.index is None:
+            size, subdirs, files = self._list_dir(path, stats)
+            if self.allocated:
+                # The blocks of the directory itself count too, as in du.
+                st = st or self._lstat(path, stats)
+                size += allocated_size(st) if st is not None else 0
+            return st, size, subdirs, None, files
+        if st is None:
+            st = self._lstat(path, stats)
+            if st is None:
+                return None, 0, [], None, 0
+        if self.trust_index and not self.refresh:
+            started = time.perf_counter()
+            row = self.index.lookup(st.st_dev, st.st_ino)
+            if stats is not None:
+                stats.add_time("index lookup", time.perf_counter() - started)
+            if row is not None and row[0] == st.st_mtime_ns:
+                return st, row[1], row[3], row[2], row[4]
+        size, subdirs, files = self._list_dir(path, stats)
+        return st, size, subdirs, None, files
+
+    def _allocated_size(self, entry):
+        """Returns the bytes allocated to a file, or 0 if another link to it was already counted."""
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            return 0
+        if st.st_nlink > 1 and not self.inodes.add(st.st_dev, st.st_ino):
+            return 0
+        return allocated_size(st)
+
+    def _lstat(self, path, stats=None):
+        """Returns the lstat result of a directory, or None after recording the error."""
+        started = time.perf_counter()
+        try:
+            return os.stat(path, follow_symlinks=False)
+        except OSError as e:
+            self._record_error(path, e, stats)
+            return None
+        finally:
+            if stats is not None:
+                stats.add_stat(time.perf_counter() - started)
+
+    def _resolve_devices(self, folder_path):
+        """Turns the paths of the device options into st_dev numbers for a scan of folder_path."""
+        self._root_dev = os.stat(folder_path).st_dev
+        self._limits_by_dev = {}
+        for path, limit in self.device_limits.items():
+            try:
+                self._limits_by_dev[os.stat(path).st_dev] = limit
+            except OSError:
+                pass
+        self._skipped_devs = set()
+        for path in self.skip_mounts:
+            try:
+                self._skipped_devs.add(os.stat(path).st_dev)
+            except OSError:
+                pass
+        # The folder asked for is always scanned.
+        self._skipped_devs.discard(self._root_dev)
+
+    def _device_limit(self, dev):
+        if dev is None:
+            return None
+        return self._limits_by_dev.get(dev, self.device_workers)
+
+    def _skip_reason(self, st):
+        """Returns why a directory with the given lstat result is not entered, or None."""
+        if self.one_filesystem and st.st_dev != self._root_dev:
+            return "on another file system"
+        if st.st_dev in self._skipped_devs:
+            return "on a skipped mount"
+        return None
+
+    def _known_total(self, path):
+        """Returns the total of an already scanned directory, or None if it has to be walked."""
+        if self.refresh:
+            return None
+        node = self.tree.get(path)
+        return node.total_size if node is not None else None
+
+    def scan(self, folder_path, on_entry=None):
+        """
+        Computes the total size of every entry directly inside folder_path,
+        calling on_entry(name, size, is_dir) as each is done. Raises
+        ScanCancelled if cancel() was called.
+        """
+        folder_path = os.path.normpath(folder_path)
+        stats = self.stats = ScanStats(folder_path, self.workers)
+        scan_report = self.report = ScanReport(self.report_top) if self.report_top else None
+        if self.refresh:
+            self.tree.forget(folder_path)
+        self.skipped = []
+        self.excluded_dirs = self.excluded_files = self.excluded_bytes = self.excluded_unsized = 0
+        if self.allocated:
+            self.inodes = InodeSet()
+        if self._device_aware:
+            self._resolve_devices(folder_path)
+        started = time.perf_counter()
+        with os.scandir(folder_path) as it:
+            top_entries = list(it)
+
+        self.root = folder_path
+        if self.rules is not None:
+            kept = self._kept(folder_path, top_entries)
+            if len(kept) < len(top_entries):
+                kept_ids = set(map(id, kept))
+                self._count_excluded([entry for entry in top_entries if id(entry) not in kept_ids])
+                top_entries = kept
+        names = [entry.name for entry in top_entries]
+        is_dirs = [entry_is_dir(entry) for entry in top_entries]
+        sizes = [0 if is_dir else self._file_size(entry) for entry, is_dir in zip(top_entries, is_dirs)]
+        busy = time.perf_counter() - started
+        stats.add_time("list", busy)
+        if self._cancelled.is_set():
+            stats.finish()
+            raise ScanCancelled(folder_path)
+        done = [False] * len(top_entries)
+        totals = [0] * len(top_entries)
+
+        def report(group, total):
+            sizes[group] = total
+            done[group] = True
+            stats.end_subtree(group)
+            if on_entry is not None:
+                on_entry(names[group], total, is_dirs[group])
+
+        jobs = []
+        known_dirs = 0
+        for index, entry in enumerate(top_entries):
+            known = self._known_total(entry.path) if is_dirs[index] else sizes[index]
+            st = None
+            if known is None and self._device_aware:
+                st = self._lstat(entry.path, stats)
+                reason = self._skip_reason(st) if st is not None else None
+                if reason is not None:
+                    self.skipped.append((entry.path, reason))
+                if st is None or reason is not None:
+                    known = 0
+            if known is None:
+                stats.begin_subtree(index, names[index])
+                jobs.append((entry.path, index, -1, st))
+            else:
+                known_dirs += is_dirs[index]
+                report(index, known)
+        files = len(top_entries) - sum(is_dirs)
+        stats.add_dir(None, folder_path, files, sum(sizes), busy, known_dirs=known_dirs)
+        if scan_report is not None:
+            scan_report.add_entries(folder_path, [entry for entry, is_dir in zip(top_entries, is_dirs) if not is_dir])
+        # Shared with progress(), which may be called from another thread
+        self._live = (names, totals, done, [-1] * len(top_entries), [job[1] for job in jobs])
+        # Another scan waits for the whole folder until it is merged below.
+        root_claimed = self.tree.claim(folder_path)
+        try:
+            records = self._walk(jobs, totals, report, stats, share=True)
+            self._live = None
+            if self._cancelled.is_set():
+                stats.finish()
+                raise ScanCancelled(folder_path)
+            return self._finish_scan(folder_path, records, names, sizes, is_dirs, files)
+        finally:
+            if root_claimed:
+                self.tree.release([folder_path])
+
+    def _finish_scan(self, folder_path, records, names, sizes, is_dirs, files):
+        """Stores and merges the results of a completed scan and returns its top-level rows."""
+        stats = self.stats
+        scan_report = self.report
+        if self.index is not None:
+            started = time.perf_counter()
+            self.index.store(
+                (r.dev, r.ino, r.mtime_ns, r.own_size, r.total_size, r.subdirs, r.file_count)
+                for r in records
+                if r.dev and r.total_size != r.stored_total
+            )
+            stats.add_time("index store", time.perf_counter() - started)
+        root = DirRecord(
+            folder_path, None,
+            sum(size for size, is_dir in zip(sizes, is_dirs) if not is_dir),
+            [name for name, is_dir in zip(names, is_dirs) if is_dir],
+            file_count=files,
+        )
+        if self.allocated:
+            st = self._lstat(folder_path, stats)
+            root.own_size += allocated_size(st) if st is not None else 0
+        root.total_size = root.own_size + sum(size for size, is_dir in zip(sizes, is_dirs) if is_dir)
+        # The subtrees were merged as they were finished.
+        self.tree.merge([root])
+        self.entries = {name: [size, is_dir] for name, size, is_dir in zip(names, sizes, is_dirs)}
+        stats.finish(root.total_size)
+        if scan_report is not None:
+            with self.tree.lock:
+                dirs = [(self.tree.get(path).total_size, path) for path in self.tree.descendants(folder_path)]
+            # The report sums apparent sizes, which an allocated total cannot be compared with.
+            scan_report.finish(None if self.allocated else root.total_size, dirs)
+        return list(zip(names, sizes, is_dirs))
+
+    def _walk(self, jobs, totals, on_group_done=None, stats=None, share=False):
+        """
+        Walks the (path, group, parent record index, lstat or None) jobs with
+        the worker pool and returns the new DirRecords.
+        """
+        records = []
+        parents = []
+        group_records = [[] for _ in totals]  # Indices into records of each group's directories
+        claims = [[] for _ in totals]  # Paths each group claimed in the tree
+        # Number of directories still queued, being listed or awaited from
+        # another scan, for each group and overall
+        pending = [0] * len(totals)
+        outstanding = [len(jobs)]
+        closed = [False]  # Set once the walk is over, after which nothing is claimed
+        all_done = threading.Event()
+        lock = threading.Lock()
+        work = DeviceQueue(self._device_limit)
+
+        def finish_group(group):
+            """Rolls the group's directories up into their parents and shares them."""
+            indices = group_records[group]
+            # A record is always appended after its parent, so walking the
+            # group backwards rolls every child into its parent before the
+            # parent is used.
+            for index in reversed(indices):
+                if parents[index] >= 0:
+                    records[parents[index]].total_size += records[index].total_size
+            if share:
+                self.tree.merge(records[index] for index in indices)
+                with lock:
+                    claimed, claims[group] = claims[group], []
+                self.tree.release(claimed)
+
+        def settle(group, new_jobs=0):
+            """Books one finished or abandoned job of group and the new jobs it found."""
+            with lock:
+                pending[group] += new_jobs - 1
+                done = pending[group] == 0
+                # The last job of a group counts until the group is finished.
+                outstanding[0] += new_jobs - (not done)
+                last = outstanding[0] == 0
+            if done:
+                finish_group(group)
+                if on_group_done is not None:
+                    on_group_done(group, totals[group])
+                with lock:
+                    outstanding[0] -= 1
+                    last = outstanding[0] == 0
+            if last:
+                all_done.set()
+
+        def take(path, group, parent, st):
+            """Queues the walk of a directory, unless another scan is walking it already."""
+            if share:
+                with lock:
+                    if closed[0]:
+                        return
+                    # A refresh reads everything itself, whatever other scans find.
+                    claimed = self.tree.claim(path, None if self.refresh else
+                                              lambda: released(path, group, parent, st))
+                    if claimed:
+                        claims[group].append(path)
+                if not (claimed or self.refresh):
+                    return
+            if not work.put((path, group, parent, st), st.st_dev if st is not None else None):
+                self._give_up(path, stats)
+                settle(group)
+
+        def released(path, group, parent, st):
+            """Counts a directory another scan was walking, once it is done with it."""
+            if self._cancelled.is_set():
+                return
+            node = self.tree.get(path)
+            if node is None:
+                # That scan stopped before it finished the directory.
+                take(path, group, parent, st)
+                return
+            with lock:
+                totals[group] += node.total_size
+                if parent >= 0:
+                    records[parent].total_size += node.total_size
+            if stats is not None:
+                stats.add_shared()
+            settle(group)
+
+        def admit(child):
+            """Returns the job parts (child, lstat) for a subdirectory to walk, or None."""
+            if not self._device_aware:
+                return child, None
+            st = self._lstat(child, stats)
+            if st is None:
+                return None
+            reason = self._skip_reason(st)
+            if reason is not None:
+                with lock:
+                    self.skipped.append((child, reason))
+                return None
+            return child, st
+
+        def worker():
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                token, (path, group, parent, dir_st) = item
+                if self._cancelled.is_set():
+                    # Drain the queue without touching the disk.
+                    work.task_done(token)
+                    with lock:
+                        outstanding[0] -= 1
+                        if outstanding[0] == 0:
+                            all_done.set()
+                    continue
+                started = time.perf_counter()
+                st, size, subdirs, stored_total, files = self._scan_dir(path, stats, dir_st)
+                busy = time.perf_counter() - started
+                record = DirRecord(path, st, size, subdirs, stored_total, files)
+                unknown = []
+                known_dirs = 0
+                for name in subdirs:
+                    child = os.path.join(path, name)
+                    known = self._known_total(child)
+                    if known is None:
+                        admitted = admit(child)
+                        if admitted is not None:
+                            unknown.append(admitted)
+                    else:
+                        known_dirs += 1
+                        size += known
+                record.total_size = size
+                if not work.task_done(token):
+                    # The device was given up while this directory was read.
+                    continue
+                if stats is not None:
+                    from_index = stored_total is not None
+                    stats.add_dir(group, path, 0 if from_index else files, size, busy, from_index, known_dirs)
+                with lock:
+                    record_index = len(records)
+                    records.append(record)
+                    parents.append(parent)
+                    group_records[group].append(record_index)
+                    totals[group] += size
+                    # Count the subdirectories in before queueing them so the
+                    # group cannot be reported as finished too early.
+                    pending[group] += len(unknown)
+                    outstanding[0] += len(unknown)
+                for child, child_st in unknown:
+                    take(child, group, record_index, child_st)
+                settle(group)
+
+        for job in jobs:
+            pending[job[1]] += 1
+        abandoned = False
+        try:
+            if jobs:
+                threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+                for thread in threads:
+                    thread.start()
+                for job in jobs:
+                    take(*job)
+                # Waits time out now and then so that a cancelled scan does not
+                # wait for directories another scan is walking.
+                interval = min(1.0, self.mount_timeout / 4) if self.mount_timeout else 0.25
+                while not all_done.wait(interval):
+                    if self._cancelled.is_set():
+                        break
+                    if not self.mount_timeout:
+                        continue
+                    for dev in work.overdue(self.mount_timeout):
+                        abandoned = True
+                        for path, group, _, _ in work.abandon(dev):
+                            self._give_up(path, stats)
+                            settle(group)
+                work.close()
+                # Workers stuck on an abandoned device are left to finish on their own.
+                if not abandoned:
+                    for thread in threads:
+                        thread.join()
+        finally:
+            with lock:
+                closed[0] = True
+                unreleased = [path for claimed in claims for path in claimed]
+            if share:
+                self.tree.release(unreleased)
+        return records
+
+    def _give_up(self, path, stats):
+        """Records a directory of a device that timed out as unread."""
+        self._record_error(path, TimeoutError(errno.ETIMEDOUT, f"gave up on its file system after "
+                                                               f"{self.mount_timeout:g} s"), stats)
+
+    def _walk_new_dir(self, path):
+        """Scans a directory that appeared after the scan and returns its aggregate size."""
+        records = self._walk([(path, 0, -1, None)], [0])
+        self.tree.merge(records)
+        self.added_dirs.extend(record.path for record in records)
+        return records[0].total_size
+
+    def apply_changes(self, dirty_dirs):
+        """
+        Lists the dirty directories again, patches the SizeTree and the index,
+        and returns {name: (size, is_dir) or None} for the top-level entries
+        that changed.
+        """
+        changed = {}
+        touched = set()
+        refreshed = []
+        self.added_dirs = []
+        with self.tree.lock:
+            # Parents first, so directories removed by a parent's refresh are skipped.
+            for path in sorted(dirty_dirs, key=lambda p: p.count(os.sep)):
+                listing = self._refresh_dir(path)
+                if listing is None:
+                    continue
+                refreshed.append(path)
+                if path == self.root:
+                    self._sync_entries(listing, changed)
+                else:
+                    touched.add(os.path.relpath(path, self.root).split(os.sep)[0])
+            # Compare against the tree rather than our own deltas: another pane
+            # watching the same directory may have applied the change first.
+            for name in touched:
+                entry = self.entries.get(name)
+                node = self.tree.get(os.path.join(self.root, name))
+                if entry is not None and node is not None and entry[0] != node.total_size:
+                    entry[0] = node.total_size
+                    changed[name] = tuple(entry)
+            if self.index is not None:
+                self._store_changes(refreshed)
+        return changed
+
+    def _store_changes(self, paths):
+        """Writes the refreshed directories at paths, their ancestors and the newly walked ones to the index."""
+        records = {}
+        for path in itertools.chain(paths, self.added_dirs):
+            while path not in records:
+                record = self.tree.get(path)
+                if record is None:
+                    break
+                records[path] = record
+                path = os.path.dirname(path)
+        self.index.store(
+            (r.dev, r.ino, r.mtime_ns, r.own_size, r.total_size, r.subdirs, r.file_count)
+            for r in records.values()
+            if r.dev
+        )
+
+    def _refresh_dir(self, path):
+        """
+        Lists one known directory again and brings the SizeTree up to date.
+        Returns the DirEntry listing, or None if the directory is unknown or gone.
+        """
+        record = self.tree.get(path)
+        if record is None:
+            return None
+        try:
+            # Stat before listing, so a change made meanwhile leaves an older
+            # mtime in the index rather than a newer one.
+            st = os.stat(path, follow_symlinks=False)
+            with os.scandir(path) as it:
+                listing = self._kept(path, list(it))
+        except OSError:
+            # Already gone; the parent's own event accounts for it.
+            return None
+        record.dev, record.ino, record.mtime_ns = st.st_dev, st.st_ino, st.st_mtime_ns
+        own_size = 0
+        subdirs = []
+        for entry in listing:
+            if entry_is_dir(entry):
+                subdirs.append(entry.name)
+            else:
+                own_size += self._file_size(entry)
+        record.file_count = len(listing) - len(subdirs)
+        delta = own_size - record.own_size
+        old_names, new_names = set(record.subdirs), set(subdirs)
+        for name in old_names - new_names:
+            child = self.tree.get(os.path.join(path, name))
+            if child is not None:
+                delta -= child.total_size
+            self.tree.forget(os.path.join(path, name))
+        for name in new_names - old_names:
+            delta += self._walk_new_dir(os.path.join(path, name))
+        record.own_size = own_size
+        record.subdirs = subdirs
+        if delta:
+            self.tree.propagate(path, delta)
+        return listing
+
+    def _sync_entries(self, listing, changed):
+        """Rebuilds the top-level results from a fresh listing of the root."""
+        current = {}
+        for entry in listing:
+            if entry_is_dir(entry):
+                node = self.tree.get(entry.path)
+                size = node.total_size if node is not None else self.entries.get(entry.name, [0])[0]
+                current[entry.name] = [size, True]
+            else:
+                current[entry.name] = [self._file_size(entry), False]
+        for name in self.entries.keys() - current.keys():
+            changed[name] = None
+        for name, value in current.items():
+            if self.entries.get(name) != value:
+                changed[name] = tuple(value)
+        self.entries = current
@@ -0,0 +1,49 @@
+"""What the panes showed when the app was last closed."""
+
+import json
+import os
+
+from .index import user_cache_dir
+
+class SessionStore:
+    """
+    Keeps the folder, options and listed rows of every pane between runs of the
+    app in a JSON file in the user cache directory. A missing or unreadable file
+    reads as an empty session.
+    """
+    VERSION = 1
+    MAX_ROWS = 50_000
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def default_path(cls):
+        return os.path.join(user_cache_dir(), "session.json")
+
+    def load(self):
+        """Returns {pane: state dict} from the last session, or {} if there is none."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return {}
+        panes = data.get("panes")
+        return panes if isinstance(panes, dict) else {}
+
+    def save(self, panes):
+        """
+        Writes {pane: state dict} for the next session, leaving out rows of
+        listings longer than MAX_ROWS. Raises OSError.
+        """
+        panes = {
+            name: dict(state, rows=[]) if len(state.get("rows", ())) > self.MAX_ROWS else state
+            for name, state in panes.items()
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "panes": panes}, f, separators=(",", ":"))
+        os.replace(temp_path, self.path)
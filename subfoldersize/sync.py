@@ -0,0 +1,252 @@
+"""Comparing two folder trees and bringing one up to date with the other."""
+
+import os
+import queue
+import threading
+import time
+
+from .dupes import hash_file
+from .fileops import DeleteEngine, MoveEngine, OperationCancelled
+from .util import entry_is_dir, entry_size, worker_count
+
+class TreeSync:
+    """
+    Compares two folder trees on size and modification time, or contents, and
+    copies only what differs from one to the other.
+    """
+    LEFT_ONLY = "left only"
+    RIGHT_ONLY = "right only"
+    LEFT_NEWER = "left newer"
+    RIGHT_NEWER = "right newer"
+    DIFFERENT = "different"  # Same modification time but other size or contents
+    CONFLICT = "conflict"  # A folder on one side, a file on the other
+    STATES = (LEFT_ONLY, RIGHT_ONLY, LEFT_NEWER, RIGHT_NEWER, DIFFERENT, CONFLICT)
+
+    def __init__(self, workers=None, contents=False, rules=None):
+        self.workers = worker_count(workers, min(16, (os.cpu_count() or 1) * 2))
+        self.contents = contents
+        self.rules = rules or None
+        self.left = None
+        self.right = None
+        self.dirs_compared = 0
+        self.identical_files = 0
+        self.identical_bytes = 0
+        self.bytes_hashed = 0
+        self.errors = []  # (path, message) for folders and files that could not be read
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._engine = None  # MoveEngine or DeleteEngine of a running sync
+
+    def cancel(self):
+        """Asks a running compare or sync to stop as soon as possible."""
+        self._cancelled.set()
+        engine = self._engine
+        if engine is not None:
+            engine.cancel()
+
+    def _list(self, root, relative):
+        """Returns {name: DirEntry} of a folder below root without the excluded entries."""
+        path = os.path.join(root, relative)
+        try:
+            with os.scandir(path) as it:
+                entries = {entry.name: entry for entry in it}
+        except OSError as e:
+            self.errors.append((path, e.strerror or str(e)))
+            return {}
+        if self.rules is not None:
+            prefix = self.rules.prefix(root, os.path.normpath(path))
+            entries = {name: entry for name, entry in entries.items()
+                       if not self.rules.excludes(prefix + name, entry_is_dir(entry))}
+        return entries
+
+    def _same_file(self, left, right, left_st, right_st):
+        """Tells whether two files (or symlinks) of the two trees hold the same thing."""
+        if left.is_symlink() or right.is_symlink():
+            # Copies recreate symlinks, so their times say nothing.
+            try:
+                return (left.is_symlink() and right.is_symlink()
+                        and os.readlink(left.path) == os.readlink(right.path))
+            except OSError:
+                return False
+        if left_st.st_size != right_st.st_size:
+            return False
+        if not self.contents:
+            return abs(left_st.st_mtime - right_st.st_mtime) <= MoveEngine.MTIME_WINDOW
+        left_digest = hash_file(left.path)[1]
+        right_digest = hash_file(right.path)[1] if left_digest is not None else None
+        with self._lock:
+            self.bytes_hashed += left_st.st_size * ((left_digest is not None) + (right_digest is not None))
+        if left_digest is None or right_digest is None:
+            self.errors.append((left.path if left_digest is None else right.path, "could not be read"))
+            return False
+        return left_digest == right_digest
+
+    def compare(self, left, right, on_progress=None):
+        """
+        Returns (relative path, state, is_dir, left size, right size) for every
+        entry that differs between left and right. Raises OSError if either
+        folder cannot be listed, OperationCancelled if cancel() was called.
+        """
+        self.left, self.right = os.path.normpath(left), os.path.normpath(right)
+        roots = (self.left, self.right)
+        differences = []  # Lists, so the walks of one-sided folders can add up their bytes
+        work = queue.Queue()
+        last_report = [0.0]
+
+        def report():
+            now = time.monotonic()
+            if on_progress is not None and now - last_report[0] >= 0.1:
+                last_report[0] = now
+                on_progress(self.dirs_compared, self.bytes_hashed)
+
+        def differ(relative, state, is_dir, left_size, right_size):
+            row = [relative, state, is_dir, left_size, right_size]
+            with self._lock:
+                differences.append(row)
+            return row
+
+        def compare_pair(relative):
+            left_entries = self._list(self.left, relative)
+            right_entries = self._list(self.right, relative)
+            for name in left_entries.keys() | right_entries.keys():
+                if self._cancelled.is_set():
+                    return
+                path = os.path.join(relative, name)
+                left_entry, right_entry = left_entries.get(name), right_entries.get(name)
+                if left_entry is None or right_entry is None:
+                    if right_entry is None:
+                        entry, state, side = left_entry, self.LEFT_ONLY, 3
+                    else:
+                        entry, state, side = right_entry, self.RIGHT_ONLY, 4
+                    is_dir = entry_is_dir(entry)
+                    row = differ(path, state, is_dir, None, None)
+                    # The size of a folder is added up by another task.
+                    row[side] = 0 if is_dir else entry_size(entry)
+                    if is_dir:
+                        work.put((self._sum, (entry.path, row, side)))
+                    continue
+                left_is_dir, right_is_dir = entry_is_dir(left_entry), entry_is_dir(right_entry)
+                if left_is_dir and right_is_dir:
+                    work.put((compare_pair, (path,)))
+                    continue
+                try:
+                    left_st = left_entry.stat(follow_symlinks=False)
+                    right_st = right_entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    self.errors.append((os.path.join(self.left, path), e.strerror or str(e)))
+                    continue
+                if left_is_dir or right_is_dir:
+                    differ(path, self.CONFLICT, False, None if left_is_dir else left_st.st_size,
+                           None if right_is_dir else right_st.st_size)
+                elif self._same_file(left_entry, right_entry, left_st, right_st):
+                    with self._lock:
+                        self.identical_files += 1
+                        self.identical_bytes += left_st.st_size
+                else:
+                    if abs(left_st.st_mtime - right_st.st_mtime) <= MoveEngine.MTIME_WINDOW:
+                        state = self.DIFFERENT
+                    elif left_st.st_mtime > right_st.st_mtime:
+                        state = self.LEFT_NEWER
+                    else:
+                        state = self.RIGHT_NEWER
+                    differ(path, state, False, left_st.st_size, right_st.st_size)
+            with self._lock:
+                self.dirs_compared += 1
+            report()
+
+        def worker():
+            while True:
+                task = work.get()
+                if task is None:
+                    return
+                if not self._cancelled.is_set():
+                    function, args = task
+                    function(*args)
+                work.task_done()
+
+        # The roots are listed first, so an unreadable one raises right away.
+        for root in roots:
+            os.scandir(root).close()
+        work.put((compare_pair, ("",)))
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        work.join()
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        if self._cancelled.is_set():
+            raise OperationCancelled()
+        if on_progress is not None:
+            on_progress(self.dirs_compared, self.bytes_hashed)
+        differences.sort(key=lambda row: row[0])
+        return [tuple(row) for row in differences]
+
+    def _sum(self, path, row, side):
+        """Adds the bytes of the files below a folder found on one side only to row[side]."""
+        total = 0
+        stack = [path]
+        while stack and not self._cancelled.is_set():
+            folder = stack.pop()
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if entry_is_dir(entry):
+                            stack.append(entry.path)
+                        else:
+                            total += entry_size(entry)
+            except OSError as e:
+                self.errors.append((folder, e.strerror or str(e)))
+        with self._lock:
+            row[side] += total
+
+    def plan(self, differences, to="right", mirror=False):
+        """
+        Returns (relative paths to copy, relative paths to delete) that bring
+        the side named by `to` up to date.
+        """
+        if to == "right":
+            source_only, source_newer, target_only, target_newer = (
+                self.LEFT_ONLY, self.LEFT_NEWER, self.RIGHT_ONLY, self.RIGHT_NEWER)
+        else:
+            source_only, source_newer, target_only, target_newer = (
+                self.RIGHT_ONLY, self.RIGHT_NEWER, self.LEFT_ONLY, self.LEFT_NEWER)
+        copies, deletions = [], []
+        for path, state, _, _, _ in differences:
+            if state in (source_only, source_newer, self.DIFFERENT) or (mirror and state == target_newer):
+                copies.append(path)
+            elif mirror and state == target_only:
+                deletions.append(path)
+            elif mirror and state == self.CONFLICT:
+                deletions.append(path)
+                copies.append(path)
+        return copies, deletions
+
+    def sync(self, differences, to="right", mirror=False, on_progress=None):
+        """
+        Applies plan() to the trees of the last compare() and returns (copied,
+        deleted) counts. Raises OSError, or OperationCancelled if cancel() was
+        called.
+        """
+        copies, deletions = self.plan(differences, to, mirror)
+        source, target = (self.left, self.right) if to == "right" else (self.right, self.left)
+        if deletions:
+            engine = self._engine = DeleteEngine()
+            try:
+                results = engine.delete([os.path.join(target, path) for path in deletions])
+            finally:
+                self._engine = None
+            self.errors.extend(engine.errors)
+            # A conflicting entry that could not be deleted cannot be replaced either.
+            failed = {path for path in deletions if not results[os.path.join(target, path)][1]}
+            copies = [path for path in copies if path not in failed]
+            if self._cancelled.is_set():
+                raise OperationCancelled()
+        if copies:
+            engine = self._engine = MoveEngine()
+            try:
+                engine.copy(copies, source, target, on_progress)
+            finally:
+                self._engine = None
+        return len(copies), len(deletions)
@@ -0,0 +1,59 @@
+"""ASCII tree rendering of folders."""
+
+import operator
+import os
+
+from .fileops import OperationCancelled
+from .util import entry_is_dir, format_size
+
+def render_ascii_tree(folder, names, max_depth=None, max_entries=None, size_of=None, cancelled=None):
+    """
+    Yields an ASCII tree of the named items inside folder one line at a time.
+    size_of(path, entry) may return a size to show next to an item. Raises
+    OperationCancelled once the cancelled event is set.
+    """
+    def describe(name, path, entry, is_dir, depth):
+        label = name
+        if size_of is not None:
+            size = size_of(path, entry)
+            if size is not None:
+                label += f" ({format_size(size)})"
+        if is_dir and max_depth is not None and depth >= max_depth:
+            label += " …"
+        return label
+
+    top = []
+    for name in names:
+        path = os.path.join(folder, name)
+        top.append((name, path, None, os.path.isdir(path) and not os.path.islink(path)))
+
+    emitted = 0
+    stack = [(iter(enumerate(top)), len(top), "", 0)]
+    while stack:
+        items, count, prefix, depth = stack[-1]
+        item = next(items, None)
+        if item is None:
+            stack.pop()
+            continue
+        if cancelled is not None and cancelled.is_set():
+            raise OperationCancelled()
+        if max_entries is not None and emitted >= max_entries:
+            yield f"… output limited to {max_entries} entries"
+            return
+        idx, (name, path, entry, is_dir) = item
+        last = idx == count - 1
+        connector = "└─ " if last else "├─ "
+        yield prefix + connector + describe(name, path, entry, is_dir, depth)
+        emitted += 1
+        if not is_dir or (max_depth is not None and depth >= max_depth):
+            continue
+        # Use 3 characters: "   " below last items and "│  " below the others.
+        child_prefix = prefix + ("   " if last else "│  ")
+        try:
+            with os.scandir(path) as it:
+                children = sorted(((e.name, e.path, e, entry_is_dir(e)) for e in it),
+                                  key=operator.itemgetter(0))
+        except OSError as e:
+            yield child_prefix + f"Error accessing {path}: {e}"
+            continue
+        stack.append((iter(enumerate(children)), len(children), child_prefix, depth + 1))
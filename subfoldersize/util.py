@@ -0,0 +1,63 @@
+"""Helpers shared by the SubfolderSize modules."""
+
+import itertools
+import re
+
+_DIGITS = re.compile(r"(\d+)", re.ASCII)
+
+def format_size(size, decimal_places=2):
+    """Formats the size in bytes into a human-readable string."""
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1024.0:
+            return f"{size:.{decimal_places}f} {unit}"
+        size /= 1024.0
+    return f"{size:.{decimal_places}f} PB"
+
+def worker_count(workers, default):
+    """Returns workers, or default if it is None; raises ValueError if it is less than 1."""
+    if workers is None:
+        return default
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, not {workers}")
+    return workers
+
+def entry_is_dir(entry):
+    """Returns True if the DirEntry is a real directory (symlinks are not followed)."""
+    try:
+        return entry.is_dir(follow_symlinks=False)
+    except OSError:
+        return False
+
+def entry_size(entry):
+    """Returns the size of a DirEntry from its cached stat data, or 0 if it cannot be read."""
+    try:
+        return entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        return 0
+
+def allocated_size(st):
+    """
+    Returns the bytes allocated on disk for a stat result: 512-byte blocks
+    where the platform reports them, the apparent size elsewhere (Windows).
+    """
+    blocks = getattr(st, "st_blocks", None)
+    return st.st_size if blocks is None else blocks * 512
+
+# Digit runs are zero-padded to this width so they compare by value.
+NUMBER_WIDTH = 20
+
+def natural_keys(names):
+    """
+    Returns a sort key for each name that orders them case-insensitively, with
+    runs of digits compared by value, so "file2" sorts before "file10".
+    """
+    names = list(names)
+    if not names:
+        return []
+    parts = _DIGITS.split("\0".join(names).casefold())
+    parts[1::2] = map(str.zfill, parts[1::2], itertools.repeat(NUMBER_WIDTH))
+    return list(map("\0".join, zip("".join(parts).split("\0"), names)))
+
+def natural_key(name):
+    """natural_keys() for a single name."""
+    return natural_keys([name])[0]
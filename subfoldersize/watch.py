@@ -0,0 +1,199 @@
+"""Watching scanned folders and patching their sizes as they change."""
+
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+class _InotifyBackend:
+    """Linux inotify backend. Each watched directory gets its own watch descriptor."""
+    IN_MODIFY = 0x00000002
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_DONT_FOLLOW = 0x02000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                  | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}  # watch descriptor -> directory path
+        # Written to by wake() so a blocked read() returns immediately
+        self._wake_r, self._wake_w = os.pipe()
+
+    def watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            return False
+        self._paths[wd] = path
+        return True
+
+    def watch_count(self):
+        """Returns the number of live watches; the kernel drops those of removed directories."""
+        return len(self._paths)
+
+    def read(self, timeout):
+        """
+        Waits up to timeout seconds and returns the set of directories that saw
+        events, or None if the kernel queue overflowed and events were lost.
+        """
+        dirty = set()
+        if self.fd not in select.select([self.fd, self._wake_r], [], [], timeout)[0]:
+            return dirty
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return dirty
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            path = self._paths.get(wd)
+            if path is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self._paths[wd]
+            elif not mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                dirty.add(path)
+        return dirty
+
+    def wake(self):
+        os.write(self._wake_w, b"\0")
+
+    def close(self):
+        for fd in (self.fd, self._wake_r, self._wake_w):
+            os.close(fd)
+
+class _PollingBackend:
+    """
+    Portable fallback that polls directory mtimes. It notices entries being
+    added, removed or renamed, but not files changing size in place.
+    """
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self._mtimes = {}
+        self._last_poll = time.monotonic()
+        self._woken = threading.Event()
+
+    def watch(self, path):
+        try:
+            self._mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        return True
+
+    def watch_count(self):
+        return len(self._mtimes)
+
+    def read(self, timeout):
+        wait = self._last_poll + self.interval - time.monotonic()
+        if wait > 0:
+            if self._woken.wait(min(wait, timeout)) or wait > timeout:
+                return set()
+        self._last_poll = time.monotonic()
+        dirty = set()
+        for path, mtime_ns in list(self._mtimes.items()):
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                # Removed; the parent directory reports the removal.
+                del self._mtimes[path]
+                continue
+            if current != mtime_ns:
+                self._mtimes[path] = current
+                dirty.add(path)
+        return dirty
+
+    def wake(self):
+        self._woken.set()
+
+    def close(self):
+        pass
+
+class FolderWatcher:
+    """
+    Watches the folder behind a finished ScanEngine and passes debounced batches
+    of changes to ScanEngine.apply_changes(). on_changes(None) means events were
+    lost and the folder has to be scanned again.
+    """
+    def __init__(self, engine, on_changes, debounce=0.3, max_delay=2.0, cpu_share=0.25, max_watches=8192):
+        self.engine = engine
+        self.on_changes = on_changes
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.cpu_share = cpu_share
+        self.max_watches = max_watches
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            self.backend = _InotifyBackend() if sys.platform.startswith("linux") else _PollingBackend()
+        except OSError:
+            self.backend = _PollingBackend()
+
+    def _add_watches(self, paths):
+        for path in paths:
+            # Counted by the backend, so watches of removed directories
+            # (IN_IGNORED) go back to the budget.
+            if self.backend.watch_count() >= self.max_watches:
+                return
+            self.backend.watch(path)
+
+    def start(self):
+        # The root first, then directories in scan order, which is breadth-first
+        # enough that the watch budget covers the levels closest to the view.
+        self._add_watches([self.engine.root])
+        self._add_watches(self.engine.tree.descendants(self.engine.root))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.backend.wake()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.backend.close()
+
+    def _run(self):
+        pending = set()
+        first_event = last_event = 0.0
+        while not self._stop.is_set():
+            dirty = self.backend.read(self.debounce / 2 if pending else 0.5)
+            now = time.monotonic()
+            if dirty is None:
+                self.on_changes(None)
+                return
+            if dirty:
+                if not pending:
+                    first_event = now
+                pending |= dirty
+                last_event = now
+            if not pending or (now - last_event < self.debounce and now - first_event < self.max_delay):
+                continue
+            # Thread time, as the scan and UI threads share the process clock.
+            started = time.thread_time()
+            changed = self.engine.apply_changes(pending)
+            pending = set()
+            self._add_watches(self.engine.added_dirs)
+            if changed:
+                self.on_changes(changed)
+            busy = time.thread_time() - started
+            self._stop.wait(busy * (1 / self.cpu_share - 1))
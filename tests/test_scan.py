@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+
+import pytest
+
+from subfoldersize import ScanEngine, SizeTree
+from subfoldersize.scan import ScanCancelled
+
+def make_tree(root, dirs=4, depth=3, files=3):
+    """Creates dirs folders per level, depth levels deep, each with files files of distinct sizes."""
+    size = 1
+    pending = [(root, 0)]
+    while pending:
+        folder, level = pending.pop()
+        os.makedirs(folder, exist_ok=True)
+        for number in range(files):
+            with open(os.path.join(folder, f"f{number}"), "wb") as f:
+                f.write(b"x" * size)
+            size += 1
+        if level < depth:
+            pending.extend((os.path.join(folder, f"d{number}"), level + 1) for number in range(dirs))
+
+def fresh_scan(path):
+    return sorted(ScanEngine(tree=SizeTree()).scan(path))
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_overlapping_scans_share_the_tree_and_agree(tmp_path):
+    data = tmp_path / "data"
+    make_tree(str(data))
+    projects = str(data / "d1")
+    expected_data, expected_projects = fresh_scan(str(data)), fresh_scan(projects)
+
+    tree = SizeTree()
+    results = {}
+
+    def scan(path):
+        results[path] = sorted(ScanEngine(workers=4, tree=tree).scan(path))
+
+    threads = [threading.Thread(target=scan, args=(path,), daemon=True) for path in (str(data), projects)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results[str(data)] == expected_data
+    assert results[projects] == expected_projects
+    assert tree.get(projects).total_size == dict((name, size) for name, size, _ in expected_data)["d1"]
+    assert tree._claims == {}
+
+def test_cancelled_scan_releases_its_claims_to_a_waiting_scan(tmp_path):
+    root = str(tmp_path)
+    make_tree(root)
+    expected = fresh_scan(root)
+    tree = SizeTree()
+    first_done = threading.Event()
+    resume = threading.Event()
+
+    def on_entry(name, size, is_dir):
+        # Holds the only worker after the first folder, with the rest still
+        # claimed; files are reported before the walk starts.
+        if is_dir:
+            first_done.set()
+            resume.wait()
+
+    first = ScanEngine(workers=1, tree=tree)
+    outcome = []
+
+    def run_first():
+        try:
+            first.scan(root, on_entry)
+        except ScanCancelled:
+            outcome.append("cancelled")
+
+    first_thread = threading.Thread(target=run_first, daemon=True)
+    first_thread.start()
+    assert first_done.wait(10)
+
+    second = ScanEngine(workers=2, tree=tree)
+    second_results = []
+    second_thread = threading.Thread(target=lambda: second_results.extend(second.scan(root)), daemon=True)
+    second_thread.start()
+    # The second scan waits for the folders the first one claimed.
+    wait_until(lambda: any(tree._claims.values()))
+
+    first.cancel()
+    resume.set()
+    first_thread.join(10)
+    second_thread.join(10)
+
+    assert outcome == ["cancelled"]
+    assert sorted(second_results) == expected
+    assert tree._claims == {}
+
+def test_apply_changes_carries_a_delta_to_every_ancestor(tmp_path):
+    root = str(tmp_path)
+    make_tree(root, dirs=2, depth=3)
+    engine = ScanEngine(tree=SizeTree())
+    engine.scan(root)
+    deep = os.path.join(root, "d0", "d1", "d0")
+    chain = [root, os.path.join(root, "d0"), os.path.join(root, "d0", "d1"), deep]
+    before = {path: engine.tree.get(path).total_size for path in chain}
+
+    with open(os.path.join(deep, "f0"), "ab") as f:
+        f.write(b"y" * 1000)
+    new_dir = os.path.join(deep, "new")
+    os.mkdir(new_dir)
+    with open(os.path.join(new_dir, "g"), "wb") as f:
+        f.write(b"z" * 500)
+    changed = engine.apply_changes({deep})
+
+    for path in chain:
+        assert engine.tree.get(path).total_size == before[path] + 1500
+    assert engine.tree.get(new_dir).total_size == 500
+    assert changed == {"d0": (before[chain[1]] + 1500, True)}
+    assert sorted(engine.scan(root)) == fresh_scan(root)
+
+@pytest.mark.parametrize("removed", ["d1", os.path.join("d1", "d0")])
+def test_apply_changes_subtracts_a_removed_folder_from_every_ancestor(tmp_path, removed):
+    import shutil
+
+    root = str(tmp_path)
+    make_tree(root, dirs=2, depth=2)
+    engine = ScanEngine(tree=SizeTree())
+    engine.scan(root)
+    gone = os.path.join(root, removed)
+    parent = os.path.dirname(gone)
+    freed = engine.tree.get(gone).total_size
+    before = engine.tree.get(root).total_size
+
+    shutil.rmtree(gone)
+    engine.apply_changes({parent})
+
+    assert engine.tree.get(gone) is None
+    assert engine.tree.get(root).total_size == before - freed
+    assert sorted(engine.scan(root)) == fresh_scan(root)